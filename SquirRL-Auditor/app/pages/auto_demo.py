@@ -25,22 +25,22 @@ def theoretical_reward(alpha, gamma=0.5):
 
 
 def load_real_bitcoin_data():
-    """加载真实Bitcoin实验数据"""
-    csv_path = "./results/bitcoin_full_evaluation.csv"
-    if os.path.exists(csv_path):
-        df = pd.read_csv(csv_path)
-        return df
-    return None
+    """加载真实Bitcoin实验数据（结果库中的实验，没有时读取同名 CSV）"""
+    from src.agents.results_store import load_experiment
+    rows = load_experiment("bitcoin_full_evaluation")
+    return pd.DataFrame(rows) if rows else None
 
 
 def load_real_protocol_comparison():
     """加载真实三协议对比数据"""
+    from src.agents.results_store import load_experiment
     data = {}
     protocols = ['bitcoin', 'ghost', 'ethereum']
     for protocol in protocols:
-        csv_path = f"./results/{protocol}_full_evaluation.csv"
-        if os.path.exists(csv_path):
-            df = pd.read_csv(csv_path)
+        # 结果库只查询 α=0.35 的记录；读取 CSV 时再在下面筛选
+        rows = load_experiment(f"{protocol}_full_evaluation", alpha=0.35)
+        if rows:
+            df = pd.DataFrame(rows)
             # 获取α=0.35的数据
             match = df[abs(df['alpha'] - 0.35) < 0.01]
             if not match.empty:
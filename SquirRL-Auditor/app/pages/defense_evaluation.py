@@ -27,12 +27,10 @@ def theoretical_selfish_mining_reward(alpha, gamma):
 
 
 def load_real_utb_data():
-    """加载真实UTB防御实验数据"""
-    csv_path = "./results/utb_defense_evaluation.csv"
-    if os.path.exists(csv_path):
-        df = pd.read_csv(csv_path)
-        return df
-    return None
+    """加载真实UTB防御实验数据（结果库中的实验，没有时读取同名 CSV）"""
+    from src.agents.results_store import load_experiment
+    rows = load_experiment("utb_defense_evaluation")
+    return pd.DataFrame(rows) if rows else None
 
 def get_utb_reward_from_data(alpha, utb_ratio, df=None):
     """从真实数据中获取UTB防御后的奖励"""
@@ -21,11 +21,16 @@ GAMMA_DATA = {
 }
 
 def load_gamma_data():
-    """加载Gamma分析数据"""
-    csv_path = PROJECT_ROOT / "results" / "gamma_analysis_evaluation.csv"
-    if csv_path.exists():
+    """加载Gamma分析数据（结果库中的实验，没有时读取同名 CSV）"""
+    rows = []
+    try:
+        from src.agents.results_store import load_experiment
+        rows = load_experiment("gamma_analysis_evaluation")
+    except ImportError:
+        pass
+    if rows:
         try:
-            df = pd.read_csv(csv_path)
+            df = pd.DataFrame(rows)
             # 检查是否有有效数据
             if len(df) > 0 and 'gamma' in df.columns:
                 # 统一列名
@@ -198,7 +203,19 @@ def create_theoretical_comparison():
         return a * (1 - a) / denominator
     
     gamma_range = np.linspace(0, 1, 50)
-    theoretical = [theoretical_reward(alpha, g) for g in gamma_range]
+    
+    # 有 Bitcoin 最优策略图谱时使用精确解，否则使用闭式公式
+    try:
+        from src.environment.mdp_atlas import load_atlas
+        atlas = load_atlas('bitcoin')
+    except ImportError:
+        atlas = None
+    if atlas is not None:
+        theoretical = [atlas.revenue_at(alpha, g) for g in gamma_range]
+        theory_name = '精确最优 (MDP)'
+    else:
+        theoretical = [theoretical_reward(alpha, g) for g in gamma_range]
+        theory_name = '理论值'
     
     df = load_gamma_data()
     
@@ -209,7 +226,7 @@ def create_theoretical_comparison():
         x=gamma_range,
         y=theoretical,
         mode='lines',
-        name='理论值',
+        name=theory_name,
         line=dict(color='#22d3ee', width=2, dash='dash')
     ))
     
@@ -36,19 +36,51 @@ def ethereum_reward_estimate(alpha, gamma):
     return alpha + (bitcoin_reward - alpha) * eth_penalty
 
 
+REWARD_ESTIMATES = {
+    'bitcoin': theoretical_selfish_mining_reward,
+    'ghost': ghost_reward_estimate,
+    'ethereum': ethereum_reward_estimate,
+}
+
+
+@st.cache_resource
+def load_atlases():
+    """读取 `python -m src.cli atlas` 生成的精确最优策略图谱，未生成的协议为 None"""
+    try:
+        from src.environment.mdp_atlas import load_atlas
+    except ImportError:
+        return {protocol: None for protocol in REWARD_ESTIMATES}
+    return {protocol: load_atlas(protocol) for protocol in REWARD_ESTIMATES}
+
+
+def protocol_reward(protocol, alpha, gamma):
+    """协议的最优自私挖矿收益：优先使用精确图谱，没有图谱时退回闭式估计"""
+    atlas = load_atlases()[protocol]
+    if atlas is not None:
+        return atlas.revenue_at(alpha, gamma)
+    return REWARD_ESTIMATES[protocol](alpha, gamma)
+
+
+def reward_source_caption():
+    """当前曲线的数据来源说明"""
+    atlases = load_atlases()
+    exact = [p for p, a in atlases.items() if a is not None]
+    if len(exact) == len(atlases):
+        return "数据来源：精确 MDP 最优策略图谱"
+    if exact:
+        return f"数据来源：{', '.join(exact)} 为精确 MDP 图谱，其余为闭式估计（运行 python -m src.cli atlas 生成）"
+    return "数据来源：闭式估计（运行 python -m src.cli atlas --protocol <协议> 生成精确图谱）"
+
+
 def load_real_data():
-    """加载真实实验数据"""
-    import os
+    """加载真实实验数据（结果库中的实验，没有时读取同名 CSV）"""
+    from src.agents.results_store import load_experiment
     data = {}
     protocols = ['bitcoin', 'ghost', 'ethereum']
     
     for protocol in protocols:
-        csv_path = f"./results/{protocol}_full_evaluation.csv"
-        if os.path.exists(csv_path):
-            df = pd.read_csv(csv_path)
-            data[protocol] = df
-        else:
-            data[protocol] = None
+        rows = load_experiment(f"{protocol}_full_evaluation")
+        data[protocol] = pd.DataFrame(rows) if rows else None
     
     return data
 
@@ -59,9 +91,15 @@ def create_3d_surface(protocol_filter="all"):
     gamma_range = np.linspace(0.0, 1.0, 50)
     Alpha, Gamma = np.meshgrid(alpha_range, gamma_range)
     
-    Bitcoin_Z = np.vectorize(theoretical_selfish_mining_reward)(Alpha, Gamma)
-    GHOST_Z = np.vectorize(ghost_reward_estimate)(Alpha, Gamma)
-    ETH_Z = np.vectorize(ethereum_reward_estimate)(Alpha, Gamma)
+    def protocol_surface(protocol):
+        # 有图谱时直接使用图谱网格上的精确解
+        atlas = load_atlases()[protocol]
+        if atlas is not None:
+            alphas, gammas, z = atlas.surface()
+            a_grid, g_grid = np.meshgrid(alphas, gammas)
+            return a_grid, g_grid, z
+        return Alpha, Gamma, np.vectorize(REWARD_ESTIMATES[protocol])(Alpha, Gamma)
+    
     Honest_Z = Alpha
     
     fig = go.Figure()
@@ -77,15 +115,16 @@ def create_3d_surface(protocol_filter="all"):
     ))
     
     surfaces = {
-        'Bitcoin': (Bitcoin_Z, [[0, '#7c3aed'], [0.5, '#a855f7'], [1, '#c084fc']], 0.85),
-        'GHOST': (GHOST_Z, [[0, '#0284c7'], [0.5, '#0ea5e9'], [1, '#38bdf8']], 0.85),
-        'Ethereum': (ETH_Z, [[0, '#059669'], [0.5, '#10b981'], [1, '#34d399']], 0.85)
+        'Bitcoin': ('bitcoin', [[0, '#7c3aed'], [0.5, '#a855f7'], [1, '#c084fc']], 0.85),
+        'GHOST': ('ghost', [[0, '#0284c7'], [0.5, '#0ea5e9'], [1, '#38bdf8']], 0.85),
+        'Ethereum': ('ethereum', [[0, '#059669'], [0.5, '#10b981'], [1, '#34d399']], 0.85)
     }
     
-    for name, (z_data, colorscale, opacity) in surfaces.items():
+    for name, (protocol, colorscale, opacity) in surfaces.items():
         if protocol_filter == "all" or protocol_filter == name:
+            x_data, y_data, z_data = protocol_surface(protocol)
             fig.add_trace(go.Surface(
-                x=Alpha, y=Gamma, z=z_data,
+                x=x_data, y=y_data, z=z_data,
                 name=name,
                 colorscale=colorscale,
                 showscale=False,
@@ -132,9 +171,9 @@ def create_2d_comparison(gamma=0.5):
     """创建2D对比曲线"""
     alphas = np.linspace(0.1, 0.49, 100)
     
-    bitcoin_rewards = [theoretical_selfish_mining_reward(a, gamma) for a in alphas]
-    ghost_rewards = [ghost_reward_estimate(a, gamma) for a in alphas]
-    eth_rewards = [ethereum_reward_estimate(a, gamma) for a in alphas]
+    bitcoin_rewards = [protocol_reward('bitcoin', a, gamma) for a in alphas]
+    ghost_rewards = [protocol_reward('ghost', a, gamma) for a in alphas]
+    eth_rewards = [protocol_reward('ethereum', a, gamma) for a in alphas]
     
     fig = go.Figure()
     
@@ -262,6 +301,7 @@ def render():
         with col1:
             fig_3d = create_3d_surface(protocol_choice)
             st.plotly_chart(fig_3d, use_container_width=True)
+            st.caption(reward_source_caption())
     
     with tab2:
         st.markdown('<div class="section-title">📊 2D 对比曲线</div>', unsafe_allow_html=True)
@@ -297,6 +337,7 @@ def render():
         else:
             fig_2d = create_2d_comparison(gamma_val)
             st.plotly_chart(fig_2d, use_container_width=True)
+            st.caption(reward_source_caption())
         
         # 关键发现
         st.markdown('<div class="section-title">💡 关键发现</div>', unsafe_allow_html=True)
@@ -352,9 +393,9 @@ def render():
         
         data = []
         for a in alpha_values:
-            btc = theoretical_selfish_mining_reward(a, gamma_table)
-            ghost = ghost_reward_estimate(a, gamma_table)
-            eth = ethereum_reward_estimate(a, gamma_table)
+            btc = protocol_reward('bitcoin', a, gamma_table)
+            ghost = protocol_reward('ghost', a, gamma_table)
+            eth = protocol_reward('ethereum', a, gamma_table)
             data.append({
                 'α': f"{a:.0%}",
                 'Honest': f"{a:.4f}",
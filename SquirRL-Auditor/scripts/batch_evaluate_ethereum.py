@@ -4,45 +4,16 @@
 
 import os
 import sys
-import glob
-import re
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from src.agents.evaluate import evaluate_model, save_results
+from src.agents.model_registry import get_registry
 
 
 def find_ethereum_models(base_dir="./models"):
-    """查找所有训练好的 Ethereum 模型"""
-    models = []
-    
-    # 查找所有 final 模型
-    final_pattern = os.path.join(base_dir, "ethereum_alpha_*_final.zip")
-    final_models = glob.glob(final_pattern)
-    
-    for model_path in final_models:
-        match = re.search(r'alpha_([0-9.]+)_', model_path)
-        if match:
-            alpha = float(match.group(1))
-            models.append((alpha, model_path))
-    
-    # 也查找 best_model
-    best_pattern = os.path.join(base_dir, "best_ethereum_alpha_*", "best_model.zip")
-    best_models = glob.glob(best_pattern)
-    
-    for model_path in best_models:
-        match = re.search(r'alpha_([0-9.]+)_', model_path)
-        if match:
-            alpha = float(match.group(1))
-            # 如果已经有 final 模型，优先使用 best_model（通常更好）
-            existing = [i for i, (a, _) in enumerate(models) if a == alpha]
-            if existing:
-                # 替换为 best_model
-                models[existing[0]] = (alpha, model_path)
-            else:
-                models.append((alpha, model_path))
-    
-    return sorted(models, key=lambda x: x[0])
+    """查找所有训练好的 Ethereum 模型：每个 alpha 取索引中评估得分最高（没有得分时最新）的模型"""
+    return get_registry(base_dir).best_by_alpha("ethereum")
 
 
 def main():
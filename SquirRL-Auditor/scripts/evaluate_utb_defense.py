@@ -5,39 +5,24 @@
 
 import os
 import sys
-import glob
-import re
-import csv
 import matplotlib.pyplot as plt
 import numpy as np
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from src.agents.evaluate import evaluate_model
+from src.agents.evaluate import evaluate_model, paired_difference, save_results
+from src.agents.model_registry import get_registry
+
+
+# 所有 UTB 比率的模型重放同一组挖矿事件流，配对比较相对 UTB=0 的差异
+EVENT_SEED = 0
 
 
 def find_utb_models(base_dir="./models"):
-    """查找所有 UTB 模型"""
-    models = []
-    
-    # 查找 best_utb_* 模型
-    pattern = os.path.join(base_dir, "best_utb_*", "best_model.zip")
-    model_paths = glob.glob(pattern)
-    
-    for model_path in model_paths:
-        # 从目录名提取参数
-        dir_name = os.path.basename(os.path.dirname(model_path))
-        # 格式: best_utb_alpha_0.35_ratio_0.50_YYYYMMDD_HHMMSS
-        
-        alpha_match = re.search(r'alpha_([0-9.]+)', dir_name)
-        ratio_match = re.search(r'ratio_([0-9.]+)', dir_name)
-        
-        if alpha_match and ratio_match:
-            alpha = float(alpha_match.group(1))
-            utb_ratio = float(ratio_match.group(1))
-            models.append((alpha, utb_ratio, model_path))
-    
-    return sorted(models, key=lambda x: (x[0], x[1]))
+    """查找所有 UTB 模型：每组 (alpha, UTB 比率) 取索引中最好的模型"""
+    registry = get_registry(base_dir)
+    pairs = sorted({(e['alpha'], e['utb_ratio']) for e in registry.query('utb') if e['utb_ratio'] is not None})
+    return [(alpha, utb_ratio, registry.best('utb', alpha, utb_ratio=utb_ratio)) for alpha, utb_ratio in pairs]
 
 
 def evaluate_utb_defense():
@@ -74,6 +59,7 @@ def evaluate_utb_defense():
                 gamma=0.5,
                 utb_ratio=utb_ratio,
                 n_episodes=50,
+                event_seed=EVENT_SEED,
                 verbose=1
             )
             result['utb_ratio'] = utb_ratio
@@ -89,49 +75,31 @@ def evaluate_utb_defense():
         print("\n❌ 没有成功评估的模型！")
         return
     
-    # 保存结果到 CSV
+    # 保存结果（追加到结果库并导出 CSV 快照）
     output_csv = "./results/utb_defense_evaluation.csv"
-    os.makedirs("./results", exist_ok=True)
-    
-    with open(output_csv, 'w', newline='') as f:
-        fieldnames = ['protocol', 'alpha', 'gamma', 'utb_ratio', 'n_episodes',
-                      'mean_reward', 'std_reward', 'mean_reward_fraction', 
-                      'std_reward_fraction', 'honest_baseline', 'relative_gain', 'excess_reward']
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-        
-        for r in results:
-            writer.writerow({
-                'protocol': r['protocol'],
-                'alpha': r['alpha'],
-                'gamma': r['gamma'],
-                'utb_ratio': r['utb_ratio'],
-                'n_episodes': r['n_episodes'],
-                'mean_reward': r['mean_reward'],
-                'std_reward': r['std_reward'],
-                'mean_reward_fraction': r['mean_reward_fraction'],
-                'std_reward_fraction': r['std_reward_fraction'],
-                'honest_baseline': r['honest_baseline'],
-                'relative_gain': r['relative_gain'],
-                'excess_reward': r['excess_reward']
-            })
-    
-    print(f"\n结果已保存到: {output_csv}")
+    save_results(results, output_csv)
     
     # 打印摘要
     print("\n" + "="*60)
     print("📊 UTB 防御效果摘要")
     print("="*60)
-    print(f"\n{'UTB比率':<10} {'相对奖励':<12} {'超额收益':<12} {'防御效果':<12}")
-    print("-" * 50)
+    print(f"\n{'UTB比率':<10} {'相对奖励':<12} {'超额收益':<12} {'相对 UTB=0 的配对差':<24}")
+    print("-" * 62)
     
     for r in results:
         utb_ratio = r['utb_ratio']
         reward = r['mean_reward_fraction']
         excess = r['excess_reward']
-        print(f"{utb_ratio:<10.2f} {reward:<12.4f} {excess:+12.4f}")
-    
-    print("-" * 50)
+        # 公共随机数下与同一 alpha、UTB=0 的模型逐 episode 配对
+        baseline = next((b for b in results if b['alpha'] == r['alpha'] and b['utb_ratio'] == 0), None)
+        if baseline is not None:
+            d = paired_difference(baseline, r)
+            paired = f"{d['mean_difference']:+.4f} ± {d['ci_halfwidth']:.4f}"
+        else:
+            paired = "-"
+        print(f"{utb_ratio:<10.2f} {reward:<12.4f} {excess:+12.4f} {paired:>24}")
+    
+    print("-" * 62)
     
     # 生成可视化
     plot_utb_defense(results)
@@ -4,23 +4,20 @@
 
 import os
 import sys
-import csv
 import numpy as np
 import matplotlib.pyplot as plt
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from src.agents.results_store import load_experiment
+
 
 def load_results(csv_path):
-    """从 CSV 加载评估结果"""
-    results = []
-    with open(csv_path, 'r') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            row['alpha'] = float(row['alpha'])
-            row['relative_gain'] = float(row.get('relative_gain', row.get('mean_reward_fraction', 0)))
-            row['std_reward_fraction'] = float(row.get('std_reward_fraction', 0))
-            results.append(row)
+    """加载评估结果：优先从结果库中查询同名实验，没有时读取 CSV"""
+    results = load_experiment(csv_path)
+    for row in results:
+        row['relative_gain'] = float(row.get('relative_gain') or row.get('mean_reward_fraction') or 0)
+        row['std_reward_fraction'] = float(row.get('std_reward_fraction') or 0)
     return sorted(results, key=lambda x: x['alpha'])
 
 
@@ -127,16 +124,16 @@ def main():
     ghost_csv = "./results/ghost_full_evaluation.csv"
     ethereum_csv = "./results/ethereum_full_evaluation.csv"
     
-    # 检查文件是否存在
-    if not os.path.exists(bitcoin_csv):
+    # 检查评估结果是否存在
+    if not load_results(bitcoin_csv):
         print(f"❌ 未找到 Bitcoin 评估结果: {bitcoin_csv}")
         return
     
-    if not os.path.exists(ghost_csv):
+    if not load_results(ghost_csv):
         print(f"❌ 未找到 GHOST 评估结果: {ghost_csv}")
         return
     
-    if not os.path.exists(ethereum_csv):
+    if not load_results(ethereum_csv):
         print(f"❌ 未找到 Ethereum 评估结果: {ethereum_csv}")
         print("请先运行: python scripts/batch_evaluate_ethereum.py")
         return
@@ -0,0 +1,154 @@
+"""
+评估结果的磁盘缓存
+
+重新生成图表时，批量评估脚本会对没有变化的模型重复运行 evaluate_model。
+本模块把评估结果按内容寻址地缓存到项目目录下的 cache/eval 中：缓存键由模型文件内容的哈希、
+协议、alpha、gamma、其余环境参数、episode 数、单 episode 步数上限、是否确定性策略和随机种子决定。
+模型重新训练后文件内容变化，对应条目自然失效；新增一个模型只需要评估这一个模型。
+
+只有指定了种子的评估才使用缓存；没有种子时每次都重新采样，不读也不写缓存。
+设置环境变量 BLOCKRL_EVAL_CACHE=off 可以关闭缓存，设置为目录路径可以改变缓存位置。
+"""
+
+import os
+import json
+import hashlib
+
+import numpy as np
+
+from src.agents.numpy_policy import zip_path_for
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+DEFAULT_CACHE_DIR = os.path.join(PROJECT_ROOT, 'cache', 'eval')
+
+# 缓存格式版本，评估流程或结果字段变化时递增，使旧条目自然失效
+CACHE_VERSION = 2
+
+# (绝对路径, 修改时间, 大小) -> 内容哈希，同一进程内不重复读取未变化的模型文件
+_digests = {}
+
+
+def model_digest(model_path):
+    """模型文件内容的 sha1"""
+    path = os.path.abspath(model_path if model_path.endswith('.npz') else zip_path_for(model_path))
+    st = os.stat(path)
+    key = (path, st.st_mtime, st.st_size)
+    if key not in _digests:
+        h = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+        _digests[key] = h.hexdigest()
+    return _digests[key]
+
+
+def make_config(model_path, protocol, alpha, gamma, n_episodes, max_steps_per_episode, deterministic, seed,
+                env_kwargs=None, target_ci=None, confidence=0.95, ci_batch_size=10, event_seed=None):
+    """
+    缓存键配置（序贯评估参数只在 target_ci 不为 None 时计入，公共随机数种子只在不为 None 时计入）
+
+    返回：
+        config (dict): 可 JSON 序列化的配置
+    """
+    config = {
+        'model': model_digest(model_path),
+        'protocol': protocol.lower(),
+        'alpha': round(float(alpha), 9),
+        'gamma': round(float(gamma), 9),
+        'env_kwargs': {k: (round(float(v), 9) if isinstance(v, (float, np.floating)) else v)
+                       for k, v in sorted((env_kwargs or {}).items())},
+        'n_episodes': int(n_episodes),
+        'max_steps_per_episode': int(max_steps_per_episode),
+        'deterministic': bool(deterministic),
+        'seed': None if seed is None else int(seed),
+    }
+    if target_ci is not None:
+        config['sequential'] = {'target_ci': float(target_ci), 'confidence': float(confidence),
+                                'batch_size': int(ci_batch_size)}
+    if event_seed is not None:
+        config['event_seed'] = int(event_seed)
+    return config
+
+
+def config_digest(config):
+    """配置的内容地址（sha1）"""
+    payload = json.dumps(dict(config, version=CACHE_VERSION), sort_keys=True)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def _to_json(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, dict):
+        return {str(k): _to_json(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [_to_json(v) for v in value]
+    return value
+
+
+class EvalCache:
+    """
+    内容寻址的评估结果缓存，每个配置对应一个 <digest>.json
+
+    参数：
+        root (str): 缓存目录
+    """
+
+    def __init__(self, root=DEFAULT_CACHE_DIR):
+        self.root = root
+
+    def _path(self, config):
+        return os.path.join(self.root, f"{config_digest(config)}.json")
+
+    def load(self, config):
+        """返回缓存的评估结果，未命中时返回 None"""
+        path = self._path(config)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                results = json.load(f)
+        except (OSError, ValueError):
+            # 损坏的条目（例如写入时进程被中断）直接丢弃
+            os.remove(path)
+            return None
+        results['action_distribution'] = {int(k): v for k, v in results['action_distribution'].items()}
+        return results
+
+    def save(self, config, results):
+        os.makedirs(self.root, exist_ok=True)
+        path = self._path(config)
+        # 先写临时文件再原子替换，避免并发读到半个文件
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(_to_json(results), f)
+        os.replace(tmp_path, path)
+
+    def clear(self):
+        """删除全部缓存条目"""
+        if not os.path.isdir(self.root):
+            return
+        for name in os.listdir(self.root):
+            if name.endswith('.json'):
+                os.remove(os.path.join(self.root, name))
+
+    def __len__(self):
+        if not os.path.isdir(self.root):
+            return 0
+        return sum(1 for name in os.listdir(self.root) if name.endswith('.json'))
+
+
+_default_cache = None
+
+
+def get_default_eval_cache():
+    """
+    项目默认缓存，环境变量 BLOCKRL_EVAL_CACHE=off 时返回 None
+    """
+    global _default_cache
+    root = os.environ.get('BLOCKRL_EVAL_CACHE', DEFAULT_CACHE_DIR)
+    if root.lower() in ('off', '0', 'false', 'none', ''):
+        return None
+    if _default_cache is None or _default_cache.root != root:
+        _default_cache = EvalCache(root)
+    return _default_cache
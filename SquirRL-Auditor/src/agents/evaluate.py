@@ -11,8 +11,226 @@ from collections import defaultdict
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../..'))
 
-from stable_baselines3 import DQN
-from src.environment.gym_wrapper import make_env
+from src.environment.gym_wrapper import make_env, attach_obs_buffer
+from src.environment.base_env import set_event_stream, settled_rewards
+from src.agents.model_cache import load_model
+
+
+def confidence_halfwidth(samples, confidence=0.95):
+    """
+    样本均值的 t 置信区间半宽
+
+    参数：
+        samples (list): 样本
+        confidence (float): 置信水平
+
+    返回：
+        halfwidth (float): 半宽，样本少于 2 个时为 inf
+    """
+    n = len(samples)
+    if n < 2:
+        return np.inf
+    from scipy import stats
+    return float(stats.t.ppf((1 + confidence) / 2, n - 1) * np.std(samples, ddof=1) / np.sqrt(n))
+
+
+def ratio_estimate(numerators, denominators, confidence=0.95):
+    """
+    比值估计 R = ΣA / ΣT 及其 t 置信区间半宽（delta 方法）
+
+    再生周期和批均值都用它：每个周期 / 批次贡献一对 (攻击者区块数 A_i, 总区块数 T_i)，
+    方差由残差 A_i - R·T_i 估计。
+
+    参数：
+        numerators, denominators (list): 每个周期 / 批次的 A_i 和 T_i
+        confidence (float): 置信水平
+
+    返回：
+        estimate (float): 比值估计，总区块数为 0 时为 nan
+        halfwidth (float): 置信区间半宽，少于 2 个样本时为 inf
+    """
+    a = np.asarray(numerators, dtype=np.float64)
+    t = np.asarray(denominators, dtype=np.float64)
+    if len(t) == 0 or t.sum() == 0:
+        return np.nan, np.inf
+    estimate = a.sum() / t.sum()
+    # 残差均值为 0，其 t 半宽除以平均周期区块数即为比值的半宽
+    return float(estimate), confidence_halfwidth(a - estimate * t, confidence) / t.mean()
+
+
+def evaluate_steady_state(
+    model_path,
+    protocol="bitcoin",
+    alpha=0.35,
+    gamma=0.5,
+    method="regenerative",
+    target_ci=0.002,
+    confidence=0.95,
+    n_chains=4,
+    max_steps=1000000,
+    check_every=10000,
+    batch_steps=10000,
+    min_units=20,
+    deterministic=True,
+    seed=None,
+    use_cache=True,
+    verbose=1,
+    **env_kwargs
+):
+    """
+    长链稳态评估：不做 episode 重置，直接估计策略的稳态相对奖励
+
+    evaluate_model 的每个 episode 都从 (0, 0) 状态开始，较短的 episode 会把启动阶段的瞬态计入相对奖励。
+    这里让 n_chains 条链并行地一直运行（每一步把所有链的观察拼成一批交给策略），并按以下方法之一估计：
+        - regenerative：链每次回到初始状态 (0, 0, normal) 时切分出一个再生周期，各周期独立同分布；
+        - batch_means：把每条链按 batch_steps 步切成批次，批次足够长时近似独立。
+    两种方法都用比值估计 ΣA / ΣT（见 ratio_estimate），每 check_every 步检查一次置信区间，
+    半宽不超过 target_ci 时停止，max_steps 作为每条链的步数上限。
+    底层环境累计满 100 万步后返回的 done 标志只表示"应当重置"，稳态评估忽略它。
+
+    参数：
+        model_path (str): 模型路径（SB3 .zip 或导出的 .npz）
+        protocol (str): 协议类型
+        alpha (float): 攻击者算力占比
+        gamma (float): 跟随者比例
+        method (str): 'regenerative' 或 'batch_means'
+        target_ci (float): 相对奖励置信区间的目标半宽，None 时运行满 max_steps 步
+        confidence (float): 置信水平
+        n_chains (int): 并行的链数
+        max_steps (int): 每条链的最大步数
+        check_every (int): 每条链每隔多少步检查一次精度
+        batch_steps (int): 批均值法每个批次的步数
+        min_units (int): 停止前至少需要的周期 / 批次数
+        deterministic (bool): 是否使用确定性策略
+        seed (int): 随机种子，None 时不设置
+        use_cache (bool): 是否使用评估结果缓存（seed 为 None 时不使用）
+        verbose (int): 详细程度
+
+    返回：
+        results (dict): 评估结果，字段与 evaluate_model 的汇总统计一致（没有逐 episode 数据），
+                        另有 method、n_chains、n_steps、n_units、mean_unit_length
+    """
+    if method not in ("regenerative", "batch_means"):
+        raise ValueError(f"Unknown method: {method}. Supported: regenerative, batch_means")
+
+    from src.agents.eval_cache import get_default_eval_cache, make_config
+    # 不设种子时每次评估都应重新采样，不读也不写缓存
+    cache = get_default_eval_cache() if use_cache and seed is not None else None
+    if cache is not None:
+        cache_config = make_config(model_path, protocol, alpha, gamma, n_chains, max_steps, deterministic, seed,
+                                   env_kwargs)
+        cache_config['steady_state'] = {
+            'method': method, 'target_ci': target_ci, 'confidence': float(confidence),
+            'check_every': int(check_every), 'batch_steps': int(batch_steps), 'min_units': int(min_units),
+        }
+        cached = cache.load(cache_config)
+        if cached is not None:
+            if verbose:
+                print(f"使用缓存的稳态评估结果: {model_path} (α={alpha}, γ={gamma}, {method})")
+            cached['model_path'] = str(model_path)
+            return cached
+
+    if verbose:
+        print(f"加载模型: {model_path}")
+    model = load_model(model_path)
+
+    envs = [make_env(protocol=protocol, alpha=alpha, gamma=gamma, **dict({'info_level': 'none'}, **env_kwargs))
+            for _ in range(n_chains)]
+    # 所有链的观察直接写入同一个批量缓冲区的各行，每步整批交给策略
+    space = envs[0].observation_space
+    batch = np.zeros((n_chains,) + space.shape, dtype=space.dtype)
+    for i, env in enumerate(envs):
+        env.obs_buffer = batch[i, ...]
+    if seed is not None:
+        np.random.seed(seed)
+    for i, env in enumerate(envs):
+        env.reset(seed=seed if i == 0 else None)
+    sims = [env.env for env in envs]
+    # 复位后的状态就是再生状态 (0, 0, normal)
+    start_states = [sim._current_state for sim in sims]
+
+    # 每条链当前未结束的周期 / 批次：起点处的累计区块数和步数
+    marks = [(*settled_rewards(sim), 0) for sim in sims]
+    unit_attacker, unit_total, unit_steps = [], [], []
+    action_counts = np.zeros(envs[0].action_space.n, dtype=np.int64)
+
+    if verbose:
+        target = f"目标 {confidence:.0%} 置信区间半宽 {target_ci}" if target_ci is not None else "不设精度目标"
+        print(f"\n开始稳态评估 ({method}, {n_chains} 条链, {target}, 每条链最多 {max_steps} 步)...")
+        print(f"  协议: {protocol}")
+        print(f"  α: {alpha}")
+        print(f"  γ: {gamma}")
+        if 'utb_ratio' in env_kwargs:
+            print(f"  UTB 比率: {env_kwargs['utb_ratio']}")
+
+    estimate, halfwidth = np.nan, np.inf
+    for step in range(1, max_steps + 1):
+        actions, _ = model.predict(batch, deterministic=deterministic)
+        actions = np.asarray(actions).reshape(-1)
+        action_counts += np.bincount(actions, minlength=len(action_counts))
+
+        for i, (env, sim) in enumerate(zip(envs, sims)):
+            env.step(actions[i])
+            if method == "regenerative":
+                closed = sim._current_state == start_states[i]
+            else:
+                closed = step % batch_steps == 0
+            if closed:
+                attacker, honest = settled_rewards(sim)
+                a0, h0, s0 = marks[i]
+                unit_attacker.append(attacker - a0)
+                unit_total.append(attacker - a0 + honest - h0)
+                unit_steps.append(step - s0)
+                marks[i] = (attacker, honest, step)
+
+        if step % check_every == 0 or step == max_steps:
+            estimate, halfwidth = ratio_estimate(unit_attacker, unit_total, confidence)
+            if verbose:
+                print(f"  {step} 步/链: {len(unit_total)} 个{'周期' if method == 'regenerative' else '批次'}, "
+                      f"reward_fraction={estimate:.4f} ± {halfwidth:.4f}")
+            if target_ci is not None and len(unit_total) >= min_units and halfwidth <= target_ci:
+                if verbose:
+                    print(f"  置信区间半宽 {halfwidth:.4f} <= {target_ci}，停止")
+                break
+
+    results = {
+        'protocol': protocol,
+        'alpha': alpha,
+        'gamma': gamma,
+        'method': method,
+        'n_chains': n_chains,
+        'n_steps': step * n_chains,
+        'n_units': len(unit_total),
+        'mean_unit_length': float(np.mean(unit_steps)) if unit_steps else np.nan,
+        'action_distribution': {a: int(c) for a, c in enumerate(action_counts) if c},
+        'mean_reward_fraction': estimate,
+        'ci_halfwidth': halfwidth,
+        'confidence': confidence,
+        'target_ci': target_ci,
+        'honest_baseline': alpha,
+        'relative_gain': estimate,
+        'excess_reward': estimate - alpha,
+        # 评估设置，写入结果库时作为检索键
+        'model_path': str(model_path),
+        'deterministic': deterministic,
+        'seed': seed,
+        'env_kwargs': dict(env_kwargs)
+    }
+
+    if verbose:
+        print(f"\n稳态评估结果:")
+        print(f"  相对奖励 (reward_fraction): {estimate:.4f}")
+        print(f"  {confidence:.0%} 置信区间半宽: {halfwidth:.4f} "
+              f"({results['n_units']} 个{'周期' if method == 'regenerative' else '批次'}, "
+              f"平均 {results['mean_unit_length']:.1f} 步, 共 {results['n_steps']} 步)")
+        print(f"  诚实挖矿基准 (alpha): {alpha:.4f}")
+        print(f"  超额收益: {results['excess_reward']:.4f}")
+        print(f"  动作分布: {results['action_distribution']}")
+
+    if cache is not None:
+        cache.save(cache_config, results)
+
+    return results
 
 
 def evaluate_model(
@@ -23,33 +241,73 @@ def evaluate_model(
     n_episodes=100,
     max_steps_per_episode=10000,
     deterministic=True,
+    seed=None,
+    use_cache=True,
+    target_ci=None,
+    confidence=0.95,
+    ci_batch_size=10,
+    event_seed=None,
     verbose=1,
     **env_kwargs
 ):
     """
     评估训练好的模型
     
+    给出 target_ci 时进入序贯模式：每 ci_batch_size 个 episode 检查一次相对奖励均值的置信区间，
+    半宽不超过 target_ci 时提前停止，n_episodes 作为 episode 数上限。
+    结果中的 ci_halfwidth 是实际达到的精度，n_episodes 是实际运行的 episode 数。
+    
+    给出 event_seed 时使用公共随机数：第 i 个 episode 的挖矿事件取自以 (event_seed, i) 为种子预先生成的
+    均匀随机数流，用同一个 event_seed 评估的不同模型面对相同的事件序列，见 evaluate_paired
+    
     参数：
-        model_path (str): 模型路径
+        model_path (str): 模型路径（SB3 .zip 或导出的 .npz）
         protocol (str): 协议类型
         alpha (float): 攻击者算力占比
         gamma (float): 跟随者比例
         n_episodes (int): 评估的episode数量
         max_steps_per_episode (int): 每个episode的最大步数
         deterministic (bool): 是否使用确定性策略
+        seed (int): 随机种子，None 时不设置
+        use_cache (bool): 是否使用评估结果缓存（模型和参数都没变时直接返回上次的结果；seed 为 None 时不使用）
+        target_ci (float): 相对奖励置信区间的目标半宽，None 时固定运行 n_episodes 个 episode
+        confidence (float): 置信水平
+        ci_batch_size (int): 序贯模式下每批的 episode 数
+        event_seed (int): 公共随机数的种子，None 时挖矿事件直接使用 np.random
         verbose (int): 详细程度
     
     返回：
         results (dict): 评估结果
     """
     
-    # 加载模型
+    # 模型文件内容和评估参数都没变时，直接返回缓存的结果
+    from src.agents.eval_cache import get_default_eval_cache, make_config
+    # 不设种子时每次评估都应重新采样，不读也不写缓存
+    cache = get_default_eval_cache() if use_cache and seed is not None else None
+    if cache is not None:
+        cache_config = make_config(model_path, protocol, alpha, gamma, n_episodes, max_steps_per_episode,
+                                   deterministic, seed, env_kwargs, target_ci, confidence, ci_batch_size,
+                                   event_seed)
+        cached = cache.load(cache_config)
+        if cached is not None:
+            if verbose:
+                print(f"使用缓存的评估结果: {model_path} (α={alpha}, γ={gamma}, {n_episodes} episodes)")
+            cached['model_path'] = str(model_path)
+            return cached
+    
+    # 加载模型：有导出的 .npz 时使用纯 NumPy 推理，不需要 torch；
+    # 同一进程内重复评估同一模型时直接使用缓存
     if verbose:
         print(f"加载模型: {model_path}")
-    model = DQN.load(model_path)
+    model = load_model(model_path)
     
-    # 创建环境
-    env = make_env(protocol=protocol, alpha=alpha, gamma=gamma, **env_kwargs)
+    # 创建环境：相对奖励在 episode 结束时直接从底层环境读取，每步不需要构造 info；
+    # 观察只在下一步之前使用，写入环境自己的缓冲区
+    env = attach_obs_buffer(make_env(protocol=protocol, alpha=alpha, gamma=gamma,
+                                     **dict({'info_level': 'none'}, **env_kwargs)))
+    if seed is not None:
+        # 非确定性策略的 epsilon-贪心也使用全局随机数
+        np.random.seed(seed)
     
     # 评估指标
     episode_rewards = []
@@ -58,7 +316,11 @@ def evaluate_model(
     action_counts = defaultdict(int)
     
     if verbose:
-        print(f"\n开始评估 ({n_episodes} episodes)...")
+        if target_ci is not None:
+            print(f"\n开始序贯评估 (目标 {confidence:.0%} 置信区间半宽 {target_ci}, "
+                  f"每批 {ci_batch_size} episodes, 最多 {n_episodes} episodes)...")
+        else:
+            print(f"\n开始评估 ({n_episodes} episodes)...")
         print(f"  协议: {protocol}")
         print(f"  α: {alpha}")
         print(f"  γ: {gamma}")
@@ -66,7 +328,11 @@ def evaluate_model(
             print(f"  UTB 比率: {env_kwargs['utb_ratio']}")
     
     for episode in range(n_episodes):
-        state, info = env.reset()
+        # 只在第一个 episode 设置种子，之后的 episode 继续同一个随机序列
+        state, info = env.reset(seed=seed if episode == 0 else None)
+        if event_seed is not None:
+            # 每个 episode 的事件流只由 (event_seed, episode) 决定，与模型和之前的 episode 无关
+            set_event_stream(env.env, np.random.default_rng([event_seed, episode]).random(max_steps_per_episode))
         episode_reward = 0
         episode_length = 0
         
@@ -104,13 +370,21 @@ def evaluate_model(
         if verbose and (episode + 1) % 10 == 0:
             print(f"  Episode {episode + 1}/{n_episodes}: "
                   f"reward_fraction={reward_fraction:.4f}, length={episode_length}")
+        
+        # 序贯模式：每批结束时检查置信区间是否已足够窄
+        if target_ci is not None and (episode + 1) % ci_batch_size == 0:
+            halfwidth = confidence_halfwidth(episode_reward_fractions, confidence)
+            if halfwidth <= target_ci:
+                if verbose:
+                    print(f"  {episode + 1} 个 episode 后置信区间半宽 {halfwidth:.4f} <= {target_ci}，提前停止")
+                break
     
     # 计算统计数据
     results = {
         'protocol': protocol,
         'alpha': alpha,
         'gamma': gamma,
-        'n_episodes': n_episodes,
+        'n_episodes': len(episode_rewards),
         'mean_reward': np.mean(episode_rewards),
         'std_reward': np.std(episode_rewards),
         'min_reward': np.min(episode_rewards),
@@ -123,7 +397,18 @@ def evaluate_model(
         # 新增：真正的相对奖励统计（这是论文中的定义！）
         'mean_reward_fraction': np.mean(episode_reward_fractions),
         'std_reward_fraction': np.std(episode_reward_fractions),
-        'episode_reward_fractions': episode_reward_fractions
+        'episode_reward_fractions': episode_reward_fractions,
+        # 相对奖励均值的置信区间半宽（实际达到的精度）
+        'ci_halfwidth': confidence_halfwidth(episode_reward_fractions, confidence),
+        'confidence': confidence,
+        'target_ci': target_ci,
+        # 评估设置，写入结果库时作为检索键
+        'model_path': str(model_path),
+        'deterministic': deterministic,
+        'max_steps_per_episode': max_steps_per_episode,
+        'seed': seed,
+        'event_seed': event_seed,
+        'env_kwargs': dict(env_kwargs)
     }
     
     # 诚实挖矿的期望奖励比例 = alpha
@@ -137,21 +422,89 @@ def evaluate_model(
     if verbose:
         print(f"\n评估结果:")
         print(f"  相对奖励 (reward_fraction): {results['mean_reward_fraction']:.4f} ± {results['std_reward_fraction']:.4f}")
+        print(f"  {confidence:.0%} 置信区间半宽: {results['ci_halfwidth']:.4f} ({results['n_episodes']} episodes)")
         print(f"  诚实挖矿基准 (alpha): {alpha:.4f}")
         print(f"  超额收益: {results['excess_reward']:.4f}")
         print(f"  平均episode长度: {results['mean_length']:.1f} ± {results['std_length']:.1f}")
         print(f"  动作分布: {results['action_distribution']}")
     
+    if cache is not None:
+        cache.save(cache_config, results)
+    
     return results
 
 
+def paired_difference(baseline, results, confidence=0.95):
+    """
+    两次公共随机数评估的相对奖励配对差 results - baseline
+    
+    参数：
+        baseline, results (dict): 用同一个 event_seed 评估的结果
+        confidence (float): 置信水平
+    
+    返回：
+        difference (dict): mean_difference、配对置信区间半宽 ci_halfwidth，
+                           以及把两次评估当作独立样本时的半宽 unpaired_ci_halfwidth（用于比较方差缩减）
+    """
+    if baseline.get('event_seed') is None or baseline.get('event_seed') != results.get('event_seed'):
+        raise ValueError("配对比较要求两次评估使用相同的 event_seed")
+    n = min(len(baseline['episode_reward_fractions']), len(results['episode_reward_fractions']))
+    a = np.asarray(baseline['episode_reward_fractions'][:n], dtype=np.float64)
+    b = np.asarray(results['episode_reward_fractions'][:n], dtype=np.float64)
+    return {
+        'n_episodes': n,
+        'mean_difference': float(np.mean(b - a)),
+        'std_difference': float(np.std(b - a, ddof=1)) if n > 1 else np.nan,
+        'ci_halfwidth': confidence_halfwidth(b - a, confidence),
+        'unpaired_ci_halfwidth': float(np.hypot(confidence_halfwidth(a, confidence),
+                                                confidence_halfwidth(b, confidence))),
+    }
+
+
+def evaluate_paired(models, baseline=0, event_seed=0, n_episodes=50, confidence=0.95, verbose=1, **kwargs):
+    """
+    用公共随机数评估一组模型，并报告每个模型相对基准模型的配对差
+    
+    所有模型的第 i 个 episode 都重放同一段挖矿事件流，episode 之间的随机波动在配对差中相互抵消，
+    分辨同样大小的差异所需的 episode 数比独立评估少得多。
+    
+    参数：
+        models (list): 每个模型的 evaluate_model 参数字典（至少包含 model_path，可以有各自的 alpha、gamma、utb_ratio 等）
+        baseline (int): 基准模型在 models 中的下标
+        event_seed (int): 公共随机数的种子
+        n_episodes (int): 每个模型的 episode 数
+        confidence (float): 置信水平
+        kwargs: 其余传给 evaluate_model 的公共参数
+    
+    返回：
+        all_results (list): 每个模型的评估结果
+        differences (list): 每个模型相对基准的配对差（基准自身为 0）
+    """
+    all_results = [
+        evaluate_model(**dict(kwargs, **model), n_episodes=n_episodes, event_seed=event_seed, verbose=verbose)
+        for model in models
+    ]
+    differences = [paired_difference(all_results[baseline], r, confidence) for r in all_results]
+    
+    if verbose:
+        print(f"\n配对比较 (基准: {models[baseline]['model_path']}, {n_episodes} episodes):")
+        for model, d in zip(models, differences):
+            print(f"  {model['model_path']}: 差值 {d['mean_difference']:+.4f} ± {d['ci_halfwidth']:.4f} "
+                  f"(独立评估 ± {d['unpaired_ci_halfwidth']:.4f})")
+    return all_results, differences
+
+
 def evaluate_multiple_alphas(
     model_dir,
     alphas=[0.25, 0.30, 0.35, 0.40, 0.45],
     protocol="bitcoin",
     gamma=0.5,
     n_episodes=100,
-    verbose=1
+    seed=None,
+    use_cache=True,
+    target_ci=None,
+    verbose=1,
+    **env_kwargs
 ):
     """
     评估多个alpha值对应的模型
@@ -163,24 +516,24 @@ def evaluate_multiple_alphas(
         protocol (str): 协议类型
         gamma (float): 跟随者比例
         n_episodes (int): 每个模型评估的episode数量
+        seed (int): 随机种子
+        use_cache (bool): 是否使用评估结果缓存（seed 为 None 时不使用）
+        target_ci (float): 序贯评估的置信区间目标半宽，None 时固定运行 n_episodes 个 episode
         verbose (int): 详细程度
+        **env_kwargs: 传给 evaluate_model 的环境参数（如 encoding、utb_ratio）
     
     返回：
         all_results (list): 所有评估结果
     """
     
+    from src.agents.model_registry import get_registry
+
+    registry = get_registry(model_dir)
     all_results = []
     
     for alpha in alphas:
-        # 查找对应的模型文件
-        model_name = f"{protocol}_alpha_{alpha:.2f}"
-        model_path = None
-        
-        # 尝试多种可能的文件名格式
-        for filename in os.listdir(model_dir):
-            if model_name in filename and filename.endswith('.zip'):
-                model_path = os.path.join(model_dir, filename)
-                break
+        # 从模型索引中查找对应参数下最好的模型
+        model_path = registry.best(protocol, alpha, gamma)
         
         if model_path is None:
             if verbose:
@@ -198,7 +551,11 @@ def evaluate_multiple_alphas(
             alpha=alpha,
             gamma=gamma,
             n_episodes=n_episodes,
-            verbose=verbose
+            seed=seed,
+            use_cache=use_cache,
+            target_ci=target_ci,
+            verbose=verbose,
+            **env_kwargs
         )
         
         all_results.append(results)
@@ -206,9 +563,16 @@ def evaluate_multiple_alphas(
     return all_results
 
 
-def save_results(results, output_path):
-    """保存评估结果到CSV"""
-    import csv
+def save_results(results, output_path, experiment=None):
+    """
+    保存评估结果：追加写入结果库（含逐 episode 数据），再把该实验的当前结果导出为 CSV
+    
+    参数：
+        results (dict / list): evaluate_model 返回的结果
+        output_path (str): CSV 导出路径
+        experiment (str): 实验名，None 时取 CSV 文件名（如 bitcoin_full_evaluation）
+    """
+    from src.agents.results_store import get_results_store, experiment_name
     
     if isinstance(results, dict):
         results = [results]
@@ -217,20 +581,12 @@ def save_results(results, output_path):
         print("没有结果可保存")
         return
     
-    # 获取列名（排除列表类型的列）
-    columns = [k for k in results[0].keys() 
-               if not isinstance(results[0][k], (list, dict))]
-    
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    
-    with open(output_path, 'w', newline='', encoding='utf-8') as f:
-        writer = csv.DictWriter(f, fieldnames=columns)
-        writer.writeheader()
-        for r in results:
-            row = {k: v for k, v in r.items() if k in columns}
-            writer.writerow(row)
+    experiment = experiment or experiment_name(output_path)
+    store = get_results_store()
+    store.append(results, experiment)
+    store.export_csv(output_path, experiment)
     
-    print(f"结果已保存到: {output_path}")
+    print(f"结果已保存到: {store.db_path} (实验 {experiment})，CSV 快照: {output_path}")
 
 
 def main():
@@ -0,0 +1,125 @@
+"""
+进程内的模型 LRU 缓存
+
+evaluate_model、批量评估脚本和 Streamlit 页面会反复加载同一个模型。
+这里按 (模型路径, 文件修改时间) 缓存 load_policy 的结果：同一进程内重复评估同一模型时
+跳过反序列化；模型被重新训练或重新导出后修改时间变化，缓存自动失效。
+缓存总大小超过上限时按最近最少使用 (LRU) 淘汰。
+
+设置环境变量 BLOCKRL_MODEL_CACHE_MB 可以改变内存上限，设置为 0 关闭缓存。
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from src.agents.numpy_policy import load_policy, npz_path_for, table_path_for, zip_path_for
+
+DEFAULT_MAX_MB = 256
+
+
+def model_nbytes(model):
+    """估算已加载模型占用的内存（参数数组的字节数）"""
+    if hasattr(model, 'policy'):
+        # SB3 模型
+        return sum(p.numel() * p.element_size() for p in model.policy.parameters())
+    arrays = [v for v in vars(model).values() if isinstance(v, np.ndarray)]
+    for v in vars(model).values():
+        if isinstance(v, list):
+            arrays.extend(a for a in v if isinstance(a, np.ndarray))
+    return sum(a.nbytes for a in arrays)
+
+
+class ModelCache:
+    """
+    按 (路径, 修改时间) 索引的模型 LRU 缓存
+
+    参数：
+        max_bytes (int): 缓存模型的总大小上限，0 表示不缓存
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_MB * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (model, nbytes)
+        self._nbytes = 0
+        self._lock = threading.Lock()  # Streamlit 的多个会话在不同线程中共用缓存
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(model_path):
+        # .zip 以及导出的 .npz / .table.npz 任何一个更新都会使缓存失效
+        files = [zip_path_for(model_path), npz_path_for(model_path), table_path_for(model_path)]
+        mtimes = tuple(os.path.getmtime(f) if os.path.exists(f) else None for f in files)
+        return os.path.abspath(model_path), mtimes
+
+    def load(self, model_path):
+        """加载模型，命中缓存时直接返回同一个对象"""
+        key = self._key(model_path)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            self.misses += 1
+
+        model = load_policy(model_path)
+        nbytes = model_nbytes(model)
+
+        with self._lock:
+            if nbytes <= self.max_bytes:
+                # 同一路径的旧版本不会再被命中，直接丢弃
+                for old in [k for k in self._entries if k[0] == key[0]]:
+                    self._nbytes -= self._entries.pop(old)[1]
+                self._entries[key] = (model, nbytes)
+                self._nbytes += nbytes
+                self._evict()
+        return model
+
+    def _evict(self):
+        while self._nbytes > self.max_bytes and self._entries:
+            _, (_, nbytes) = self._entries.popitem(last=False)
+            self._nbytes -= nbytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def nbytes(self):
+        return self._nbytes
+
+
+_default_cache = None
+
+
+def get_default_model_cache():
+    """进程内共享的默认缓存，上限由环境变量 BLOCKRL_MODEL_CACHE_MB 控制"""
+    global _default_cache
+    max_bytes = int(float(os.environ.get('BLOCKRL_MODEL_CACHE_MB', DEFAULT_MAX_MB)) * 1024 * 1024)
+    if _default_cache is None:
+        _default_cache = ModelCache(max_bytes)
+    elif _default_cache.max_bytes != max_bytes:
+        _default_cache.max_bytes = max_bytes
+        with _default_cache._lock:
+            _default_cache._evict()
+    return _default_cache
+
+
+def load_model(model_path, cache=None):
+    """
+    通过缓存加载用于推理的模型，评估入口统一使用这个函数
+
+    参数：
+        model_path (str): 模型路径（.zip / .npz / .table.npz）
+        cache (ModelCache): None 时使用进程内默认缓存
+    """
+    if cache is None:
+        cache = get_default_model_cache()
+    return cache.load(model_path)
@@ -0,0 +1,214 @@
+"""
+模型索引
+
+train_selfish_mining 每保存一个模型就在模型目录下的 registry.sqlite 中登记一条记录：
+协议、alpha、gamma、UTB 比率、训练步数、评估得分和路径。评估脚本按参数直接查询，
+不再各自用 glob 扫描目录、用正则从目录名里解析参数。
+
+    registry = get_registry('./models')
+    path = registry.best('ethereum', alpha=0.35)
+
+索引文件不存在时会扫描一次模型目录，把已有模型按训练脚本的命名规则补登记；
+之后手动放入的模型可以用 `python -m src.cli models --rescan` 补登记。
+"""
+
+import os
+import re
+import json
+import sqlite3
+import zipfile
+from datetime import datetime
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+DEFAULT_MODELS_DIR = os.path.join(PROJECT_ROOT, 'models')
+REGISTRY_FILENAME = 'registry.sqlite'
+
+# 参数统一保留 4 位小数，保证查询时浮点数精确相等
+PARAM_DECIMALS = 4
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS models (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    kind TEXT NOT NULL,
+    protocol TEXT NOT NULL,
+    alpha REAL NOT NULL,
+    gamma REAL NOT NULL,
+    utb_ratio REAL,
+    timesteps INTEGER,
+    eval_score REAL,
+    params TEXT,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS models_lookup ON models (protocol, alpha, gamma, utb_ratio);
+"""
+
+# 训练脚本的模型命名规则：
+#   <protocol>_alpha_<a>[_gamma_<g>|_ratio_<r>]_<YYYYMMDD_HHMMSS>_final[.zip]
+#   best_<同上，不含 _final>/best_model.zip
+_NAME_PATTERN = re.compile(
+    r'^(?P<best>best_)?(?P<protocol>bitcoin|ghost|ethereum|utb)_alpha_(?P<alpha>[0-9.]+)'
+    r'(?:_gamma_(?P<gamma>[0-9.]+)|_ratio_(?P<ratio>[0-9.]+))?_(?P<timestamp>\d{8}_\d{6})(?P<final>_final)?$'
+)
+
+
+def _round(value):
+    return None if value is None else round(float(value), PARAM_DECIMALS)
+
+
+def _saved_timesteps(path):
+    # SB3 的 zip 中 data 条目是 JSON，直接读取 num_timesteps，不需要导入 stable_baselines3
+    try:
+        with zipfile.ZipFile(path) as z:
+            return int(json.loads(z.read('data'))['num_timesteps'])
+    except (KeyError, ValueError, zipfile.BadZipFile):
+        return None
+
+
+class ModelRegistry:
+    """
+    SQLite 模型索引
+
+    参数：
+        models_dir (str): 模型目录，索引文件为 <models_dir>/registry.sqlite，
+                          记录中的路径相对于该目录保存
+    """
+
+    def __init__(self, models_dir=DEFAULT_MODELS_DIR):
+        self.models_dir = os.path.abspath(models_dir)
+        self.db_path = os.path.join(self.models_dir, REGISTRY_FILENAME)
+        os.makedirs(self.models_dir, exist_ok=True)
+        is_new = not os.path.exists(self.db_path)
+        # Streamlit 的多个会话线程会共用同一个连接
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.executescript(_SCHEMA)
+        if is_new:
+            self.rescan()
+
+    def close(self):
+        self._conn.close()
+
+    def _relpath(self, path):
+        return os.path.relpath(os.path.abspath(path), self.models_dir)
+
+    def _row(self, row):
+        entry = dict(row)
+        entry['path'] = os.path.join(self.models_dir, entry['path'])
+        entry['params'] = json.loads(entry['params']) if entry['params'] else {}
+        return entry
+
+    def register(self, path, protocol, alpha, gamma=0.5, utb_ratio=None, kind='final', timesteps=None,
+                 eval_score=None, params=None, created_at=None):
+        """
+        登记一个模型，同一路径重复登记时覆盖旧记录
+
+        参数：
+            path (str): 模型文件路径
+            protocol (str): 协议
+            alpha, gamma, utb_ratio (float): 环境参数
+            kind (str): 'final'（训练结束时的模型）或 'best'（EvalCallback 保存的最佳模型）
+            timesteps (int): 训练步数
+            eval_score (float): 训练中的评估得分（平均 episode 奖励）
+            params (dict): 其余训练参数
+        """
+        created_at = created_at or datetime.now().isoformat(timespec='seconds')
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO models (path, kind, protocol, alpha, gamma, utb_ratio, timesteps, "
+                "eval_score, params, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (self._relpath(path), kind, protocol, _round(alpha), _round(gamma), _round(utb_ratio),
+                 timesteps, eval_score, json.dumps(params or {}), created_at),
+            )
+
+    def query(self, protocol=None, alpha=None, gamma=None, utb_ratio=None, kind=None, prefer='best'):
+        """
+        按参数查询，未给出的参数不作限制
+
+        参数：
+            prefer (str): 评估得分相同（如补登记的模型都没有得分）时优先的类型，'best' 或 'final'
+
+        返回：
+            entries (list): 记录字典，按评估得分从高到低（没有得分的排在后面）、
+                            再按 prefer 类型优先、最后按时间从新到旧排序
+        """
+        conditions, values = [], []
+        for column, value in (('protocol', protocol), ('alpha', _round(alpha)), ('gamma', _round(gamma)),
+                              ('utb_ratio', _round(utb_ratio)), ('kind', kind)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                values.append(value)
+        where = ("WHERE " + " AND ".join(conditions)) if conditions else ""
+        rows = self._conn.execute(
+            f"SELECT * FROM models {where} "
+            "ORDER BY eval_score IS NULL, eval_score DESC, kind != ?, created_at DESC", values + [prefer]
+        ).fetchall()
+        return [self._row(r) for r in rows]
+
+    def best(self, protocol, alpha, gamma=0.5, utb_ratio=None, kind=None, prefer='best'):
+        """
+        某组参数下最好的模型路径：评估得分最高者，没有得分时取 prefer 类型中最新的；找不到时返回 None
+        """
+        entries = self.query(protocol, alpha, gamma, utb_ratio, kind, prefer)
+        if utb_ratio is None:
+            entries = [e for e in entries if e['utb_ratio'] is None]
+        return entries[0]['path'] if entries else None
+
+    def best_by_alpha(self, protocol, gamma=0.5, prefer='best'):
+        """
+        每个 alpha 上最好的模型（不含 UTB 比率不同的变体）
+
+        返回：
+            models (list): [(alpha, path)]，按 alpha 排序
+        """
+        alphas = sorted({e['alpha'] for e in self.query(protocol, gamma=gamma) if e['utb_ratio'] is None})
+        return [(alpha, self.best(protocol, alpha, gamma, prefer=prefer)) for alpha in alphas]
+
+    def rescan(self):
+        """
+        扫描模型目录，按训练脚本的命名规则补登记尚未登记的模型，并删除文件已不存在的记录
+
+        返回：
+            added (int): 新登记的模型数
+        """
+        with self._conn:
+            for row in self._conn.execute("SELECT path FROM models").fetchall():
+                if not os.path.exists(os.path.join(self.models_dir, row['path'])):
+                    self._conn.execute("DELETE FROM models WHERE path = ?", (row['path'],))
+
+        known = {r['path'] for r in self._conn.execute("SELECT path FROM models").fetchall()}
+        added = 0
+        for name in sorted(os.listdir(self.models_dir)):
+            match = _NAME_PATTERN.match(name[:-4] if name.endswith('.zip') else name)
+            if match is None:
+                continue
+            if match.group('best'):
+                path = os.path.join(self.models_dir, name, 'best_model.zip')
+            elif match.group('final'):
+                path = os.path.join(self.models_dir, name)
+            else:
+                continue
+            if not os.path.isfile(path) or self._relpath(path) in known:
+                continue
+
+            created_at = datetime.strptime(match.group('timestamp'), '%Y%m%d_%H%M%S').isoformat()
+            self.register(
+                path, match.group('protocol'), float(match.group('alpha')),
+                gamma=float(match.group('gamma')) if match.group('gamma') else 0.5,
+                utb_ratio=float(match.group('ratio')) if match.group('ratio') else None,
+                kind='best' if match.group('best') else 'final',
+                timesteps=_saved_timesteps(path), created_at=created_at,
+            )
+            added += 1
+        return added
+
+
+_registries = {}
+
+
+def get_registry(models_dir=DEFAULT_MODELS_DIR):
+    """每个模型目录共用一个 ModelRegistry 实例"""
+    key = os.path.abspath(models_dir)
+    if key not in _registries:
+        _registries[key] = ModelRegistry(key)
+    return _registries[key]
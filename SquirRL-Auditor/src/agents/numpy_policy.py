@@ -0,0 +1,277 @@
+"""
+纯 NumPy 的 DQN 策略推理
+
+SB3 的 DQN 策略本质上是一个很小的 MLP。导出器把 .zip 模型中的 Q 网络权重抽取为紧凑的 .npz 文件，
+推理时只需要 NumPy：不导入 stable_baselines3 和 torch，加载只需几毫秒，并支持批量贪心动作选择。
+
+导出（需要 stable_baselines3，只做一次）：
+    python -m src.cli export ./models
+
+推理：
+    policy = load_policy('./models/best_bitcoin_alpha_0.35_xxx/best_model.zip')
+    action, _ = policy.predict(obs, deterministic=True)
+
+观察空间为 Discrete(n) 的环境（如 BitcoinSelfishMiningEnv）还可以进一步编译成查找表：
+对全部 n 个状态做一次前向计算，保存每个状态的贪心动作（可选保存 Q 值），
+之后每次决策只是一次数组索引：
+    python -m src.cli export ./models --table
+"""
+
+import os
+import glob
+import numpy as np
+
+NPZ_VERSION = 1
+
+# SB3 policy_kwargs 中的 activation_fn 对应的 NumPy 实现
+ACTIVATIONS = {
+    'relu': lambda x: np.maximum(x, 0, out=x),
+    'tanh': lambda x: np.tanh(x, out=x),
+}
+
+
+def npz_path_for(model_path):
+    """模型对应的 .npz 路径：去掉 .zip 后缀（若有）再加 .npz"""
+    base = model_path[:-4] if model_path.endswith('.zip') else model_path
+    return base + '.npz'
+
+
+def table_path_for(model_path):
+    """模型对应的查找表路径 <模型名>.table.npz"""
+    return npz_path_for(model_path)[:-4] + '.table.npz'
+
+
+def zip_path_for(model_path):
+    """模型文件的实际路径：SB3 的 DQN.load 允许省略 .zip 后缀"""
+    if os.path.exists(model_path) or model_path.endswith('.zip'):
+        return model_path
+    return model_path + '.zip'
+
+
+def export_model(model_path, output_path=None):
+    """
+    把 SB3 DQN 模型中的 Q 网络导出为 .npz
+
+    参数：
+        model_path (str): SB3 保存的模型 (.zip)
+        output_path (str): 输出路径，None 时写在模型旁边（同名 .npz）
+
+    返回：
+        output_path (str): .npz 路径
+    """
+    from gymnasium import spaces
+    from stable_baselines3.common.save_util import load_from_zip_file
+
+    model_path = zip_path_for(model_path)
+    data, params, _ = load_from_zip_file(model_path, device='cpu')
+
+    # q_net.q_net.{i}.weight / bias，按层号排序（中间的奇数层是激活函数）
+    state = params['policy']
+    layers = sorted({int(k.split('.')[2]) for k in state if k.startswith('q_net.q_net.')})
+    arrays = {}
+    for n, i in enumerate(layers):
+        arrays[f'W{n}'] = state[f'q_net.q_net.{i}.weight'].cpu().numpy().astype(np.float32)
+        arrays[f'b{n}'] = state[f'q_net.q_net.{i}.bias'].cpu().numpy().astype(np.float32)
+
+    activation_fn = (data.get('policy_kwargs') or {}).get('activation_fn')
+    activation = activation_fn.__name__.lower() if activation_fn is not None else 'relu'
+    if activation not in ACTIVATIONS:
+        raise ValueError(f"不支持的激活函数: {activation}")
+
+    # Discrete 观察在 SB3 中被 one-hot 编码，记录类别数；Box 观察直接展平
+    obs_space = data['observation_space']
+    obs_n = int(obs_space.n) if isinstance(obs_space, spaces.Discrete) else 0
+
+    output_path = output_path or npz_path_for(model_path)
+    np.savez(
+        output_path, version=np.int64(NPZ_VERSION), n_layers=np.int64(len(layers)),
+        activation=np.array(activation), obs_n=np.int64(obs_n),
+        exploration_rate=np.float64(data.get('exploration_rate', 0.0)), **arrays,
+    )
+    return output_path
+
+
+def _up_to_date(path, model_path):
+    # 导出文件存在且不比原始模型旧
+    zip_path = zip_path_for(model_path)
+    return os.path.exists(path) and (not os.path.exists(zip_path)
+                                     or os.path.getmtime(path) >= os.path.getmtime(zip_path))
+
+
+def compile_table(model_path, output_path=None, store_q=False):
+    """
+    把 Discrete 观察空间的模型编译为查找表
+
+    参数：
+        model_path (str): SB3 模型 (.zip)，没有最新的 .npz 时会先导出
+        output_path (str): 输出路径，None 时写在模型旁边（<模型名>.table.npz）
+        store_q (bool): 是否同时保存每个状态的 Q 值
+
+    返回：
+        output_path (str): 查找表路径
+    """
+    npz_path = npz_path_for(model_path)
+    if not _up_to_date(npz_path, model_path):
+        export_model(model_path, npz_path)
+    network = NumpyQPolicy.load(npz_path)
+    if not network.obs_n:
+        raise ValueError(f"只有 Discrete 观察空间的模型可以编译为查找表: {model_path}")
+
+    q = network.q_values(np.arange(network.obs_n))
+    arrays = {'q_values': q.astype(np.float32)} if store_q else {}
+    output_path = output_path or table_path_for(model_path)
+    np.savez(
+        output_path, version=np.int64(NPZ_VERSION), actions=q.argmax(axis=1).astype(np.int8),
+        n_actions=np.int64(network.n_actions), exploration_rate=np.float64(network.exploration_rate), **arrays,
+    )
+    return output_path
+
+
+def export_models(paths, table=False, store_q=False, verbose=1):
+    """
+    批量导出：paths 中的目录会递归查找其中的全部 SB3 模型
+
+    table 为 True 时，Discrete 观察空间的模型还会编译查找表（store_q 同 compile_table）。
+
+    返回：
+        exported (list): 生成的 .npz 路径
+    """
+    import zipfile
+
+    model_paths = []
+    for path in paths:
+        if os.path.isdir(path):
+            for f in sorted(glob.glob(os.path.join(path, '**', '*'), recursive=True)):
+                # 训练脚本保存的模型可能没有 .zip 后缀，以 SB3 的 data 条目识别
+                if os.path.isfile(f) and zipfile.is_zipfile(f):
+                    with zipfile.ZipFile(f) as z:
+                        if 'policy.pth' in z.namelist():
+                            model_paths.append(f)
+        else:
+            model_paths.append(path)
+
+    exported = []
+    for path in model_paths:
+        exported.append(export_model(path))
+        if verbose:
+            print(f"  {path} -> {exported[-1]}")
+        if table and NumpyQPolicy.load(exported[-1]).obs_n:
+            exported.append(compile_table(path, store_q=store_q))
+            if verbose:
+                print(f"  {path} -> {exported[-1]}")
+    return exported
+
+
+class NumpyQPolicy:
+    """
+    NumPy 实现的 DQN 贪心策略
+
+    predict 与 SB3 的 model.predict 接口一致，可以直接替换评估代码中的模型。
+    """
+
+    def __init__(self, weights, biases, activation='relu', obs_n=0, exploration_rate=0.0):
+        self.weights = [np.ascontiguousarray(W.T) for W in weights]  # (in, out)，便于 x @ W
+        self.biases = biases
+        self.activation = ACTIVATIONS[activation]
+        self.obs_n = obs_n
+        self.exploration_rate = exploration_rate
+        self.n_actions = self.biases[-1].shape[0]
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            n_layers = int(data['n_layers'])
+            weights = [data[f'W{i}'] for i in range(n_layers)]
+            biases = [data[f'b{i}'] for i in range(n_layers)]
+            return cls(weights, biases, str(data['activation']), int(data['obs_n']),
+                       float(data['exploration_rate']))
+
+    def q_values(self, obs):
+        """
+        批量计算 Q 值
+
+        参数：
+            obs (ndarray): Discrete 观察为 (N,) 的状态编号，Box 观察为 (N, d)
+
+        返回：
+            q (ndarray): (N, n_actions)
+        """
+        if self.obs_n:
+            # one-hot 输入乘第一层权重，等价于直接取权重矩阵的对应行
+            x = self.weights[0][np.asarray(obs, dtype=np.int64).reshape(-1)] + self.biases[0]
+        else:
+            obs = np.asarray(obs, dtype=np.float32)
+            x = obs.reshape(-1, self.weights[0].shape[0]) @ self.weights[0] + self.biases[0]
+        for W, b in zip(self.weights[1:], self.biases[1:]):
+            x = self.activation(x) @ W + b
+        return x
+
+    def predict(self, obs, deterministic=True):
+        """
+        选择动作，接口与 SB3 相同
+
+        单个观察返回一个动作，一批观察返回 (N,) 动作数组；
+        deterministic=False 时按保存的 exploration_rate 做 epsilon-贪心。
+        """
+        single = np.ndim(obs) == (0 if self.obs_n else 1)
+        actions = self.q_values(obs).argmax(axis=1)
+        if not deterministic and self.exploration_rate > 0:
+            explore = np.random.rand(len(actions)) < self.exploration_rate
+            actions[explore] = np.random.randint(self.n_actions, size=int(explore.sum()))
+        return (actions[0] if single else actions), None
+
+
+class TablePolicy:
+    """
+    查找表策略：每个状态的贪心动作已预先算好，predict 只做一次数组索引
+    """
+
+    def __init__(self, actions, n_actions, q_values=None, exploration_rate=0.0):
+        self.actions = np.asarray(actions, dtype=np.int64)
+        self.n_actions = n_actions
+        self.q_table = q_values
+        self.exploration_rate = exploration_rate
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            q_values = data['q_values'] if 'q_values' in data.files else None
+            return cls(data['actions'], int(data['n_actions']), q_values, float(data['exploration_rate']))
+
+    def q_values(self, obs):
+        if self.q_table is None:
+            raise ValueError("查找表编译时没有保存 Q 值 (store_q=False)")
+        return self.q_table[np.asarray(obs, dtype=np.int64).reshape(-1)]
+
+    def predict(self, obs, deterministic=True):
+        """选择动作，接口与 NumpyQPolicy.predict 相同"""
+        if np.ndim(obs) == 0 and (deterministic or self.exploration_rate == 0):
+            return self.actions[int(obs)], None
+        actions = self.actions[np.asarray(obs, dtype=np.int64).reshape(-1)]
+        if not deterministic and self.exploration_rate > 0:
+            explore = np.random.rand(len(actions)) < self.exploration_rate
+            actions[explore] = np.random.randint(self.n_actions, size=int(explore.sum()))
+        return (actions[0] if np.ndim(obs) == 0 else actions), None
+
+
+def load_policy(model_path):
+    """
+    加载用于推理的策略
+
+    依次尝试：查找表 (.table.npz)、导出的网络权重 (.npz)，都不存在或比 .zip 旧时退回 SB3 的 DQN.load。
+    也可以直接传入 .table.npz / .npz 路径。
+    """
+    if model_path.endswith('.table.npz'):
+        return TablePolicy.load(model_path)
+    if model_path.endswith('.npz'):
+        return NumpyQPolicy.load(model_path)
+
+    table_path = table_path_for(model_path)
+    if _up_to_date(table_path, model_path):
+        return TablePolicy.load(table_path)
+    npz_path = npz_path_for(model_path)
+    if _up_to_date(npz_path, model_path):
+        return NumpyQPolicy.load(npz_path)
+
+    from stable_baselines3 import DQN
+    return DQN.load(model_path)
@@ -0,0 +1,128 @@
+"""
+紧凑的经验回放缓冲区
+
+SB3 的 ReplayBuffer 按观察空间的类型保存每条经验的观察和下一观察：Box 观察是 float32 向量
+（Ethereum 环境为 10 维，40 字节），Discrete 观察是 int64。自私挖矿环境的观察只有少量不同取值
+（隐藏链长度不超过 max_hidden_block+1、状态 0-2、叔块时隙 0-2、alpha 固定），
+CompactReplayBuffer 把每个不同的观察登记到码本中，缓冲区里只保存 int16 码字（超过 32767 个时改为 int32）：
+    - Discrete 观察本身就是状态索引，直接保存，不需要码本；
+    - Box 观察按字节内容查码本，第一次出现时追加一行；
+    - 采样时一次索引 codebook[codes] 解码整批观察。
+动作保存为 int8，done / timeout 保存为 bool。同样内存下 buffer_size 可以大约扩大一个数量级。
+
+码本大小等于访问过的不同观察数，alpha 随机波动（dev > 0）或 brown 随机过程时观察几乎不重复，不适合使用：
+码本超过 max_codebook_size 行时报错，而不是悄悄占用比默认缓冲区更多的内存。训练时需要显式开启
+（train_selfish_mining(compact_replay=True) / --compact-replay）。
+
+    model = DQN("MlpPolicy", env, replay_buffer_class=CompactReplayBuffer)
+"""
+
+import sys
+
+import numpy as np
+from gymnasium import spaces
+from stable_baselines3.common.buffers import ReplayBuffer
+from stable_baselines3.common.type_aliases import ReplayBufferSamples
+
+
+class CompactReplayBuffer(ReplayBuffer):
+    """
+    以码字保存观察的经验回放缓冲区，参数与 SB3 的 ReplayBuffer 相同（不支持 optimize_memory_usage）
+
+    参数：
+        max_codebook_size (int): 码本行数上限，超过时报错；None 时为 buffer_size * n_envs // 8，
+                                 此时码本已接近抵消码字节省的内存
+    """
+
+    def __init__(self, buffer_size, observation_space, action_space, device="auto", n_envs=1,
+                 optimize_memory_usage=False, handle_timeout_termination=True, max_codebook_size=None):
+        if optimize_memory_usage:
+            raise ValueError("CompactReplayBuffer 不支持 optimize_memory_usage")
+        if not isinstance(action_space, spaces.Discrete) or action_space.n > 127:
+            raise ValueError("CompactReplayBuffer 只支持不超过 127 个动作的 Discrete 动作空间")
+        super().__init__(buffer_size, observation_space, action_space, device, n_envs,
+                         optimize_memory_usage, handle_timeout_termination)
+
+        # 用紧凑的数组替换父类分配的数组（父类的 np.zeros 没有写入，不会实际占用内存）
+        self._indexed = isinstance(observation_space, spaces.Discrete)
+        shape = (self.buffer_size, self.n_envs)
+        code_dtype = np.int32 if self._indexed and observation_space.n > np.iinfo(np.int16).max + 1 else np.int16
+        self.observations = np.zeros(shape, dtype=code_dtype)
+        self.next_observations = np.zeros(shape, dtype=code_dtype)
+        self.actions = np.zeros(shape + (self.action_dim,), dtype=np.int8)
+        self.dones = np.zeros(shape, dtype=bool)
+        self.timeouts = np.zeros(shape, dtype=bool)
+
+        self._codes = {}  # 观察的字节内容 -> 码字
+        self.max_codebook_size = max_codebook_size or max(self.buffer_size * self.n_envs // 8, 1)
+        self._codebook = np.zeros((0 if self._indexed else 64,) + self.obs_shape, dtype=observation_space.dtype)
+
+    @property
+    def codebook_size(self):
+        """码本中不同观察的个数（Discrete 观察为 0）"""
+        return len(self._codes)
+
+    @property
+    def nbytes(self):
+        """缓冲区数组、码本和码本索引字典（字节串键和码字）占用的字节数"""
+        arrays = (self.observations, self.next_observations, self.actions, self.rewards, self.dones,
+                  self.timeouts, self._codebook)
+        index = sys.getsizeof(self._codes) + sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in self._codes.items())
+        return sum(a.nbytes for a in arrays) + index
+
+    def _encode(self, obs):
+        # 每个环境的观察 -> 码字
+        if self._indexed:
+            return np.asarray(obs).reshape(self.n_envs)
+        obs = np.asarray(obs, dtype=self._codebook.dtype).reshape((self.n_envs,) + self.obs_shape)
+        codes = np.empty(self.n_envs, dtype=np.int64)
+        for i, row in enumerate(obs):
+            key = row.tobytes()
+            code = self._codes.get(key)
+            if code is None:
+                code = len(self._codes)
+                if code >= self.max_codebook_size:
+                    raise RuntimeError(
+                        f"CompactReplayBuffer 的码本超过 {self.max_codebook_size} 行：观察几乎不重复"
+                        f"（如 dev > 0 或 brown 随机过程），请改用 SB3 默认的 ReplayBuffer")
+                if code == len(self._codebook):
+                    # 码本容量不够时翻倍
+                    self._codebook = np.concatenate([self._codebook, np.zeros_like(self._codebook)])
+                if code > np.iinfo(self.observations.dtype).max:
+                    self.observations = self.observations.astype(np.int32)
+                    self.next_observations = self.next_observations.astype(np.int32)
+                self._codebook[code] = row
+                self._codes[key] = code
+            codes[i] = code
+        return codes
+
+    def _decode(self, codes):
+        if self._indexed:
+            return codes.reshape(-1, 1).astype(np.int64)
+        return self._codebook[codes]
+
+    def add(self, obs, next_obs, action, reward, done, infos):
+        self.observations[self.pos] = self._encode(obs)
+        self.next_observations[self.pos] = self._encode(next_obs)
+        self.actions[self.pos] = np.asarray(action).reshape((self.n_envs, self.action_dim))
+        self.rewards[self.pos] = np.asarray(reward)
+        self.dones[self.pos] = np.asarray(done)
+        if self.handle_timeout_termination:
+            self.timeouts[self.pos] = [info.get("TimeLimit.truncated", False) for info in infos]
+
+        self.pos += 1
+        if self.pos == self.buffer_size:
+            self.full = True
+            self.pos = 0
+
+    def _get_samples(self, batch_inds, env=None):
+        env_indices = np.random.randint(0, high=self.n_envs, size=(len(batch_inds),))
+        dones = self.dones[batch_inds, env_indices] & ~self.timeouts[batch_inds, env_indices]
+        data = (
+            self._normalize_obs(self._decode(self.observations[batch_inds, env_indices]), env),
+            self.actions[batch_inds, env_indices].astype(np.int64),
+            self._normalize_obs(self._decode(self.next_observations[batch_inds, env_indices]), env),
+            dones.astype(np.float32).reshape(-1, 1),
+            self._normalize_reward(self.rewards[batch_inds, env_indices].reshape(-1, 1), env),
+        )
+        return ReplayBufferSamples(*tuple(map(self.to_torch, data)))
@@ -0,0 +1,274 @@
+"""
+评估结果库
+
+评估结果追加写入 results/results.sqlite，不再每次整体重写 CSV：
+    - runs 表每次评估一行：实验名、模型、环境参数、评估设置和汇总统计；
+    - episodes 表按列保存每个 episode 的奖励、长度和相对奖励，CSV 中会丢掉的逐 episode 数据都保留下来。
+
+实验名沿用原来的 CSV 文件名（如 bitcoin_full_evaluation），画图脚本和页面按实验名和参数只查询需要的部分：
+    store = get_results_store()
+    rows = store.summaries('bitcoin_full_evaluation', alpha=0.35)
+    fractions = store.episodes(rows[0]['id'])['reward_fraction']
+
+save_results 仍会导出同名 CSV，作为该实验当前结果的快照，供外部工具使用。
+"""
+
+import os
+import csv
+import json
+import sqlite3
+from datetime import datetime
+
+import numpy as np
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+DEFAULT_RESULTS_DB = os.path.join(PROJECT_ROOT, 'results', 'results.sqlite')
+
+# 参数统一保留 4 位小数，保证查询时浮点数精确相等
+PARAM_DECIMALS = 4
+
+# runs 表中的汇总统计列，与 evaluate_model 返回的字段同名
+SUMMARY_COLUMNS = [
+    'mean_reward', 'std_reward', 'min_reward', 'max_reward', 'mean_length', 'std_length',
+    'mean_reward_fraction', 'std_reward_fraction', 'honest_baseline', 'relative_gain', 'excess_reward',
+    'ci_halfwidth',
+]
+
+# episodes 表的列 -> evaluate_model 结果中的逐 episode 列表
+EPISODE_COLUMNS = {
+    'reward': 'episode_rewards',
+    'length': 'episode_lengths',
+    'reward_fraction': 'episode_reward_fractions',
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    experiment TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    model_path TEXT,
+    protocol TEXT NOT NULL,
+    alpha REAL NOT NULL,
+    gamma REAL NOT NULL,
+    utb_ratio REAL,
+    env_kwargs TEXT NOT NULL,
+    n_episodes INTEGER,
+    deterministic INTEGER,
+    max_steps_per_episode INTEGER,
+    seed INTEGER,
+    action_distribution TEXT,
+    """ + ",\n    ".join(f"{c} REAL" for c in SUMMARY_COLUMNS) + """
+);
+CREATE INDEX IF NOT EXISTS runs_lookup ON runs (experiment, protocol, alpha, gamma, utb_ratio);
+CREATE TABLE IF NOT EXISTS episodes (
+    run_id INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    episode INTEGER NOT NULL,
+    reward REAL,
+    length INTEGER,
+    reward_fraction REAL,
+    PRIMARY KEY (run_id, episode)
+) WITHOUT ROWID;
+"""
+
+
+def _round(value):
+    return None if value is None else round(float(value), PARAM_DECIMALS)
+
+
+def _scalar(value):
+    # NumPy 标量转换为 Python 类型，sqlite3 不接受 np.float64 以外的 NumPy 类型
+    return value.item() if isinstance(value, np.generic) else value
+
+
+class ResultsStore:
+    """
+    追加写入的 SQLite 评估结果库
+
+    参数：
+        db_path (str): 数据库路径
+    """
+
+    def __init__(self, db_path=DEFAULT_RESULTS_DB):
+        self.db_path = os.path.abspath(db_path)
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        # Streamlit 的多个会话线程会共用同一个连接
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA foreign_keys = ON")
+        self._conn.executescript(_SCHEMA)
+        # 旧版本创建的库缺少后来新增的汇总列时补上
+        existing = {r['name'] for r in self._conn.execute("PRAGMA table_info(runs)")}
+        for column in SUMMARY_COLUMNS:
+            if column not in existing:
+                self._conn.execute(f"ALTER TABLE runs ADD COLUMN {column} REAL")
+
+    def close(self):
+        self._conn.close()
+
+    def append(self, results, experiment, created_at=None):
+        """
+        追加一次或多次评估的结果
+
+        参数：
+            results (dict / list): evaluate_model 返回的结果
+            experiment (str): 实验名
+            created_at (str): 记录时间，None 时取当前时间
+
+        返回：
+            run_ids (list): 新记录的编号
+        """
+        if isinstance(results, dict):
+            results = [results]
+        created_at = created_at or datetime.now().isoformat(timespec='seconds')
+
+        run_ids = []
+        with self._conn:
+            for r in results:
+                env_kwargs = dict(r.get('env_kwargs') or {})
+                utb_ratio = r.get('utb_ratio', env_kwargs.get('utb_ratio'))
+                deterministic = r.get('deterministic')
+                values = {
+                    'experiment': experiment, 'created_at': created_at, 'model_path': r.get('model_path'),
+                    'protocol': r['protocol'], 'alpha': _round(r['alpha']), 'gamma': _round(r['gamma']),
+                    'utb_ratio': _round(utb_ratio), 'env_kwargs': json.dumps(env_kwargs, sort_keys=True),
+                    'n_episodes': _scalar(r.get('n_episodes')),
+                    'deterministic': None if deterministic is None else int(deterministic),
+                    'max_steps_per_episode': r.get('max_steps_per_episode'), 'seed': r.get('seed'),
+                    'action_distribution': json.dumps({str(k): int(v) for k, v in
+                                                       (r.get('action_distribution') or {}).items()}),
+                }
+                values.update({c: _scalar(r.get(c)) for c in SUMMARY_COLUMNS})
+                cursor = self._conn.execute(
+                    f"INSERT INTO runs ({', '.join(values)}) VALUES ({', '.join('?' * len(values))})",
+                    list(values.values()),
+                )
+                run_id = cursor.lastrowid
+
+                columns = {c: r.get(key) for c, key in EPISODE_COLUMNS.items() if r.get(key) is not None}
+                if columns:
+                    n = len(next(iter(columns.values())))
+                    rows = [(run_id, i, *(_scalar(v[i]) for v in columns.values())) for i in range(n)]
+                    self._conn.executemany(
+                        f"INSERT INTO episodes (run_id, episode, {', '.join(columns)}) "
+                        f"VALUES (?, ?, {', '.join('?' * len(columns))})", rows,
+                    )
+                run_ids.append(run_id)
+        return run_ids
+
+    def experiments(self):
+        """库中已有的实验名"""
+        return [r[0] for r in self._conn.execute("SELECT DISTINCT experiment FROM runs ORDER BY experiment")]
+
+    def summaries(self, experiment=None, protocol=None, alpha=None, gamma=None, utb_ratio=None, latest=True):
+        """
+        查询汇总统计，未给出的参数不作限制
+
+        参数：
+            latest (bool): 同一实验中相同 (协议, alpha, gamma, UTB 比率, 环境参数) 只保留最新一次评估，
+                           即原来重写 CSV 的语义；False 时返回全部历史记录
+
+        返回：
+            rows (list): 记录字典，按 (协议, alpha, gamma, UTB 比率) 排序
+        """
+        conditions, values = [], []
+        for column, value in (('experiment', experiment), ('protocol', protocol), ('alpha', _round(alpha)),
+                              ('gamma', _round(gamma)), ('utb_ratio', _round(utb_ratio))):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                values.append(value)
+        where = " AND ".join(conditions) or "1"
+        if latest:
+            where = (f"id IN (SELECT MAX(id) FROM runs WHERE {where} "
+                     "GROUP BY experiment, protocol, alpha, gamma, utb_ratio, env_kwargs)")
+        rows = self._conn.execute(
+            f"SELECT * FROM runs WHERE {where} ORDER BY protocol, alpha, gamma, utb_ratio, id", values
+        ).fetchall()
+
+        summaries = []
+        for row in rows:
+            entry = dict(row)
+            entry['env_kwargs'] = json.loads(entry['env_kwargs'])
+            entry['action_distribution'] = {int(k): v for k, v in json.loads(entry['action_distribution']).items()}
+            if entry['deterministic'] is not None:
+                entry['deterministic'] = bool(entry['deterministic'])
+            summaries.append(entry)
+        return summaries
+
+    def episodes(self, run_id, columns=tuple(EPISODE_COLUMNS)):
+        """
+        一次评估的逐 episode 数据
+
+        返回：
+            data (dict): 列名 -> ndarray
+        """
+        rows = self._conn.execute(
+            f"SELECT {', '.join(columns)} FROM episodes WHERE run_id = ? ORDER BY episode", (run_id,)
+        ).fetchall()
+        return {c: np.array([r[i] for r in rows], dtype=np.float64) for i, c in enumerate(columns)}
+
+    def export_csv(self, output_path, experiment):
+        """
+        把实验当前的结果（每组参数最新的一次评估）导出为 CSV
+
+        返回：
+            n_rows (int): 导出的行数
+        """
+        rows = self.summaries(experiment)
+        columns = ['protocol', 'alpha', 'gamma', 'utb_ratio', 'n_episodes'] + SUMMARY_COLUMNS + ['model_path']
+        if all(r['utb_ratio'] is None for r in rows):
+            columns.remove('utb_ratio')
+
+        os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+        with open(output_path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=columns, extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(rows)
+        return len(rows)
+
+
+def experiment_name(output_path):
+    """CSV 路径对应的实验名：去掉目录和扩展名"""
+    return os.path.splitext(os.path.basename(str(output_path)))[0]
+
+
+_stores = {}
+
+
+def get_results_store(db_path=DEFAULT_RESULTS_DB):
+    """每个数据库共用一个 ResultsStore 实例"""
+    key = os.path.abspath(db_path)
+    if key not in _stores:
+        _stores[key] = ResultsStore(key)
+    return _stores[key]
+
+
+def load_experiment(name, db_path=DEFAULT_RESULTS_DB, **filters):
+    """
+    读取一个实验的汇总结果：优先查询结果库，库中没有该实验时退回读取同名 CSV
+
+    参数：
+        name (str): 实验名，也可以直接传 CSV 路径（实验名取文件名）
+        filters: 传给 ResultsStore.summaries 的筛选参数，只对结果库生效
+
+    返回：
+        rows (list): 记录字典，数值字段已转换为 float；都没有时返回空列表
+    """
+    experiment = experiment_name(name)
+    if os.path.exists(db_path):
+        rows = get_results_store(db_path).summaries(experiment, **filters)
+        if rows:
+            return rows
+
+    csv_path = str(name) if str(name).endswith('.csv') else os.path.join(os.path.dirname(db_path), f"{experiment}.csv")
+    if not os.path.exists(csv_path):
+        return []
+    rows = []
+    with open(csv_path, 'r', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            for k, v in row.items():
+                try:
+                    row[k] = float(v)
+                except (TypeError, ValueError):
+                    pass
+            rows.append(row)
+    return rows
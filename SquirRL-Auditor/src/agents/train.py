@@ -12,12 +12,8 @@ from datetime import datetime
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../..'))
 
 import numpy as np
-from stable_baselines3 import DQN
-from stable_baselines3.common.callbacks import EvalCallback, CheckpointCallback
-from stable_baselines3.common.monitor import Monitor
-from gymnasium.wrappers import TimeLimit
 
-from src.environment.gym_wrapper import make_env
+from src.environment.gym_wrapper import make_env, attach_obs_buffer, CopyOnEpisodeEnd
 
 
 def train_selfish_mining(
@@ -39,7 +35,8 @@ def train_selfish_mining(
     log_path="./logs",
     seed=None,
     verbose=1,
-    env_kwargs=None
+    env_kwargs=None,
+    compact_replay=False
 ):
     """
     训练自私挖矿策略
@@ -63,12 +60,22 @@ def train_selfish_mining(
         log_path (str): 日志保存路径
         seed (int): 随机种子
         verbose (int): 详细程度
+        env_kwargs (dict): 其他环境参数
+        compact_replay (bool): 是否使用以码字保存观察的紧凑回放缓冲区（见 replay_buffer.py），
+                               只适合观察取值很少的配置（dev = 0、iid 随机过程）
     
     返回：
         model: 训练好的模型
         env: 训练环境
     """
     
+    # stable_baselines3 会连带导入 torch，只在训练时导入
+    from stable_baselines3 import DQN
+    from stable_baselines3.common.callbacks import EvalCallback, CheckpointCallback
+    from stable_baselines3.common.monitor import Monitor
+    from gymnasium.wrappers import TimeLimit
+    from src.agents.replay_buffer import CompactReplayBuffer
+    
     # 创建保存目录
     os.makedirs(save_path, exist_ok=True)
     if log_path:
@@ -93,17 +100,19 @@ def train_selfish_mining(
     # 准备环境参数
     if env_kwargs is None:
         env_kwargs = {}
-    env_params = {'alpha': alpha, 'gamma': gamma, **env_kwargs}
+    # SB3 不读取环境的 info，训练和评估环境都不构造每步的 info 字典
+    env_params = {'alpha': alpha, 'gamma': gamma, 'info_level': 'none', **env_kwargs}
     
     # 创建训练环境（添加步数限制防止无限循环）
-    env = make_env(protocol=protocol, **env_params)
+    # 观察写入环境自己的缓冲区，不每步分配；episode 结束时复制，SB3 保存的 terminal_observation 不会被 reset 覆盖
+    env = attach_obs_buffer(make_env(protocol=protocol, **env_params))
     env = TimeLimit(env, max_episode_steps=10000)  # 限制每个episode最多10000步
-    env = Monitor(env, log_path if log_path else None)
+    env = Monitor(CopyOnEpisodeEnd(env), log_path if log_path else None)
     
     # 创建评估环境（同样添加步数限制）
-    eval_env = make_env(protocol=protocol, **env_params)
+    eval_env = attach_obs_buffer(make_env(protocol=protocol, **env_params))
     eval_env = TimeLimit(eval_env, max_episode_steps=1000)  # 评估时限制更短，加快评估速度
-    eval_env = Monitor(eval_env)
+    eval_env = Monitor(CopyOnEpisodeEnd(eval_env))
     
     # 创建模型
     model = DQN(
@@ -111,6 +120,7 @@ def train_selfish_mining(
         env,
         learning_rate=learning_rate,
         buffer_size=buffer_size,
+        replay_buffer_class=CompactReplayBuffer if compact_replay else None,
         learning_starts=learning_starts,
         batch_size=batch_size,
         tau=tau,
@@ -173,6 +183,34 @@ def train_selfish_mining(
     model.save(final_model_path)
     print(f"\n模型已保存到: {final_model_path}.zip")
     
+    # 同时导出纯 NumPy 推理用的 Q 网络权重（Discrete 观察还会编译查找表）
+    from src.agents.numpy_policy import export_models, zip_path_for
+    best_model_path = os.path.join(save_path, f"best_{model_name}", "best_model.zip")
+    model_paths = [final_model_path] + ([best_model_path] if os.path.exists(best_model_path) else [])
+    exported = export_models(model_paths, table=True, verbose=0)
+    print(f"推理权重已导出到: {', '.join(exported)}")
+    
+    # 登记到模型目录的索引，评估脚本按参数直接查询
+    from src.agents.model_registry import get_registry, _saved_timesteps
+    registry = get_registry(save_path)
+    params = {
+        'learning_rate': learning_rate, 'buffer_size': buffer_size, 'batch_size': batch_size,
+        'gamma_discount': gamma_discount, 'seed': seed, **(env_kwargs or {}),
+    }
+    utb_ratio = (env_kwargs or {}).get('utb_ratio') if protocol == "utb" else None
+    # final 模型的得分取训练中最后一次评估，best 模型取最好的一次评估
+    last_score = float(eval_callback.last_mean_reward) if log_path else None
+    if last_score is not None and not np.isfinite(last_score):
+        last_score = None  # 训练步数少于评估间隔，没有评估过
+    registry.register(zip_path_for(final_model_path), protocol, alpha, gamma, utb_ratio, kind='final',
+                      timesteps=model.num_timesteps, eval_score=last_score, params=params)
+    if os.path.exists(best_model_path):
+        # best 模型保存于 EvalCallback 得到最好评估的时刻，步数从保存的 zip 中读取
+        registry.register(best_model_path, protocol, alpha, gamma, utb_ratio, kind='best',
+                          timesteps=_saved_timesteps(best_model_path),
+                          eval_score=float(eval_callback.best_mean_reward),
+                          params=params)
+    
     return model, env
 
 
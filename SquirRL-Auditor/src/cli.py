@@ -7,12 +7,22 @@ SquirRL-Auditor 命令行工具
 - 评估训练好的模型
 - 生成可视化图表
 - 比较不同协议的安全性
+- 求解精确最优策略图谱
+- 求解最小盈利算力阈值
+- 导出纯 NumPy 推理用的模型权重
+- 查询模型索引
+- 运行吞吐量基准测试并与基线比较
 
 使用方法：
     python -m src.cli train --protocol bitcoin --alpha 0.35
     python -m src.cli evaluate ./models/model.zip --alpha 0.35
-    python -m src.cli plot --results ./results/evaluation.csv
+    python -m src.cli plot --results bitcoin_full_evaluation
     python -m src.cli compare --protocols bitcoin ghost
+    python -m src.cli atlas --protocol bitcoin --alphas 0.1 0.49 50 --gammas 0 1 50
+    python -m src.cli threshold --protocol ghost --stale-rate 0.1
+    python -m src.cli export ./models
+    python -m src.cli models --protocol bitcoin --alpha 0.35
+    python -m src.cli benchmark --quick
 """
 
 import argparse
@@ -35,6 +45,8 @@ def cmd_train(args):
     env_kwargs = {}
     if args.protocol == 'utb':
         env_kwargs['utb_ratio'] = args.utb_ratio
+    if args.encoding != 'index':
+        env_kwargs['encoding'] = args.encoding
     
     model, env = train_selfish_mining(
         protocol=args.protocol,
@@ -42,11 +54,13 @@ def cmd_train(args):
         gamma=args.gamma,
         total_timesteps=args.timesteps,
         learning_rate=args.lr,
+        buffer_size=args.buffer_size,
         save_path=args.output,
         log_path=args.log_path,
         seed=args.seed,
         verbose=args.verbose,
-        env_kwargs=env_kwargs
+        env_kwargs=env_kwargs,
+        compact_replay=args.compact_replay
     )
     
     print(f"\n训练完成！模型保存在: {args.output}")
@@ -54,7 +68,7 @@ def cmd_train(args):
 
 def cmd_evaluate(args):
     """评估命令"""
-    from src.agents.evaluate import evaluate_model, evaluate_multiple_alphas, save_results
+    from src.agents.evaluate import evaluate_model, evaluate_multiple_alphas, evaluate_steady_state, save_results
     
     print(f"\n{'='*60}")
     print("SquirRL-Auditor: 模型评估")
@@ -64,8 +78,28 @@ def cmd_evaluate(args):
     env_kwargs = {}
     if args.protocol == 'utb' and hasattr(args, 'utb_ratio'):
         env_kwargs['utb_ratio'] = args.utb_ratio
+    if args.encoding != 'index':
+        # 模型训练时使用的观察编码
+        env_kwargs['encoding'] = args.encoding
     
-    if args.multi_alpha:
+    if args.steady_state:
+        # 长链稳态评估，不做 episode 重置
+        results = evaluate_steady_state(
+            model_path=args.model_path,
+            protocol=args.protocol,
+            alpha=args.alpha,
+            gamma=args.gamma,
+            method=args.steady_state,
+            target_ci=args.target_ci if args.target_ci is not None else 0.002,
+            confidence=args.confidence,
+            n_chains=args.chains,
+            max_steps=args.max_steps,
+            seed=args.seed,
+            use_cache=not args.no_cache,
+            verbose=args.verbose,
+            **env_kwargs
+        )
+    elif args.multi_alpha:
         # 评估多个alpha值
         results = evaluate_multiple_alphas(
             model_dir=args.model_path,
@@ -73,6 +107,9 @@ def cmd_evaluate(args):
             protocol=args.protocol,
             gamma=args.gamma,
             n_episodes=args.episodes,
+            seed=args.seed,
+            use_cache=not args.no_cache,
+            target_ci=args.target_ci,
             verbose=args.verbose,
             **env_kwargs
         )
@@ -84,13 +121,19 @@ def cmd_evaluate(args):
             alpha=args.alpha,
             gamma=args.gamma,
             n_episodes=args.episodes,
+            seed=args.seed,
+            use_cache=not args.no_cache,
+            target_ci=args.target_ci,
+            confidence=args.confidence,
+            ci_batch_size=args.ci_batch,
+            event_seed=args.event_seed,
             verbose=args.verbose,
             **env_kwargs
         )
     
     # 保存结果
     if args.output:
-        save_results(results if isinstance(results, list) else [results], args.output)
+        save_results(results if isinstance(results, list) else [results], args.output, args.experiment)
 
 
 def cmd_plot(args):
@@ -105,24 +148,20 @@ def cmd_plot(args):
         # 生成演示图
         demo_figure3()
     elif args.results:
-        # 从结果文件生成图
-        import csv
-        results = []
-        with open(args.results, 'r') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                # 转换所有数值字段
-                row['alpha'] = float(row['alpha'])
-                row['relative_gain'] = float(row.get('relative_gain', row.get('mean_reward_fraction', row.get('avg_reward_per_step', 0))))
-                row['std_reward'] = float(row.get('std_reward', 0))
-                row['n_episodes'] = int(float(row.get('n_episodes', 100)))
-                row['mean_reward'] = float(row.get('mean_reward', 0))
-                results.append(row)
+        # 从结果库（按实验名）或结果 CSV 生成图
+        from src.agents.results_store import load_experiment
+        results = load_experiment(args.results)
+        for row in results:
+            row['relative_gain'] = float(row.get('relative_gain') or row.get('mean_reward_fraction') or row.get('avg_reward_per_step') or 0)
+            row['std_reward'] = float(row.get('std_reward') or 0)
+            row['n_episodes'] = int(row.get('n_episodes') or 100)
+            row['mean_reward'] = float(row.get('mean_reward') or 0)
         
         plot_figure3(
             results=results,
             title=args.title or "Selfish Mining Results",
-            output_path=args.output or "./results/figure3.png"
+            output_path=args.output or "./results/figure3.png",
+            show_optimal=args.optimal
         )
     else:
         print("请指定 --demo 或 --results 参数")
@@ -140,25 +179,12 @@ def cmd_compare(args):
     bitcoin_results = None
     ghost_results = None
     
+    from src.agents.results_store import load_experiment
     if args.bitcoin_results:
-        import csv
-        bitcoin_results = []
-        with open(args.bitcoin_results, 'r') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                row['alpha'] = float(row['alpha'])
-                row['relative_gain'] = float(row.get('relative_gain', 0))
-                bitcoin_results.append(row)
+        bitcoin_results = load_experiment(args.bitcoin_results)
     
     if args.ghost_results:
-        import csv
-        ghost_results = []
-        with open(args.ghost_results, 'r') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                row['alpha'] = float(row['alpha'])
-                row['relative_gain'] = float(row.get('relative_gain', 0))
-                ghost_results.append(row)
+        ghost_results = load_experiment(args.ghost_results)
     
     # 如果没有真实数据，使用理论值
     if bitcoin_results is None:
@@ -177,6 +203,137 @@ def cmd_compare(args):
     )
 
 
+def cmd_atlas(args):
+    """最优策略图谱命令"""
+    import numpy as np
+    from src.environment.mdp_atlas import build_atlas
+    
+    print(f"\n{'='*60}")
+    print("SquirRL-Auditor: 最优策略图谱")
+    print(f"{'='*60}")
+    
+    # 网格以 (起点, 终点, 点数) 给出
+    alphas = np.linspace(args.alphas[0], args.alphas[1], int(args.alphas[2]))
+    gammas = np.linspace(args.gammas[0], args.gammas[1], int(args.gammas[2]))
+    stale_rates = args.stale_rates if args.stale_rates else [0.0]
+    
+    build_atlas(
+        protocol=args.protocol,
+        alphas=alphas,
+        gammas=gammas,
+        stale_rates=stale_rates,
+        max_hidden_block=args.max_hidden_block,
+        n_workers=args.workers,
+        output_path=args.output
+    )
+
+
+def cmd_threshold(args):
+    """盈利阈值命令"""
+    import csv
+    import numpy as np
+    from src.environment.mdp_threshold import threshold_curve
+    
+    print(f"\n{'='*60}")
+    print("SquirRL-Auditor: 最小盈利算力阈值")
+    print(f"{'='*60}")
+    
+    gammas = np.linspace(args.gammas[0], args.gammas[1], int(args.gammas[2]))
+    gammas, thresholds = threshold_curve(
+        protocol=args.protocol,
+        gammas=gammas,
+        stale_rate=args.stale_rate,
+        max_hidden_block=args.max_hidden_block,
+        alpha_tol=args.alpha_tol,
+        n_workers=args.workers
+    )
+    
+    print(f"\n{'gamma':>8} {'alpha 阈值':>12}")
+    print("-" * 24)
+    for gamma, threshold in zip(gammas, thresholds):
+        print(f"{gamma:>8.3f} {threshold:>12.4f}")
+    
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['protocol', 'stale_rate', 'gamma', 'threshold'])
+            for gamma, threshold in zip(gammas, thresholds):
+                writer.writerow([args.protocol, args.stale_rate, gamma, threshold])
+        print(f"\n结果已保存到: {args.output}")
+
+
+def cmd_export(args):
+    """导出推理权重命令"""
+    from src.agents.numpy_policy import export_models
+    
+    print(f"\n{'='*60}")
+    print("SquirRL-Auditor: 导出 NumPy 推理权重")
+    print(f"{'='*60}")
+    
+    exported = export_models(args.paths, table=args.table, store_q=args.store_q)
+    print(f"\n共导出 {len(exported)} 个模型")
+
+
+def cmd_models(args):
+    """查询模型索引命令"""
+    from src.agents.model_registry import get_registry
+    
+    registry = get_registry(args.models_dir)
+    if args.rescan:
+        added = registry.rescan()
+        print(f"补登记 {added} 个模型")
+    
+    entries = registry.query(args.protocol, args.alpha, args.gamma, args.utb_ratio, args.kind)
+    print(f"\n{'协议':<10}{'alpha':>7}{'gamma':>7}{'UTB':>7}  {'类型':<6}{'步数':>10}{'评估得分':>12}  路径")
+    print("-" * 100)
+    for e in entries:
+        utb = f"{e['utb_ratio']:.2f}" if e['utb_ratio'] is not None else '-'
+        steps = e['timesteps'] if e['timesteps'] is not None else '-'
+        score = f"{e['eval_score']:.2f}" if e['eval_score'] is not None else '-'
+        print(f"{e['protocol']:<10}{e['alpha']:>7.2f}{e['gamma']:>7.2f}{utb:>7}  {e['kind']:<6}{steps:>10}{score:>12}  "
+              f"{os.path.relpath(e['path'], registry.models_dir)}")
+    print(f"\n共 {len(entries)} 个模型")
+
+
+def cmd_benchmark(args):
+    """吞吐量基准测试命令"""
+    from src.utils.benchmark import (run_benchmarks, save_benchmark, load_benchmark, compare_benchmarks,
+                                     GROUPS, DEFAULT_OUTPUT, DEFAULT_BASELINE)
+    
+    print(f"\n{'='*60}")
+    print("SquirRL-Auditor: 吞吐量基准测试")
+    print(f"{'='*60}")
+    
+    args.output = args.output or DEFAULT_OUTPUT
+    args.baseline = args.baseline or DEFAULT_BASELINE
+    results = run_benchmarks(groups=args.groups or GROUPS, quick=args.quick, model_path=args.model)
+    save_benchmark(results, args.output)
+    print(f"\n结果已保存: {args.output}")
+    
+    if args.save_baseline:
+        save_benchmark(results, args.baseline)
+        print(f"基线已更新: {args.baseline}")
+        return
+    
+    baseline = load_benchmark(args.baseline)
+    rows = compare_benchmarks(results, baseline, args.tolerance)
+    if not rows:
+        print(f"没有可比较的基线: {args.baseline}（用 --save-baseline 生成）")
+        return
+    print(f"\n与基线比较（容差 {args.tolerance:.0%}）:")
+    print(f"{'指标':<36}{'基线':>14}{'当前':>14}{'比值':>8}")
+    print("-" * 72)
+    for r in rows:
+        flag = '  <-- 退化' if r['regressed'] else ''
+        print(f"{r['name']:<36}{r['baseline']:>14.6g}{r['current']:>14.6g}{r['ratio']:>8.2f}{flag}")
+    regressions = [r['name'] for r in rows if r['regressed']]
+    if regressions:
+        print(f"\n[FAIL] {len(regressions)} 项性能退化: {', '.join(regressions)}")
+        sys.exit(1)
+    print("\n[OK] 没有性能退化")
+
+
 def cmd_info(args):
     """显示环境信息"""
     print(f"\n{'='*60}")
@@ -217,9 +374,33 @@ def main():
   评估模型:
     python -m src.cli evaluate ./models/bitcoin_model.zip --alpha 0.35
   
+  用 (a, b, 状态) 特征作为观察训练（比状态索引的 one-hot 小得多）:
+    python -m src.cli train --protocol bitcoin --alpha 0.35 --encoding features
+  
+  序贯评估，相对奖励 95% 置信区间半宽达到 0.005 即停止（最多 200 个 episode）:
+    python -m src.cli evaluate ./models/bitcoin_model.zip --alpha 0.35 --target-ci 0.005 --episodes 200
+  
+  稳态评估：4 条长链不重置，按再生周期估计相对奖励，半宽达到 0.002 即停止:
+    python -m src.cli evaluate ./models/bitcoin_model.zip --alpha 0.35 --steady-state regenerative --target-ci 0.002
+  
   生成演示图:
     python -m src.cli plot --demo
   
+  求解最优策略图谱（供 Streamlit 页面使用）:
+    python -m src.cli atlas --protocol bitcoin
+  
+  求 gamma 从 0 到 1 的最小盈利 alpha 曲线:
+    python -m src.cli threshold --protocol bitcoin --gammas 0 1 21
+  
+  导出模型权重，评估时不再需要 torch（--table 编译查找表，每次决策只需一次数组索引）:
+    python -m src.cli export ./models --table
+  
+  查询模型索引（--rescan 补登记手动放入的模型）:
+    python -m src.cli models --protocol ethereum --alpha 0.35
+  
+  吞吐量基准测试，与 results/benchmark_baseline.json 比较，有退化时返回非零退出码:
+    python -m src.cli benchmark --quick
+  
   查看环境信息:
     python -m src.cli info
         """
@@ -238,10 +419,17 @@ def main():
                               help='跟随者比例 (default: 0.5)')
     train_parser.add_argument('--utb-ratio', type=float, default=0.5,
                               help='UTB叔块奖励比率 (仅UTB协议, default: 0.5)')
+    train_parser.add_argument('--encoding', type=str, default='index',
+                              choices=['index', 'onehot', 'features', 'lead'],
+                              help='观察编码 (仅bitcoin协议, default: index)')
     train_parser.add_argument('--timesteps', type=int, default=100000,
                               help='训练步数 (default: 100000)')
     train_parser.add_argument('--lr', type=float, default=1e-4,
                               help='学习率 (default: 1e-4)')
+    train_parser.add_argument('--buffer-size', type=int, default=50000,
+                              help='经验回放缓冲区大小 (default: 50000)')
+    train_parser.add_argument('--compact-replay', action='store_true',
+                              help='以码字紧凑保存回放缓冲区中的观察（只适合 alpha 不随机波动的配置）')
     train_parser.add_argument('--output', type=str, default='./models',
                               help='模型保存路径 (default: ./models)')
     train_parser.add_argument('--log-path', type=str, default='./logs',
@@ -264,14 +452,38 @@ def main():
                              help='跟随者比例')
     eval_parser.add_argument('--utb-ratio', type=float, default=0.5,
                              help='UTB叔块奖励比率 (仅UTB协议)')
+    eval_parser.add_argument('--encoding', type=str, default='index',
+                             choices=['index', 'onehot', 'features', 'lead'],
+                             help='观察编码，需与模型训练时一致 (仅bitcoin协议)')
     eval_parser.add_argument('--episodes', type=int, default=100,
                              help='评估的episode数量')
     eval_parser.add_argument('--multi-alpha', action='store_true',
                              help='评估多个alpha值')
     eval_parser.add_argument('--alphas', type=float, nargs='+',
                              help='要评估的alpha值列表')
+    eval_parser.add_argument('--target-ci', type=float, default=None,
+                             help='序贯评估：相对奖励置信区间的目标半宽，达到后提前停止（--episodes 为上限）')
+    eval_parser.add_argument('--confidence', type=float, default=0.95,
+                             help='置信水平 (default: 0.95)')
+    eval_parser.add_argument('--ci-batch', type=int, default=10,
+                             help='序贯评估每批的episode数 (default: 10)')
+    eval_parser.add_argument('--event-seed', type=int, default=None,
+                             help='公共随机数种子：相同种子的评估重放同一组挖矿事件，便于配对比较模型')
+    eval_parser.add_argument('--steady-state', type=str, default=None,
+                             choices=['regenerative', 'batch_means'],
+                             help='稳态评估：长链不重置，按再生周期或批均值估计相对奖励（--target-ci 默认 0.002）')
+    eval_parser.add_argument('--chains', type=int, default=4,
+                             help='稳态评估并行的链数 (default: 4)')
+    eval_parser.add_argument('--max-steps', type=int, default=1000000,
+                             help='稳态评估每条链的最大步数 (default: 1000000)')
+    eval_parser.add_argument('--seed', type=int, default=None,
+                             help='随机种子')
+    eval_parser.add_argument('--no-cache', action='store_true',
+                             help='不使用评估结果缓存，重新评估（未指定 --seed 时总是重新评估）')
     eval_parser.add_argument('--output', type=str, default='./results/evaluation.csv',
-                             help='结果输出路径')
+                             help='结果 CSV 快照路径，结果同时追加到 results/results.sqlite')
+    eval_parser.add_argument('--experiment', type=str, default=None,
+                             help='结果库中的实验名 (default: CSV 文件名)')
     eval_parser.add_argument('--verbose', type=int, default=1,
                              help='详细程度')
     
@@ -280,23 +492,109 @@ def main():
     plot_parser.add_argument('--demo', action='store_true',
                              help='生成演示图')
     plot_parser.add_argument('--results', type=str,
-                             help='评估结果CSV文件')
+                             help='实验名或评估结果CSV文件（优先从结果库读取）')
     plot_parser.add_argument('--title', type=str,
                              help='图表标题')
     plot_parser.add_argument('--output', type=str,
                              help='输出文件路径')
+    plot_parser.add_argument('--optimal', action='store_true',
+                             help='叠加精确最优自私挖矿曲线（使用 MDP 缓存）')
     
     # ========== compare 命令 ==========
     compare_parser = subparsers.add_parser('compare', help='比较不同协议')
     compare_parser.add_argument('--bitcoin-results', type=str,
-                                help='Bitcoin评估结果文件')
+                                help='Bitcoin实验名或评估结果文件')
     compare_parser.add_argument('--ghost-results', type=str,
-                                help='GHOST评估结果文件')
+                                help='GHOST实验名或评估结果文件')
     compare_parser.add_argument('--title', type=str,
                                 help='图表标题')
     compare_parser.add_argument('--output', type=str,
                                 help='输出文件路径')
     
+    # ========== atlas 命令 ==========
+    atlas_parser = subparsers.add_parser('atlas', help='并行求解参数网格上的精确最优策略')
+    atlas_parser.add_argument('--protocol', type=str, default='bitcoin',
+                              choices=['bitcoin', 'ghost', 'ethereum'],
+                              help='区块链协议 (default: bitcoin)')
+    atlas_parser.add_argument('--alphas', type=float, nargs=3, default=[0.1, 0.49, 50],
+                              metavar=('START', 'STOP', 'NUM'),
+                              help='alpha 网格 (default: 0.1 0.49 50)')
+    atlas_parser.add_argument('--gammas', type=float, nargs=3, default=[0.0, 1.0, 50],
+                              metavar=('START', 'STOP', 'NUM'),
+                              help='gamma 网格 (default: 0 1 50)')
+    atlas_parser.add_argument('--stale-rates', type=float, nargs='+',
+                              help='陈旧区块率列表 (default: 0)')
+    atlas_parser.add_argument('--max-hidden-block', type=int, default=None,
+                              help='最大隐藏区块数 (default: 按协议选择)')
+    atlas_parser.add_argument('--workers', type=int, default=None,
+                              help='进程数 (default: CPU 核数)')
+    atlas_parser.add_argument('--output', type=str, default=None,
+                              help='输出路径 (default: results/atlas/<protocol>.npz)')
+    
+    # ========== threshold 命令 ==========
+    threshold_parser = subparsers.add_parser('threshold', help='求解各 gamma 下的最小盈利算力')
+    threshold_parser.add_argument('--protocol', type=str, default='bitcoin',
+                                  choices=['bitcoin', 'ghost', 'ethereum'],
+                                  help='区块链协议 (default: bitcoin)')
+    threshold_parser.add_argument('--gammas', type=float, nargs=3, default=[0.0, 1.0, 21],
+                                  metavar=('START', 'STOP', 'NUM'),
+                                  help='gamma 网格 (default: 0 1 21)')
+    threshold_parser.add_argument('--stale-rate', type=float, default=0.0,
+                                  help='陈旧区块率 (default: 0)')
+    threshold_parser.add_argument('--max-hidden-block', type=int, default=None,
+                                  help='最大隐藏区块数 (default: 按协议选择)')
+    threshold_parser.add_argument('--alpha-tol', type=float, default=1e-3,
+                                  help='阈值精度 (default: 0.001)')
+    threshold_parser.add_argument('--workers', type=int, default=None,
+                                  help='进程数 (default: CPU 核数)')
+    threshold_parser.add_argument('--output', type=str, default=None,
+                                  help='CSV 输出路径')
+    
+    # ========== export 命令 ==========
+    export_parser = subparsers.add_parser('export', help='导出纯 NumPy 推理用的模型权重 (.npz)')
+    export_parser.add_argument('paths', type=str, nargs='*', default=['./models'],
+                               help='模型文件或目录 (default: ./models)')
+    export_parser.add_argument('--table', action='store_true',
+                               help='Discrete 观察空间的模型同时编译为状态 -> 动作查找表')
+    export_parser.add_argument('--store-q', action='store_true',
+                               help='查找表中同时保存每个状态的 Q 值')
+    
+    # ========== models 命令 ==========
+    models_parser = subparsers.add_parser('models', help='查询模型索引')
+    models_parser.add_argument('--models-dir', type=str, default='./models',
+                               help='模型目录 (default: ./models)')
+    models_parser.add_argument('--protocol', type=str, default=None,
+                               choices=['bitcoin', 'ghost', 'ethereum', 'utb'],
+                               help='按协议筛选')
+    models_parser.add_argument('--alpha', type=float, default=None,
+                               help='按攻击者算力筛选')
+    models_parser.add_argument('--gamma', type=float, default=None,
+                               help='按跟随者比例筛选')
+    models_parser.add_argument('--utb-ratio', type=float, default=None,
+                               help='按 UTB 比率筛选')
+    models_parser.add_argument('--kind', type=str, default=None, choices=['final', 'best'],
+                               help='按模型类型筛选')
+    models_parser.add_argument('--rescan', action='store_true',
+                               help='扫描模型目录，补登记尚未登记的模型')
+    
+    # ========== benchmark 命令 ==========
+    bench_parser = subparsers.add_parser('benchmark', help='吞吐量基准测试，与保存的基线比较')
+    bench_parser.add_argument('--groups', type=str, nargs='+', default=None,
+                              choices=['env', 'sim', 'construct', 'solver', 'evaluate'],
+                              help='要运行的组 (默认: 全部)')
+    bench_parser.add_argument('--quick', action='store_true',
+                              help='使用较小的测量规模（约半分钟）')
+    bench_parser.add_argument('--model', type=str, default=None,
+                              help='评估基准使用的模型 (默认: 模型索引中 alpha=0.35 的最佳 Bitcoin 模型)')
+    bench_parser.add_argument('--output', type=str, default=None,
+                              help='结果 JSON 路径 (默认: results/benchmark.json)')
+    bench_parser.add_argument('--baseline', type=str, default=None,
+                              help='基线 JSON 路径 (默认: results/benchmark_baseline.json)')
+    bench_parser.add_argument('--save-baseline', action='store_true',
+                              help='把本次结果保存为基线，不做比较')
+    bench_parser.add_argument('--tolerance', type=float, default=0.3,
+                              help='允许的相对变化，超出即视为退化 (默认: 0.3)')
+    
     # ========== info 命令 ==========
     info_parser = subparsers.add_parser('info', help='显示环境信息')
     
@@ -316,6 +614,16 @@ def main():
         cmd_plot(args)
     elif args.command == 'compare':
         cmd_compare(args)
+    elif args.command == 'atlas':
+        cmd_atlas(args)
+    elif args.command == 'threshold':
+        cmd_threshold(args)
+    elif args.command == 'export':
+        cmd_export(args)
+    elif args.command == 'models':
+        cmd_models(args)
+    elif args.command == 'benchmark':
+        cmd_benchmark(args)
     elif args.command == 'info':
         cmd_info(args)
     else:
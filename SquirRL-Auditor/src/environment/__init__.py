@@ -1,5 +1,18 @@
 # Environment Package
-from .base_env import SM_env, SM_env_with_stale
+# 子模块按需导入：只用到模拟环境时不会加载 scipy 等 MDP 求解依赖
+import importlib
 
-__all__ = ['SM_env', 'SM_env_with_stale']
+_EXPORTS = {
+    'SM_env': 'base_env',
+    'SM_env_with_stale': 'base_env',
+    'SparseMDP': 'mdp_util',
+    'build_sparse_mdp': 'mdp_util',
+}
 
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name in _EXPORTS:
+        return getattr(importlib.import_module('.' + _EXPORTS[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
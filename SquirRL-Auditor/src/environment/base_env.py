@@ -1,10 +1,8 @@
 import numpy as np
 import copy as copy
-import matplotlib.pyplot as plt 
-import matplotlib.animation as animation
-import mdptoolbox
-from . import markov_util  # 相对导入
-from scipy.stats import truncnorm
+from collections import namedtuple
+# mdptoolbox / scipy and the MDP modules (mdp_util, mdp_cache) are imported inside
+# the MDP methods: simulation-only users (gym wrappers, RL workers) never load them
 
 def Normalize(v):
     norm = 0
@@ -16,12 +14,134 @@ def Normalize(v):
         v[i] /= norm
     return v
 
+def set_event_stream(env, uniforms):
+    """
+    Replay a pre-generated stream of U(0, 1) draws as the mining events of the next steps.
+
+    Step t uses uniforms[t] whether or not it has more than one outcome, so two policies
+    replaying the same stream see the same event at the same step (common random numbers).
+    Pass None to go back to np.random.
+    """
+    env._event_stream = None if uniforms is None else np.asarray(uniforms, dtype=np.float64)
+    env._event_index = 0
+
+
+def settled_rewards(env):
+    """
+    Cumulative (attacker, honest) rewards settled so far by a simulator.
+
+    Block counts for the SM_env family, uncle-inclusive gains for eth_env.
+    """
+    if hasattr(env, '_attack_block'):
+        return env._attack_block, env._honest_block
+    return env._attacker_gain, env._honest_gain
+
+
+def sample_event(env, probabilities, move = True):
+    # Outcome index drawn from the env's event stream if one is set, else from np.random.
+    # Inverse-CDF sampling (first outcome whose cumulative probability exceeds u) matches
+    # np.random.choice for the same uniform; the lists are short, so a plain loop beats np.cumsum.
+    stream = getattr(env, '_event_stream', None)
+    if (stream is None):
+        if (len(probabilities) == 1):
+            return 0
+        return np.random.choice(len(probabilities), p = probabilities)
+    u = stream[env._event_index % len(stream)]
+    if (move == True):
+        env._event_index += 1
+    total = 0.0
+    for i, p in enumerate(probabilities):
+        total += p
+        if (u < total):
+            return i
+    return len(probabilities) - 1
+
+
+# Snapshot of a simulator taken by get_state :
+#   values  : the attributes listed in the class's _snapshot_attrs (numpy arrays are read-only copies)
+#   process : the same for the alpha random process
+#   events  : (event stream, position) when a common-random-number stream is set, else None
+#   rng     : np.random.get_state() if requested, else None
+EnvSnapshot = namedtuple('EnvSnapshot', ['values', 'process', 'events', 'rng'])
+
+
+def _frozen(value):
+    if isinstance(value, np.ndarray):
+        value = value.copy()
+        value.setflags(write = False)
+    return value
+
+
+def _thawed(value):
+    return value.copy() if isinstance(value, np.ndarray) else value
+
+
+class Snapshotable:
+    """
+    get_state / set_state for the simulators.
+
+    Each class lists in _snapshot_attrs the attributes that reset / step change; a snapshot
+    holds exactly those (plus the random process, event stream position and optionally the
+    global numpy RNG), so branching a rollout from any state does not need a deepcopy.
+    The environment must have been reset before get_state is called.
+    """
+
+    _snapshot_attrs = ()
+
+    def get_state(self, rng = True):
+        process = getattr(self, '_random_process', None)
+        stream = getattr(self, '_event_stream', None)
+        if (rng == True):
+            rng_state = np.random.get_state()
+            rng_state[1].setflags(write = False)
+        else:
+            rng_state = None
+        return EnvSnapshot(
+            tuple(_frozen(getattr(self, name)) for name in self._snapshot_attrs),
+            None if process is None else tuple(getattr(process, name) for name in process._snapshot_attrs),
+            None if stream is None else (stream, self._event_index),
+            rng_state,
+        )
+
+    def set_state(self, snapshot):
+        for name, value in zip(self._snapshot_attrs, snapshot.values):
+            setattr(self, name, _thawed(value))
+        if (snapshot.process is not None):
+            for name, value in zip(self._random_process._snapshot_attrs, snapshot.process):
+                setattr(self._random_process, name, value)
+        if (snapshot.events is None):
+            self._event_stream = None
+        else:
+            self._event_stream, self._event_index = snapshot.events
+        if (snapshot.rng is not None):
+            np.random.set_state(snapshot.rng)
+
+
 def random_normal_trunc(mean, dev, low, up):
+    # scalar clip with min / max : np.clip costs more than the draw itself
     x = np.random.normal(mean, dev)
-    return np.clip(x, low, up)
+    return float(min(max(x, low), up))
+
+
+# expected_alpha : mean of the truncated alpha distribution, estimated from 1M samples.
+# The estimate only depends on the parameters, so it is computed once per process for
+# each (mean, dev, low, up) and every environment built with them reuses it.
+# The samples come from a fixed-seed private generator, not the global np.random stream :
+# building an environment never consumes global draws, so a seeded run sees the same
+# sequence whether or not the estimate was already memoised.
+_expected_alphas = {}
+
+def expected_alpha(mean, dev, low, up):
+    key = (mean, dev, low, up)
+    if (key not in _expected_alphas):
+        samples = np.random.RandomState(0).normal(mean, dev, 1000000)
+        _expected_alphas[key] = float(np.clip(samples, low, up).mean())
+    return _expected_alphas[key]
 
 class alpha_random_process:
 
+    _snapshot_attrs = ('_attacker', '_other')
+
     def __init__(self, alpha, dev, interval, name = "iid"):
         self._attacker_start = alpha
         self._attacker = alpha
@@ -60,6 +180,9 @@ class alpha_random_process:
         return self._attacker / (self._attacker + self._other)
 
 class real_alpha_process:
+
+    _snapshot_attrs = ('_alpha', '_pointer')
+
     def __init__(self, alpha, interval, array):
         self._start_alpha = alpha
         self._alpha = alpha
@@ -90,7 +213,12 @@ class real_alpha_process:
     def get_total(self):
         return self._array[self._pointer]
 
-class SM_env:
+# max_hidden_block -> SM_env legal action mask table
+_legal_mask_tables = {}
+
+class SM_env(Snapshotable):
+
+    _snapshot_attrs = ('_current_state', '_accumulated_steps', '_current_alpha', '_attack_block', '_honest_block')
 
     # max_hidden_block : limit the max hidden block of attacker
     # attacker_fraction : usually denoted as alpha, the hash power of the attacker against the whole network
@@ -127,6 +255,7 @@ class SM_env:
         self._action_space_n = 3
         self._state_vector_n = 3
         self._matrix_init = False
+        self._legal_mask_table = None
         self._frequency = frequency
         self._dev = dev
         #self._current_alpha = random_normal_trunc(self._alpha, self._dev, 0, 1)
@@ -137,13 +266,7 @@ class SM_env:
 
         self._current_alpha = self._random_process.get()
 
-        rept = 1000000
-        alpha = 0.0
-        for i in range(rept):
-            a = random_normal_trunc(self._alpha, self._dev, random_interval[0], random_interval[1])
-            alpha += a
-        alpha /= rept
-        self._expected_alpha = alpha
+        self._expected_alpha = expected_alpha(self._alpha, self._dev, random_interval[0], random_interval[1])
 
         #self._attacker_block_reward = 1 - attacker_fraction
         #self._honest_block_reward = - attacker_fraction
@@ -276,257 +399,140 @@ class SM_env:
     #1 : override the public fork
     #2 : wait and mine on private fork
 
-    #mapping = True : map illegal move to a legal one
-
-    def unmapped_step(self, idx, action, move = True):
+    # transitions : the pure transition function of the environment.
+    # input a state index and an action, return all outcomes as a list of
+    # (probability, next state index, attacker blocks, honest blocks).
+    # An empty list means 'action' is an illegal move.
+    # The simulator (unmapped_step) and the MDP builder (mdp_util) both use it.
+    def transitions(self, idx, action, alpha = None):
 
         a, b, status = self._index_to_name(idx)
 
-        reward = -10000000 # if reward remains no change, then it means 'action' is an illegal move
+        if (alpha is None):
+            alpha = self._current_alpha
+        gamma = self._gamma
+        m = self._max_hidden_block
+        sd = self._state_dict
 
-        next_a = a
-        next_b = b
-        next_status = status
+        outcomes = []
 
-        #alpha = np.random.normal(self._alpha, self._dev)
-        alpha = self._current_alpha
-        gamma = self._gamma
+        # attacker mines a block / honest miner mines a block
+        def wait(catch_up = False):
+            if (catch_up == True and a + 1 == b):
+                outcomes.append((alpha, sd[(a + 1, b, "catch up")], 0, 0))
+            else:
+                outcomes.append((alpha, sd[(a + 1, b, "normal")], 0, 0))
+            outcomes.append((1 - alpha, sd[(a, b + 1, "normal")], 0, 0))
+
+        # wait, 3 fork possibilities : attacker / follower / unfollower mines a block
+        def fork_wait():
+            outcomes.append((alpha, sd[(a + 1, b, "forking")], 0, 0))
+            outcomes.append(((1 - alpha) * gamma, sd[(a - b, 1, "normal")], b, 0))
+            outcomes.append(((1 - alpha) * (1 - gamma), sd[(a, b + 1, "normal")], 0, 0))
+
+        # override, publish (b + 1) blocks
+        def override():
+            outcomes.append((1, sd[(a - b - 1, 0, "normal")], b + 1, 0))
 
         # out of bound..force to override
-        if (a == self._max_hidden_block + 1 and b < a):
-            #override, publish (b + 1) blocks
-            if (action == 1):
-                reward = (b + 1) * self._attacker_block_reward
-                next_a = a - b - 1
-                next_b = 0
-                next_status = "normal"
+        if (a == m + 1 and b < a):
+            if (action == 1): override()
 
         # out of bound... force to give up
-        elif (b == self._max_hidden_block + 1 and a < b):
+        elif (b == m + 1 and a < b):
             #match -- abandon, accept b blocks
-            if (action == 0):
-                reward = b * self._honest_block_reward
-                next_a = 0
-                next_b = 0
-                next_status = "normal"
+            if (action == 0): outcomes.append((1, sd[(0, 0, "normal")], 0, b))
+
         elif (a < b):
             # attacker abandons his private fork
-            if (action == 0):
-                reward = b * self._honest_block_reward
-                next_a = 0
-                next_b = 0
-                next_status = "normal"
-            if (action == 2):
-                event = np.random.choice(2, p = [alpha, 1 - alpha])
-                # attacker mines a block
-                if (event == 0):
-                    reward = 0
-                    next_a = a + 1
-                    next_b = b
-                    if (next_a == next_b):
-                        next_status = "catch up"
-                    else:
-                        next_status = "normal"
-                # honest miner mines a block
-                if (event == 1):
-                    reward = 0
-                    next_a = a
-                    next_b = b + 1
-                    next_status = "normal"
+            if (action == 0): outcomes.append((1, sd[(0, 0, "normal")], 0, b))
+            if (action == 2): wait(catch_up = True)
 
         elif (a == b and a == 0):
-            if (action == 2):
-                event = np.random.choice(2, p = [alpha, 1 - alpha])
-                # attacker mines a block
-                if (event == 0):
-                    reward = 0
-                    next_a = a + 1
-                    next_b = b
-                    next_status = "normal"
-                # honest miner mines a block
-                if (event == 1):
-                    reward = 0
-                    next_a = 0
-                    next_b = 1
-                    next_status = "normal"
+            if (action == 2): wait()
 
         elif (a == b and status == "normal"):
             # attacker publishes all block and matches
-            if (action == 0):
-                reward = 0
-                next_a = a
-                next_b = b
-                next_status = "forking"
-            # wait
-            if (action == 2):
-                event = np.random.choice(2, p = [alpha, 1 - alpha])
-                # attacker mines a block
-                if (event == 0):
-                    reward = 0
-                    next_a = a + 1
-                    next_b = b
-                    next_status = "normal"
-                # honest miner mines a block
-                if (event == 1):
-                    reward = 0
-                    next_a = a
-                    next_b = b + 1
-                    next_status = "normal"
+            if (action == 0): outcomes.append((1, sd[(a, b, "forking")], 0, 0))
+            if (action == 2): wait()
 
         elif (a == b and status == "catch up"):
             # in this situation, the attacker cannot match!
-            # wait
-            if (action == 2):
-                event = np.random.choice(2, p = [alpha, 1 - alpha])
-                # attacker mines a block
-                if (event == 0):
-                    reward = 0
-                    next_a = a + 1
-                    next_b = b
-                    next_status = "normal"
-                # honest miner mines a block
-                if (event == 1):
-                    reward = 0
-                    next_a = a
-                    next_b = b + 1
-                    next_status = "normal"
+            if (action == 2): wait()
 
         elif (a == b and status == "forking"):
-            # wait, 3 fork possibilities
-            if (action == 2):
-                event = np.random.choice(3, p = [alpha, (1 - alpha) * gamma, (1 - alpha) * (1 - gamma)])
-                # attacker mines a block
-                if (event == 0):
-                    reward = 0
-                    next_a = a + 1
-                    next_b = b
-                    next_status = "forking"
-                # follower mines a block
-                if (event == 1):
-                    reward = b * self._attacker_block_reward
-                    next_a = a - b
-                    next_b = 1
-                    next_status = "normal"
-                # unfollower mines a block
-                if (event == 2):
-                    reward = 0
-                    next_a = a
-                    next_b = b + 1
-                    next_status = "normal"
+            if (action == 2): fork_wait()
 
         elif (a > b and b == 0):
             # override, publish a block
-            if (action == 1):
-                reward = self._attacker_block_reward
-                next_a = a - 1
-                next_b = 0
-                next_status = "normal"
-            # wait
-            if (action == 2):
-                event = np.random.choice(2, p = [alpha, 1 - alpha])
-                # attacker mines a block
-                if (event == 0):
-                    reward = 0
-                    next_a = a + 1
-                    next_b = b
-                    next_status = "normal"
-                # honest miner mines a block
-                if (event == 1):
-                    reward = 0
-                    next_a = a
-                    next_b = b + 1
-                    next_status = "normal"
+            if (action == 1): override()
+            if (action == 2): wait()
 
         elif (a > b and b > 0 and status == "normal"):
             # match, publish b blocks
-            if (action == 0):
-                reward = 0
-                next_a = a
-                next_b = b
-                next_status = "forking"
-            # override, publish (b + 1) blocks
-            if (action == 1):
-                reward = (b + 1) * self._attacker_block_reward
-                next_a = a - b - 1
-                next_b = 0
-                next_status = "normal"
-            # wait
-            if (action == 2):
-                event = np.random.choice(2, p = [alpha, 1 - alpha])
-                # attacker mines a block
-                if (event == 0):
-                    reward = 0
-                    next_a = a + 1
-                    next_b = b
-                    next_status = "normal"
-                # honest miner mines a block
-                if (event == 1):
-                    reward = 0
-                    next_a = a
-                    next_b = b + 1
-                    next_status = "normal"
+            if (action == 0): outcomes.append((1, sd[(a, b, "forking")], 0, 0))
+            if (action == 1): override()
+            if (action == 2): wait()
 
         elif (a > b and b > 0 and status == "forking"):
             # don't need match...
-            # override, publish (b + 1) blocks
-            if (action == 1):
-                reward = (b + 1) * self._attacker_block_reward
-                next_a = a - b - 1
-                next_b = 0
-                next_status = "normal"
-            # wait, 3 fork possibilities
-            if (action == 2):
-                event = np.random.choice(3, p = [alpha, (1 - alpha) * gamma, (1 - alpha) * (1 - gamma)])
-                # attacker mines a block
-                if (event == 0):
-                    reward = 0
-                    next_a = a + 1
-                    next_b = b
-                    next_status = "forking"
-                    #next_status = "normal"
-                # follower mines a block
-                if (event == 1):
-                    reward = b * self._attacker_block_reward
-                    next_a = a - b
-                    next_b = 1
-                    next_status = "normal"
-                # unfollower mines a block
-                if (event == 2):
-                    reward = 0
-                    next_a = a
-                    next_b = b + 1
-                    #next_status = "forking"
-                    next_status = "normal"
-
-        next_state = self._state_dict[(next_a, next_b, next_status)]
+            if (action == 1): override()
+            if (action == 2): fork_wait()
+
+        return outcomes
+
+    #mapping = True : map illegal move to a legal one
+
+    def unmapped_step(self, idx, action, move = True):
+
+        outcomes = self.transitions(idx, action)
+
+        # no outcome, then it means 'action' is an illegal move
+        if (len(outcomes) == 0):
+            return self._current_state, -10000000, self._accumulated_steps > 1000000
+
+        event = sample_event(self, [o[0] for o in outcomes], move)
+        p, next_state, attacker_get, honest_get = outcomes[event]
+
+        reward = attacker_get * self._attacker_block_reward + honest_get * self._honest_block_reward
         reset_flag = False
 
-        if (move == True and reward > -100):
+        if (move == True):
             self._accumulated_steps += 1
             if (self._accumulated_steps % self._frequency == 0):
                 self._current_alpha = self._random_process.next()
-                '''
-                if (self._random_process == "iid") :
-                    self._current_alpha = random_normal_trunc(self._alpha, self._dev, self._random_interval[0], self._random_interval[1])
-                elif (self._random_process == "brown") :
-                    self._current_alpha = random_normal_trunc(self._current_alpha, self._dev, self._random_interval[0], self._random_interval[1])
-                '''
 
             self._current_state = next_state
-            if (abs(reward) > 0.005):
-                if (reward < 0):
-                    self._honest_block += reward / self._honest_block_reward
-                else:
-                    self._attack_block += reward / self._attacker_block_reward
+            self._attack_block += attacker_get
+            self._honest_block += honest_get
 
         if (self._accumulated_steps > 1000000):
             reset_flag = True
 
         return self._current_state, reward, reset_flag
 
+    # legal_action_mask : boolean array over actions, True for legal moves.
+    # Legality depends only on the state (not on alpha or gamma), so the masks of all
+    # states are computed once from transitions, cached as a read-only table and shared
+    # by every SM_env with the same max_hidden_block.
+    def legal_mask_table(self):
+        if (self._legal_mask_table is None):
+            table = _legal_mask_tables.get(self._max_hidden_block)
+            if (table is None):
+                table = np.zeros((self._state_space_n, self._action_space_n), dtype = bool)
+                for idx in range(self._state_space_n):
+                    for action in range(self._action_space_n):
+                        table[idx, action] = len(self.transitions(idx, action)) > 0
+                table.setflags(write = False)
+                _legal_mask_tables[self._max_hidden_block] = table
+            self._legal_mask_table = table
+        return self._legal_mask_table
+
+    def legal_action_mask(self, s):
+        return self.legal_mask_table()[s]
+
     def is_legal_move(self, s, a):
-        s1, r, d = self.unmapped_step(s, a, move = False)
-        return r > -100
+        return bool(self.legal_mask_table()[s, a])
 
     def legal_move_list(self, s):
         legal_move = []
@@ -596,12 +602,14 @@ class SM_env:
         return self.name_of_action(idx, a)
 
 
-    # add a transition to MDP matrices
-    def add_transition(self, a, s1, s2, p, r):
-        s1_idx = self._name_to_index(s1)
-        s2_idx = self._name_to_index(s2)
-        self.transition_matrix[a, s1_idx, s2_idx] = p
-        self.reward_matrix[a, s1_idx, s2_idx] = r
+    # build the sparse MDP from the transition function (cached)
+    # states are the indices of self._state_space
+    def get_sparse_MDP(self):
+        from . import mdp_cache
+        if (getattr(self, "_sparse_mdp", None) is None):
+            self._sparse_mdp = mdp_cache.load_or_build(self, self._alpha, states = range(self._state_space_n), \
+                                                       start = self._name_to_index((0, 0, "normal")))
+        return self._sparse_mdp
 
     # initialize necessary matrices for MDP solver
     # A : action space size
@@ -609,120 +617,9 @@ class SM_env:
     # transition_matrix : (A, S, S) , probability
     # reward_matrix : (A, S, S) , reward
     def MDP_matrix_init(self):
+        import mdptoolbox
         self._matrix_init = True
-        alpha = self._alpha
-        gamma = self._gamma
-        self.transition_matrix = np.zeros((self._action_space_n, self._state_space_n, self._state_space_n))
-        self.reward_matrix = np.zeros((self._action_space_n, self._state_space_n, self._state_space_n))
-        for action in range(self._action_space_n):
-            for s1 in range(0, self._state_space_n):
-
-                a, b, status = self._index_to_name(s1)
-
-                legal = False
-
-                # out of bound..force to override
-                if (a == self._max_hidden_block + 1 and b < a):
-                    #override, publish (b + 1) blocks
-                    if (action == 1):
-                        legal = True
-                        self.add_transition(action, (a, b, status), (a - b - 1, 0, "normal"), 1, (b + 1) * self._attacker_block_reward)
-
-                # out of bound... force to give up
-                elif (b == self._max_hidden_block + 1 and a < b):
-                    #match -- abandon, accept b blocks
-                    if (action == 0):
-                        legal = True
-                        self.add_transition(action, (a, b, status), (0, 0, "normal"), 1, b * self._honest_block_reward)
-                elif (a < b):
-                    # attacker abandons his private fork
-                    if (action == 0):
-                        legal = True
-                        self.add_transition(action, (a, b, status), (0, 0, "normal"), 1, b * self._honest_block_reward)
-                    if (action == 2):
-                        legal = True
-                        if (a + 1 == b):
-                            self.add_transition(action, (a, b, status), (a + 1, b, "catch up"), alpha, 0)
-                        else:
-                            self.add_transition(action, (a, b, status), (a + 1, b, "normal"), alpha, 0)
-
-                        self.add_transition(action, (a, b, status), (a, b + 1, "normal"), 1 - alpha, 0)
-
-                elif (a == b and a == 0):
-                    if (action == 2):
-                        legal = True
-                        self.add_transition(action, (a, b, status), (a + 1, b, "normal"), alpha, 0)
-                        self.add_transition(action, (a, b, status), (a, b + 1, "normal"), 1 - alpha, 0)
-
-                elif (a == b and status == "normal"):
-                    # attacker publishes all block and matches
-                    if (action == 0):
-                        legal = True
-                        self.add_transition(action, (a, b, status), (a, b, "forking"), 1, 0)
-                    # wait
-                    if (action == 2):
-                        legal = True
-                        self.add_transition(action, (a, b, status), (a + 1, b, "normal"), alpha, 0)
-                        self.add_transition(action, (a, b, status), (a, b + 1, "normal"), 1 - alpha, 0)
-
-                elif (a == b and status == "catch up"):
-                    # in this situation, the attacker cannot match!
-                    # wait
-                    if (action == 2):
-                        legal = True
-                        self.add_transition(action, (a, b, status), (a + 1, b, "normal"), alpha, 0)
-                        self.add_transition(action, (a, b, status), (a, b + 1, "normal"), 1 - alpha, 0)
-
-                elif (a == b and status == "forking"):
-                    # wait, 3 fork possibilities
-                    if (action == 2):
-                        legal = True
-                        self.add_transition(action, (a, b, status), (a + 1, b, "forking"), alpha, 0)
-                        self.add_transition(action, (a, b, status), (a - b, 1, "normal"), (1 - alpha) * gamma, b * self._attacker_block_reward)
-                        self.add_transition(action, (a, b, status), (a, b + 1, "normal"), (1 - alpha) * (1 - gamma), 0)
-
-                elif (a > b and b == 0):
-                    # override, publish a block
-                    if (action == 1):
-                        legal = True
-                        self.add_transition(action, (a, b, status), (a - 1, 0, "normal"), 1, self._attacker_block_reward)
-                    # wait
-                    if (action == 2):
-                        legal = True
-                        self.add_transition(action, (a, b, status), (a + 1, b, "normal"), alpha, 0)
-                        self.add_transition(action, (a, b, status), (a, b + 1, "normal"), 1 - alpha, 0)
-
-                elif (a > b and b > 0 and status == "normal"):
-                    # match, publish b blocks
-                    if (action == 0):
-                        legal = True
-                        self.add_transition(action, (a, b, status), (a, b, "forking"), 1, 0)
-                    # override, publish (b + 1) blocks
-                    if (action == 1):
-                        legal = True
-                        self.add_transition(action, (a, b, status), (a - b - 1, 0, "normal"), 1, (b + 1) * self._attacker_block_reward)
-                    # wait
-                    if (action == 2):
-                        legal = True
-                        self.add_transition(action, (a, b, status), (a + 1, b, "normal"), alpha, 0)
-                        self.add_transition(action, (a, b, status), (a, b + 1, "normal"), 1 - alpha, 0)
-
-                elif (a > b and b > 0 and status == "forking"):
-                    # don't need match...
-                    # override, publish (b + 1) blocks
-                    if (action == 1):
-                        legal = True
-                        self.add_transition(action, (a, b, status), (a - b - 1, 0, "normal"), 1, (b + 1) * self._attacker_block_reward)
-                    # wait, 3 fork possibilities
-                    if (action == 2):
-                        legal = True
-                        self.add_transition(action, (a, b, status), (a + 1, b, "forking"), alpha, 0)
-                        self.add_transition(action, (a, b, status), (a - b, 1, "normal"), (1 - alpha) * gamma, b * self._attacker_block_reward)
-                        self.add_transition(action, (a, b, status), (a, b + 1, "normal"), (1 - alpha) * (1 - gamma), 0)
-
-                if (legal == False):
-                    self.add_transition(action, (a, b, status), (a, b, status), 1, -1000000)
-
+        self.transition_matrix, self.reward_matrix = self.get_sparse_MDP().dense_matrices(- self._honest_block_reward)
         mdptoolbox.util.check(self.transition_matrix, self.reward_matrix)
 
     def get_MDP_matrix(self):
@@ -730,56 +627,34 @@ class SM_env:
         return self.transition_matrix, self.reward_matrix
 
     def theoretical_attacker_fraction(self, policy):
+        from . import mdp_cache
+        return mdp_cache.attacker_revenue(self.get_sparse_MDP(), policy)
+
+    # exact revenue of a fixed policy and its derivatives w.r.t. alpha and gamma
+    # return : (revenue, d revenue / d alpha, d revenue / d gamma)
+    def attacker_fraction_sensitivity(self, policy):
+        from . import mdp_util
+        return mdp_util.revenue_sensitivity(self, self.get_sparse_MDP(), policy, self._alpha)
 
-        trans, reward = self.get_MDP_matrix()
-        policy = np.array(policy, dtype = np.int32)
-        n = self._state_space_n
-        A = np.zeros((n, n))
-        R_attacker = np.zeros((n, n))
-        R_honest = np.zeros((n, n))
-        for i in range(n):
-            for j in range(n):
-                A[i, j] = trans[policy[i], i, j]
-                r = reward[policy[i], i, j]
-                if (r > 0) :
-                    R_attacker[i, j] = r * 1.0 / self._attacker_block_reward
-                elif (r < 0):
-                    R_honest[i, j] = r * 1.0 / self._honest_block_reward
-
-        #print(R_attacker)
-
-        r_attacker = markov_util.MRP_expected_reward(A, R_attacker)
-        r_honest = markov_util.MRP_expected_reward(A, R_honest)
-
-        return r_attacker / (r_attacker + r_honest)
-
-    # use binary search to find the best stategy
+    # use binary search to find the best stategy, the result is cached on disk (see mdp_cache)
     # it will fine-tune the reward function!
     def optimal_mdp_solver(self):
-        eps = 1e-4
-        low = self._alpha
-        high = 1
-        ret = np.zeros(self._state_space_n)
-        while (high - low > eps):
-            mid = (low + high) / 2
-
-            self._attacker_block_reward = 1 - mid
-            self._honest_block_reward = - mid
-            self.MDP_matrix_init()
-            P, R = self.get_MDP_matrix()
-            solver = mdptoolbox.mdp.PolicyIteration(P, R, 0.99)
-            solver.run()
-            if (solver.V[self._vector_to_index((0, 0, 0))] > -eps):
-                low = mid
-                ret = solver.policy
-                self._relative_p = mid
-            else:
-                high = mid
+        from . import mdp_cache
+        ret, low, revenue = mdp_cache.optimal_policy(self.get_sparse_MDP(), self._alpha)
+        if (low > self._alpha): self._relative_p = low
+
+        self._attacker_block_reward = 1 - low
+        self._honest_block_reward = - low
+        self._matrix_init = False
 
         print("alpha = ", self._alpha, "OSM = ", low)
         return ret
 
-class eth_env:
+class eth_env(Snapshotable):
+
+    _snapshot_attrs = ('_current_state', '_accumulated_steps', '_current_alpha', '_attacker_gain', '_honest_gain',
+                       '_special_block', '_attacker_block', '_honest_block', '_aa_num', '_aa_distance',
+                       '_ha_num', '_ha_distance')
 
     # max_hidden_block : limit the max hidden block of attacker
     # attacker_fraction : usually denoted as alpha, the hash power of the attacker against the whole network
@@ -804,6 +679,7 @@ class eth_env:
         self._attacker_gain = 0
         self._honest_gain = 0
         self._action_space_n = 3
+        self._legal_masks = {}
         self._state_space_n = max_hidden_block * max_hidden_block * 2 * 2 * (3 ** 6)
         self._state_vector_n = 10
         self._current_state = (0, 0, 0, 0, 0, 0, 0, 0, 0, 0)
@@ -822,13 +698,7 @@ class eth_env:
         self._frequency = frequency
         #self._current_alpha = random_normal_trunc(self._alpha, self._dev, 0, 1)
 
-        rept = 1000000
-        alpha = 0.0
-        for i in range(rept):
-            a = random_normal_trunc(self._alpha, self._dev, random_interval[0], random_interval[1])
-            alpha += a
-        alpha /= rept
-        self._expected_alpha = alpha
+        self._expected_alpha = expected_alpha(self._alpha, self._dev, random_interval[0], random_interval[1])
 
     # no index representation...
 
@@ -865,280 +735,106 @@ class eth_env:
     # catch up : 1
     # forking : 2
 
-    def unmapped_step(self, s, action, move = True):
+    # _race_outcomes : the block race part of the transition function.
+    # return all outcomes as a list of
+    # (probability, next_a, next_b, next_status, attacker_get, honest_get).
+    # An empty list means 'action' is an illegal move.
+    def _race_outcomes(self, s, action, alpha):
 
         a, b, status = s[0 : 3]
 
-        next_a = a
-        next_b = b
-        next_status = status
-
-        alpha = self._current_alpha
         gamma = self._gamma
+        m = self._max_hidden_block
 
-        legal = False
-        max_uncle_block = 2
-        attacker_get = 0
-        attacker_uncle = 0
-        attacker_nephew = 0
-        honest_get = 0
-        honest_uncle = 0
-        honest_nephew = 0
+        outcomes = []
+
+        # attacker mines a block / honest miner mines a block
+        def wait():
+            outcomes.append((alpha, a + 1, b, 0, 0, 0))
+            outcomes.append((1 - alpha, a, b + 1, 0, 0, 0))
+
+        # wait, 3 fork possibilities : attacker / follower / unfollower mines a block
+        def fork_wait():
+            outcomes.append((alpha, a + 1, b, 2, 0, 0))
+            outcomes.append(((1 - alpha) * gamma, a - b, 1, 0, b, 0))
+            outcomes.append(((1 - alpha) * (1 - gamma), a, b + 1, 0, 0, 0))
+
+        # override, publish (b + 1) blocks
+        def override():
+            outcomes.append((1, a - b - 1, 0, 0, b + 1, 0))
+
+        # attacker abandons his private fork, accept b blocks
+        def abandon():
+            if (b > 100):
+                outcomes.append((1, 0, 1, 0, 0, b - 1))
+            else :
+                outcomes.append((1, 0, 0, 0, 0, b))
 
         # out of bound..force to override
-        if (a == self._max_hidden_block + 1 and b < a):
-            #override, publish (b + 1) blocks
-            if (action == 1):
-                #reward = (b + 1) * self._attacker_block_reward
-                attacker_get = b + 1
-                next_a = a - b - 1
-                next_b = 0
-                next_status = 0 # normal
-                legal = True
+        if (a == m + 1 and b < a):
+            if (action == 1): override()
 
         # out of bound... force to give up
-        elif (b == self._max_hidden_block + 1 and a < b):
-            #match -- abandon, accept b blocks
-            if (action == 0):
-                legal = True
-                #reward = b * self._honest_block_reward
-                if (b > 100):
-                    honest_get = b - 1
-                    next_a = 0
-                    next_b = 1
-                    next_status = 0 # normal
-                else :
-                    honest_get = b
-                    next_a = 0
-                    next_b = 0
-                    next_status = 0 # normal
+        elif (b == m + 1 and a < b):
+            if (action == 0): abandon()
 
         elif (a < b):
-            # attacker abandons his private fork
-            if (action == 0):
-                #reward = b * self._honest_block_reward
-                legal = True
-                if (b > 100):
-                    honest_get = b - 1
-                    next_a = 0
-                    next_b = 1
-                    next_status = 0 # normal
-                else :
-                    honest_get = b
-                    next_a = 0
-                    next_b = 0
-                    next_status = 0 # normal
-
-            if (action == 2):
-                legal = True
-                event = np.random.choice(2, p = [alpha, 1 - alpha])
-                # attacker mines a block
-                if (event == 0):
-                    #reward = 0
-                    next_a = a + 1
-                    next_b = b
-                    #if (next_a == next_b):
-                    #    next_status = 1 #"catch up"
-                    #else:
-                    next_status = 0 # "normal"
-                # honest miner mines a block
-                if (event == 1):
-                    #reward = 0
-                    next_a = a
-                    next_b = b + 1
-                    next_status = 0 #"normal"
+            if (action == 0): abandon()
+            if (action == 2): wait()
 
         elif (a == b and a == 0):
-            if (action == 2):
-                legal = True
-                event = np.random.choice(2, p = [alpha, 1 - alpha])
-                # attacker mines a block
-                if (event == 0):
-                    #reward = 0
-                    next_a = a + 1
-                    next_b = b
-                    next_status = 0 #"normal"
-                # honest miner mines a block
-                if (event == 1):
-                    #reward = 0
-                    next_a = 0
-                    next_b = 1
-                    next_status = 0 #"normal"
+            if (action == 2): wait()
 
         #elif (a == b and status == "normal"):
         elif (a == b and status == 0):
             # attacker publishes all block and matches
-            if (action == 0):
-                #print("match!")
-                legal = True
-                #reward = 0
-                next_a = a
-                next_b = b
-                next_status = 2 #"forking"
-            # wait
-            if (action == 2):
-                legal = True
-                event = np.random.choice(2, p = [alpha, 1 - alpha])
-                # attacker mines a block
-                if (event == 0):
-                    #reward = 0
-                    next_a = a + 1
-                    next_b = b
-                    next_status = 0 #"normal"
-                # honest miner mines a block
-                if (event == 1):
-                    #reward = 0
-                    next_a = a
-                    next_b = b + 1
-                    next_status = 0 #"normal"
+            if (action == 0): outcomes.append((1, a, b, 2, 0, 0))
+            if (action == 2): wait()
 
         #elif (a == b and status == "catch up"):
         elif (a == b and status == 1):
             # in this situation, the attacker cannot match!
-            # wait
-            if (action == 2):
-                legal = True
-                event = np.random.choice(2, p = [alpha, 1 - alpha])
-                # attacker mines a block
-                if (event == 0):
-                    #reward = 0
-                    next_a = a + 1
-                    next_b = b
-                    next_status = 0 #"normal"
-                # honest miner mines a block
-                if (event == 1):
-                    #reward = 0
-                    next_a = a
-                    next_b = b + 1
-                    next_status = 0 #"normal"
+            if (action == 2): wait()
 
         #elif (a == b and status == "forking"):
         elif (a == b and status == 2):
-            # wait, 3 fork possibilities
-            if (action == 2):
-                legal = True
-                event = np.random.choice(3, p = [alpha, (1 - alpha) * gamma, (1 - alpha) * (1 - gamma)])
-                # attacker mines a block
-                if (event == 0):
-                    #reward = 0
-                    next_a = a + 1
-                    next_b = b
-                    next_status = 2 #"forking"
-                # follower mines a block
-                if (event == 1):
-                    #reward = b * self._attacker_block_reward
-                    attacker_get = b
-                    next_a = a - b
-                    next_b = 1
-                    next_status = 0 #"normal"
-                # unfollower mines a block
-                if (event == 2):
-                    #reward = 0
-                    next_a = a
-                    next_b = b + 1
-                    next_status = 0 #"normal"
+            if (action == 2): fork_wait()
 
         elif (a > b and b == 0):
             # override, publish a block
-            if (action == 1):
-                legal = True
-                #reward = self._attacker_block_reward
-                attacker_get = 1
-                next_a = a - 1
-                next_b = 0
-                next_status = 0 #"normal"
-            # wait
-            if (action == 2):
-                legal = True
-                event = np.random.choice(2, p = [alpha, 1 - alpha])
-                # attacker mines a block
-                if (event == 0):
-                    #reward = 0
-                    next_a = a + 1
-                    next_b = b
-                    next_status = 0#"normal"
-                # honest miner mines a block
-                if (event == 1):
-                    #reward = 0
-                    next_a = a
-                    next_b = b + 1
-                    next_status = 0# "normal"
+            if (action == 1): outcomes.append((1, a - 1, 0, 0, 1, 0))
+            if (action == 2): wait()
 
         #elif (a > b and b > 0 and status == "normal"):
         elif (a > b and b > 0 and status == 0):
             # match, publish b blocks
-            if (action == 0):
-                legal = True
-                #reward = 0
-                next_a = a
-                next_b = b
-                next_status = 2 #"forking"
-            # override, publish (b + 1) blocks
-            if (action == 1):
-                legal = True
-                #reward = (b + 1) * self._attacker_block_reward
-                attacker_get = b + 1
-                next_a = a - b - 1
-                next_b = 0
-                next_status = 0 #"normal"
-            # wait
-            if (action == 2):
-                legal = True
-                event = np.random.choice(2, p = [alpha, 1 - alpha])
-                # attacker mines a block
-                if (event == 0):
-                    #reward = 0
-                    next_a = a + 1
-                    next_b = b
-                    next_status = 0 #"normal"
-                # honest miner mines a block
-                if (event == 1):
-                    #reward = 0
-                    next_a = a
-                    next_b = b + 1
-                    next_status = 0 #"normal"
+            if (action == 0): outcomes.append((1, a, b, 2, 0, 0))
+            if (action == 1): override()
+            if (action == 2): wait()
 
         #elif (a > b and b > 0 and status == "forking"):
         elif (a > b and b > 0 and status == 2):
             # don't need match...
-            # override, publish (b + 1) blocks
-            if (action == 1):
-                legal = True
-                #reward = (b + 1) * self._attacker_block_reward
-                attacker_get = b + 1
-                next_a = a - b - 1
-                next_b = 0
-                next_status = 0 #"normal"
-            # wait, 3 fork possibilities
-            if (action == 2):
-                legal = True
-                event = np.random.choice(3, p = [alpha, (1 - alpha) * gamma, (1 - alpha) * (1 - gamma)])
-                # attacker mines a block
-                if (event == 0):
-                    #reward = 0
-                    next_a = a + 1
-                    next_b = b
-                    next_status = 2 #"forking"
-                    #next_status = "normal"
-                # follower mines a block
-                if (event == 1):
-                    #reward = b * self._attacker_block_reward
-                    attacker_get = b
-                    next_a = a - b
-                    next_b = 1
-                    next_status = 0 #"normal"
-                # unfollower mines a block
-                if (event == 2):
-                    #reward = 0
-                    next_a = a
-                    next_b = b + 1
-                    next_status = 0 #"normal"
-
-        if (legal == False):
-            return 0, -1000000, False
+            if (action == 1): override()
+            if (action == 2): fork_wait()
+
+        return outcomes
+
+    # _settle : the deterministic uncle / nephew part of the transition function.
+    # input the current state and the result of the block race,
+    # return (next state, attacker gain, honest gain, statistics)
+    def _settle(self, s, next_a, next_b, next_status, attacker_get, honest_get):
+
+        a, b = s[0 : 2]
+
+        max_uncle_block = 2
+        attacker_uncle = 0
+        attacker_nephew = 0
+        honest_uncle = 0
+        honest_nephew = 0
 
         #special_block = s[3] | (status == 2) # if the honest miner know the special block!
-        special_block = self._special_block
+        special_block = s[3]
         uncle = list(s[4 : 10])
         new_uncle = [0] * 6
 
@@ -1169,7 +865,6 @@ class eth_env:
 
             if (b > 0 and attacker_get <= 6): new_uncle[attacker_get - 1] = 2
             special_block = 0
-            #print("attacker get :", attacker_get, "nephew:", attacker_nephew, "uncle:", attacker_uncle)
 
         # reference strategy : earliest block first and refer to all block
         elif (honest_get > 0):
@@ -1184,7 +879,6 @@ class eth_env:
                         attacker_uncle += (8 - (i + j)) / 8.0
                         ha_num += 1
                         ha_distance += (i + j)
-                        #jprint("hanging attacker uncle with distance", (i + j))
                         #attacker_uncle += 4 / 8.0
                     elif (uncle[j] == 2):
                         honest_uncle += (8 - (i + j)) / 8.0
@@ -1197,12 +891,10 @@ class eth_env:
             i = max(i, special_block + 1) # only after K blocks, the honest miner can refer to the special block
             # special block - the new fork block from attacker ! only in forking status
             if (special_block > 0 and i <= honest_get and i <= 7 and i > 1):
-                #print("special block work!")
                 attacker_uncle += (8 - (i - 1)) / 8.0
                 #attacker_uncle += 4 / 8.0
                 honest_nephew += 1
                 ha_distance += (i - 1)
-                #print("special uncle with distance", (i - 1))
                 ha_num += 1
             else:
                 if (a > 0 and honest_get <= 6): new_uncle[honest_get - 1] = 1
@@ -1211,7 +903,6 @@ class eth_env:
                 new_uncle[i + honest_get] = uncle[i]
 
             special_block = 0
-            #print("honest get :", honest_get, "honest nephew:", honest_nephew, "honest uncle", honest_uncle, "attacker uncle", attacker_uncle)
 
         else:
             new_uncle = uncle
@@ -1219,41 +910,57 @@ class eth_env:
             if (special_block == 0 and next_status == 2 and a > 0):
                 special_block = b
 
-            #if (next_status == 2): special_block = 1 # know the special block !
-
         attacker_instant_gain = (attacker_get + attacker_uncle + attacker_nephew / 32.0)
         honest_instant_gain = (honest_get + honest_uncle + honest_nephew / 32.0)
 
-        #self._relative_p = max(self._current_alpha, self.SM_theoratical_gain(self._current_alpha, self._gamma))
-        #print(self._relative_p)
-        #if (self._relative_p > 0.8): self._relative_p *= 0.9
+        next_state = (next_a, next_b, next_status, special_block) + tuple(new_uncle)
+        stats = (attacker_get, honest_get, aa_num, aa_distance, ha_num, ha_distance)
+
+        return next_state, attacker_instant_gain, honest_instant_gain, stats
+
+    # transitions : the pure transition function of the environment.
+    # input a state (without the alpha element) and an action, return all outcomes as a list of
+    # (probability, next state, attacker gain, honest gain).
+    # An empty list means 'action' is an illegal move.
+    def transitions(self, s, action, alpha = None):
+        if (alpha is None):
+            alpha = self._current_alpha
+        outcomes = []
+        for p, next_a, next_b, next_status, attacker_get, honest_get in self._race_outcomes(s, action, alpha):
+            next_state, attacker_gain, honest_gain, _ = self._settle(s, next_a, next_b, next_status, attacker_get, honest_get)
+            outcomes.append((p, next_state, attacker_gain, honest_gain))
+        return outcomes
 
-        reward = attacker_instant_gain * (1 - self._relative_p) - honest_instant_gain * self._relative_p
+    def unmapped_step(self, s, action, move = True):
 
-        if (move == True):
-            self._special_block = special_block
-        #special_block = max(special_block, 1)
-        next_state = (next_a, next_b, next_status, special_block) + tuple(new_uncle)
+        outcomes = self._race_outcomes(s, action, self._current_alpha)
+
+        if (len(outcomes) == 0):
+            return 0, -1000000, False
+
+        event = sample_event(self, [o[0] for o in outcomes], move)
+        p, next_a, next_b, next_status, attacker_get, honest_get = outcomes[event]
+
+        next_state, attacker_instant_gain, honest_instant_gain, stats = \
+            self._settle(s, next_a, next_b, next_status, attacker_get, honest_get)
+
+        reward = attacker_instant_gain * (1 - self._relative_p) - honest_instant_gain * self._relative_p
 
         if (move == True):
+            self._special_block = next_state[3]
             self._accumulated_steps += 1
             if (self._accumulated_steps % self._frequency == 0):
                 self._current_alpha = self._random_process.next()
-                '''
-                if (self._random_process == "iid") :
-                    self._current_alpha = random_normal_trunc(self._alpha, self._dev, self._random_interval[0], self._random_interval[1])
-                elif (self._random_process == "brown") :
-                    self._current_alpha = random_normal_trunc(self._current_alpha, self._dev, self._random_interval[0], self._random_interval[1])
-                '''
 
         if (self._know_alpha == True) :
             next_state = next_state + (self._current_alpha,)
 
         if (move == True) :
+            attacker_block, honest_block, aa_num, aa_distance, ha_num, ha_distance = stats
             self._attacker_gain += attacker_instant_gain
             self._honest_gain += honest_instant_gain
-            self._attacker_block += attacker_get
-            self._honest_block += honest_get
+            self._attacker_block += attacker_block
+            self._honest_block += honest_block
             self._aa_num += aa_num
             self._aa_distance += aa_distance
             self._ha_num += ha_num
@@ -1265,12 +972,21 @@ class eth_env:
         if (self._accumulated_steps > 1000000):
             reset_flag = True
 
-        #return self._current_state, reward, reset_flag
         return next_state, reward, reset_flag
 
+    # legal_action_mask : boolean array over actions, True for legal moves.
+    # Legality depends only on (a, b, status), masks are cached per key.
+    def legal_action_mask(self, s):
+        key = tuple(s[0 : 3])
+        mask = self._legal_masks.get(key)
+        if (mask is None):
+            mask = np.array([len(self._race_outcomes(s, i, self._current_alpha)) > 0 for i in range(self._action_space_n)])
+            mask.setflags(write = False)
+            self._legal_masks[key] = mask
+        return mask
+
     def is_legal_move(self, s, a):
-        s1, r, d = self.unmapped_step(s, a, move = False)
-        return r > -100
+        return bool(self.legal_action_mask(s)[a])
 
     def legal_move_list(self, s):
         legal_move = []
@@ -1349,7 +1065,143 @@ class eth_env:
 
         return aa_ratio, aa_distance, ha_ratio, ha_distance
 
-class SM_env_with_stale:
+    # build the sparse MDP from the transition function (cached)
+    # there is no index representation, states are discovered from the starting state
+    # mdp.states[i] is the state tuple of row i
+    def get_sparse_MDP(self):
+        from . import mdp_cache
+        if (getattr(self, "_sparse_mdp", None) is None):
+            self._sparse_mdp = mdp_cache.load_or_build(self, self._alpha, start = (0, 0, 0, 0, 0, 0, 0, 0, 0, 0))
+        return self._sparse_mdp
+
+    # policy[i] is the action of state mdp.states[i]
+    def theoretical_attacker_fraction(self, policy):
+        from . import mdp_cache
+        return mdp_cache.attacker_revenue(self.get_sparse_MDP(), policy)
+
+    # exact revenue of a fixed policy and its derivatives w.r.t. alpha and gamma
+    # return : (revenue, d revenue / d alpha, d revenue / d gamma)
+    def attacker_fraction_sensitivity(self, policy):
+        from . import mdp_util
+        return mdp_util.revenue_sensitivity(self, self.get_sparse_MDP(), policy, self._alpha)
+
+    # use binary search to find the best stategy, the result is cached on disk (see mdp_cache)
+    # return a policy over mdp.states
+    def optimal_mdp_solver(self):
+        from . import mdp_cache
+        ret, low, revenue = mdp_cache.optimal_policy(self.get_sparse_MDP(), self._alpha)
+        if (low > self._alpha): self._relative_p = low
+
+        print("alpha = ", self._alpha, "OSM = ", low)
+        return ret
+
+# stale_race_transitions : the pure transition function shared by SM_env_with_stale and SM_env_with_cost.
+# s : (a, b, c, status)
+# effort : 1 if the attacker keeps mining when he waits, 0 otherwise
+# wait_actions : actions meaning 'wait and mine on private fork'
+# return all outcomes as a list of (probability, next state, attacker blocks, honest blocks).
+# An empty list means 'action' is an illegal move.
+def stale_race_transitions(s, action, alpha, gamma, stale, rule, max_hidden_block, effort = 1, wait_actions = (2,)):
+
+    a, b, c, status = s[0 : 4]
+
+    outcomes = []
+
+    # attacker mines a block / honest miner mines a block after main chain / honest miner mines a stale block
+    def wait():
+        p = Normalize([alpha * effort, (1 - alpha) * (1 - stale), (1 - alpha) * stale])
+        if (a + 1 == b):
+            #next_status = "catch up"
+            outcomes.append((p[0], (a + 1, b, c, 1), 0, 0))
+        else:
+            #next_status = "normal"
+            outcomes.append((p[0], (a + 1, b, c, 0), 0, 0))
+        outcomes.append((p[1], (a, b + 1, c + 1, 0), 0, 0))
+        if (rule == "longest" or b <= 1):
+            outcomes.append((p[2], (a, b, c, 0), 0, 0))
+        else:
+            outcomes.append((p[2], (a, b + 1, c, 0), 0, 0))
+
+    # wait, 3 fork possibilities, each honest block can be stale
+    def fork_wait():
+        p = Normalize([alpha * effort, (1 - alpha) * gamma * (1 - stale), (1 - alpha) * gamma * stale, \
+                       (1 - alpha) * (1 - gamma) * (1 - stale), (1 - alpha) * (1 - gamma) * stale])
+        # attacker mines a block
+        outcomes.append((p[0], (a + 1, b, c, 2), 0, 0))
+        # follower mines a block after the attacker's chain
+        outcomes.append((p[1], (a - b, 1, 1, 0), b, 0))
+        # follower mines a stale block
+        if (b == 1 or rule == "longest"): # no effect
+            outcomes.append((p[2], (a, b, c, 2), 0, 0))
+        else:
+            outcomes.append((p[2], (a - b, 0, 0, 0), b, 0))
+        #unfollower mines a block after the honest main chain
+        outcomes.append((p[3], (a, b + 1, c + 1, 0), 0, 0))
+        #unfollower mines a stale block
+        if (b == 1 or rule == "longest"): # no effect if b == 1
+            outcomes.append((p[4], (a, b, c, 2), 0, 0))
+        else:
+            outcomes.append((p[4], (a, b + 1, c, 0), 0, 0))
+
+    # override, publish (b + 1) blocks
+    def override():
+        outcomes.append((1, (a - b - 1, 0, 0, 0), b + 1, 0))
+
+    # attacker abandons his private fork, accept c blocks
+    def abandon():
+        outcomes.append((1, (0, 0, 0, 0), 0, c))
+
+    waiting = action in wait_actions
+
+    # out of bound..force to override
+    if (a == max_hidden_block + 1 and b < a):
+        if (action == 1): override()
+
+    # out of bound... force to give up
+    elif (b == max_hidden_block + 1 and a < b):
+        if (action == 0): abandon()
+
+    elif (a < b):
+        if (action == 0): abandon()
+        if (waiting): wait()
+
+    elif (a == b and a == 0):
+        if (waiting): wait()
+
+    elif (a == b and status == 0):
+        # attacker publishes all block and matches
+        if (action == 0): outcomes.append((1, (a, b, c, 2), 0, 0))
+        if (waiting): wait()
+
+    elif (a == b and status == 1):
+        # in this situation, the attacker cannot match!
+        if (waiting): wait()
+
+    elif (a == b and status == 2):
+        if (waiting): fork_wait()
+
+    elif (a > b and b == 0):
+        # override, publish a block
+        if (action == 1): outcomes.append((1, (a - 1, 0, 0, 0), 1, 0))
+        if (waiting): wait()
+
+    elif (a > b and b > 0 and status == 0):
+        # match, publish b blocks
+        if (action == 0): outcomes.append((1, (a, b, c, 2), 0, 0))
+        if (action == 1): override()
+        if (waiting): wait()
+
+    elif (a > b and b > 0 and status == 2):
+        # don't need match...
+        if (action == 1): override()
+        if (waiting): fork_wait()
+
+    return outcomes
+
+class SM_env_with_stale(Snapshotable):
+
+    _snapshot_attrs = ('_current_state', '_accumulated_steps', '_current_alpha', '_visible_alpha',
+                       '_attack_block', '_honest_block')
 
     # max_hidden_block : limit the max hidden block of attacker
     # attacker_fraction : usually denoted as alpha, the hash power of the attacker against the whole network
@@ -1380,6 +1232,7 @@ class SM_env_with_stale:
         self._attack_block = 0
         self._honest_block = 0
         self._action_space_n = 3
+        self._legal_masks = {}
         self._state_vector_n = 4
         self.know_alpha = know_alpha
         if (know_alpha == True): self._state_vector_n += 1
@@ -1394,13 +1247,7 @@ class SM_env_with_stale:
         self._rule = rule
         self._random_process = alpha_random_process(attacker_fraction, dev, random_interval, random_process)
 
-        rept = 1000000
-        alpha = 0.0
-        for i in range(rept):
-            a = random_normal_trunc(self._alpha, self._dev, random_interval[0], random_interval[1])
-            alpha += a
-        alpha /= rept
-        self._expected_alpha = alpha
+        self._expected_alpha = expected_alpha(self._alpha, self._dev, random_interval[0], random_interval[1])
 
         #print(relative_p)
         if (relative_p == 0): rp = self.SM_theoratical_gain(self._alpha, self._gamma) #self._alpha
@@ -1525,461 +1372,39 @@ class SM_env_with_stale:
 
     #mapping = True : map illegal move to a legal one
 
-    def unmapped_step(self, idx, action, move = True):
+    # transitions : the pure transition function of the environment.
+    # input a state (a, b, c, status) and an action, return all outcomes as a list of
+    # (probability, next state, attacker blocks, honest blocks).
+    # An empty list means 'action' is an illegal move.
+    def transitions(self, s, action, alpha = None):
+        if (alpha is None):
+            alpha = self._current_alpha
+        return stale_race_transitions(s, action, alpha, self._gamma, self._stale_rate, self._rule, self._max_hidden_block)
 
-        # a : attacker's fork
-        # b : weight of honest's fork
-        # c : length of honest's fork
-        # status : fork status
-        a, b, c, status = idx[0:4]
+    def unmapped_step(self, idx, action, move = True):
 
-        #reward = -10000000 # if reward remains no change, then it means 'action' is an illegal move
-        legal = False
-        reward = 0
+        outcomes = self.transitions(idx[0 : 4], action)
 
-        next_a = a
-        next_b = b
-        next_c = c
-        next_status = status
+        if (len(outcomes) == 0): return 0, -1e9, False
 
-        alpha = self._current_alpha
-        gamma = self._gamma
-        stale = self._stale_rate
+        event = sample_event(self, [o[0] for o in outcomes], move)
+        prob, next_state, attacker_get, honest_get = outcomes[event]
 
         p = max(self._alpha, self.SM_theoratical_gain(self._alpha, self._gamma))
         honest_block_reward = - p
         attacker_block_reward = 1 - p
-
-        # out of bound..force to override
-        if (a == self._max_hidden_block + 1 and b < a):
-            #override, publish (b + 1) blocks
-            if (action == 1):
-                legal = True
-                reward = (b + 1) * attacker_block_reward
-                next_a = a - b - 1
-                next_b = 0
-                next_c = 0
-                #next_status = "normal"
-                next_status = 0
-
-        # out of bound... force to give up
-        elif (b == self._max_hidden_block + 1 and a < b):
-            #match -- abandon, accept c blocks
-            if (action == 0):
-                legal = True
-                reward = c * honest_block_reward
-                next_a = 0
-                next_b = 0
-                next_c = 0
-                #next_status = "normal
-                next_status = 0
-        elif (a < b):
-            # attacker abandons his private fork
-            if (action == 0):
-                legal = True
-                reward = c * honest_block_reward
-                next_a = 0
-                next_b = 0
-                next_c = 0
-                #next_status = "normal"
-                next_status = 0
-            if (action == 2):
-                legal = True
-                event = np.random.choice(3, p = [alpha, (1 - alpha) * (1 - stale), (1 - alpha) * stale])
-                # attacker mines a block
-                if (event == 0):
-                    reward = 0
-                    next_a = a + 1
-                    next_b = b
-                    next_c = c
-                    if (next_a == next_b):
-                        #next_status = "catch up"
-                        next_status = 1
-                    else:
-                        #next_status = "normal"
-                        next_status = 0
-                # honest miner mines a block after main chain
-                if (event == 1):
-                    reward = 0
-                    next_a = a
-                    next_b = b + 1
-                    next_c = c + 1
-                    #next_status = "normal"
-                    next_status = 0
-                if (event == 2):
-                    reward = 0
-                    next_a = a
-                    if (self._rule == "longest"):
-                        next_b = b
-                    elif (self._rule == "GHOST"):
-                        if (b <= 1): next_b = b
-                        else : next_b = b + 1
-                    next_c = c
-                    next_status = 0
-
-        elif (a == b and a == 0):
-            if (action == 2):
-                legal = True
-                event = np.random.choice(3, p = [alpha, (1 - alpha) * (1 - stale), (1 - alpha) * stale])
-                # attacker mines a block
-                if (event == 0):
-                    reward = 0
-                    next_a = a + 1
-                    next_b = b
-                    next_c = c
-                    if (next_a == next_b):
-                        #next_status = "catch up"
-                        next_status = 1
-                    else:
-                        #next_status = "normal"
-                        next_status = 0
-                # honest miner mines a block after main chain
-                if (event == 1):
-                    reward = 0
-                    next_a = a
-                    next_b = b + 1
-                    next_c = c + 1
-                    #next_status = "normal"
-                    next_status = 0
-                if (event == 2):
-                    reward = 0
-                    next_a = a
-                    if (self._rule == "longest"):
-                        next_b = b
-                    elif (self._rule == "GHOST"):
-                        if (b <= 1): next_b = b
-                        else : next_b = b + 1
-                    next_c = c
-                    next_status = 0
-
-        elif (a == b and status == 0):
-            # attacker publishes all block and matches
-            if (action == 0):
-                legal = True
-                reward = 0
-                next_a = a
-                next_b = b
-                next_c = c
-                #next_status = "forking"
-                next_status = 2
-
-            # wait
-            if (action == 2):
-                legal = True
-                event = np.random.choice(3, p = [alpha, (1 - alpha) * (1 - stale), (1 - alpha) * stale])
-                # attacker mines a block
-                if (event == 0):
-                    reward = 0
-                    next_a = a + 1
-                    next_b = b
-                    next_c = c
-                    if (next_a == next_b):
-                        #next_status = "catch up"
-                        next_status = 1
-                    else:
-                        #next_status = "normal"
-                        next_status = 0
-                # honest miner mines a block after main chain
-                if (event == 1):
-                    reward = 0
-                    next_a = a
-                    next_b = b + 1
-                    next_c = c + 1
-                    #next_status = "normal"
-                    next_status = 0
-                if (event == 2):
-                    reward = 0
-                    next_a = a
-                    if (self._rule == "longest"):
-                        next_b = b
-                    elif (self._rule == "GHOST"):
-                        if (b <= 1): next_b = b
-                        else : next_b = b + 1
-                    next_c = c
-                    next_status = 0
-
-        elif (a == b and status == 1):
-            # in this situation, the attacker cannot match!
-            # wait
-            if (action == 2):
-                legal = True
-                event = np.random.choice(3, p = [alpha, (1 - alpha) * (1 - stale), (1 - alpha) * stale])
-                # attacker mines a block
-                if (event == 0):
-                    reward = 0
-                    next_a = a + 1
-                    next_b = b
-                    next_c = c
-                    if (next_a == next_b):
-                        #next_status = "catch up"
-                        next_status = 1
-                    else:
-                        #next_status = "normal"
-                        next_status = 0
-                # honest miner mines a block after main chain
-                if (event == 1):
-                    reward = 0
-                    next_a = a
-                    next_b = b + 1
-                    next_c = c + 1
-                    #next_status = "normal"
-                    next_status = 0
-                if (event == 2):
-                    reward = 0
-                    next_a = a
-                    if (self._rule == "longest"):
-                        next_b = b
-                    elif (self._rule == "GHOST"):
-                        if (b <= 1): next_b = b
-                        else : next_b = b + 1
-                    next_c = c
-                    next_status = 0
-
-        elif (a == b and status == 2):
-            # wait, 3 fork possibilities
-            if (action == 2):
-                legal = True
-                event = np.random.choice(5, p = [alpha, (1 - alpha) * gamma * (1 - stale), (1 - alpha) * gamma * stale, \
-                                                (1 - alpha) * (1 - gamma) * (1 - stale), (1 - alpha) * (1 - gamma) * stale])
-                # attacker mines a block
-                if (event == 0):
-                    reward = 0
-                    next_a = a + 1
-                    next_b = b
-                    next_c = c
-                    next_status = 2 # forking
-                # follower mines a block after the attacker's chain
-                if (event == 1):
-                    reward = b * attacker_block_reward
-                    next_a = a - b
-                    next_b = 1
-                    next_c = 1
-                    next_status = 0 # "normal"
-                # follower mines a stale block
-                if (event == 2):
-                    if (b == 1 or self._rule == "longest"): # no effect
-                        reward = 0
-                        next_a = a
-                        next_b = b
-                        next_c = c
-                        next_status = 2 # forking
-                    else:
-                        reward = b * attacker_block_reward
-                        next_a = a - b
-                        next_b = 0
-                        next_c = 0
-                        next_status = 0 # "normal"
-                #unfollower mines a block after the honest main chain
-                if (event == 3):
-                    reward = 0
-                    next_a = a
-                    next_b = b + 1
-                    next_c = c + 1
-                    next_status = 0 # normal
-                #unfollower mines a stale block
-                if (event == 4):
-                    reward = 0
-                    next_a = a
-                    next_c = c
-                    if (b == 1 or self._rule == "longest"):
-                        next_b = b # no effect if b == 1
-                        next_status = 2 # forking
-                    else:
-                        next_b = b + 1
-                        next_status = 0 # normal
-
-        elif (a > b and b == 0):
-            # override, publish a block
-            if (action == 1):
-                legal = True
-                reward = attacker_block_reward
-                next_a = a - 1
-                next_b = 0
-                next_c = 0
-                next_status = 0 # normal
-            # wait
-            if (action == 2):
-                legal = True
-                event = np.random.choice(3, p = [alpha, (1 - alpha) * (1 - stale), (1 - alpha) * stale])
-                # attacker mines a block
-                if (event == 0):
-                    reward = 0
-                    next_a = a + 1
-                    next_b = b
-                    next_c = c
-                    if (next_a == next_b):
-                        #next_status = "catch up"
-                        next_status = 1
-                    else:
-                        #next_status = "normal"
-                        next_status = 0
-                # honest miner mines a block after main chain
-                if (event == 1):
-                    reward = 0
-                    next_a = a
-                    next_b = b + 1
-                    next_c = c + 1
-                    #next_status = "normal"
-                    next_status = 0
-                if (event == 2):
-                    reward = 0
-                    next_a = a
-                    if (self._rule == "longest"):
-                        next_b = b
-                    elif (self._rule == "GHOST"):
-                        if (b <= 1): next_b = b
-                        else : next_b = b + 1
-                    next_c = c
-                    next_status = 0
-
-        elif (a > b and b > 0 and status == 0):
-            legal = True
-            # match, publish b blocks
-            if (action == 0):
-                reward = 0
-                next_a = a
-                next_b = b
-                next_c = c
-                next_status = 2 # "forking"
-            # override, publish (b + 1) blocks
-            if (action == 1):
-                reward = (b + 1) * attacker_block_reward
-                next_a = a - b - 1
-                next_b = 0
-                next_c = 0
-                next_status = 0 #"normal"
-            # wait
-            if (action == 2):
-                legal = True
-                event = np.random.choice(3, p = [alpha, (1 - alpha) * (1 - stale), (1 - alpha) * stale])
-                # attacker mines a block
-                if (event == 0):
-                    reward = 0
-                    next_a = a + 1
-                    next_b = b
-                    next_c = c
-                    if (next_a == next_b):
-                        #next_status = "catch up"
-                        next_status = 1
-                    else:
-                        #next_status = "normal"
-                        next_status = 0
-                # honest miner mines a block after main chain
-                if (event == 1):
-                    reward = 0
-                    next_a = a
-                    next_b = b + 1
-                    next_c = c + 1
-                    #next_status = "normal"
-                    next_status = 0
-                if (event == 2):
-                    reward = 0
-                    next_a = a
-                    if (self._rule == "longest"):
-                        next_b = b
-                    elif (self._rule == "GHOST"):
-                        if (b <= 1): next_b = b
-                        else :
-                            next_b = b + 1
-                    next_c = c
-                    next_status = 0
-
-        elif (a > b and b > 0 and status == 2):
-            # don't need match...
-            # override, publish (b + 1) blocks
-            if (action == 1):
-                legal = True
-                reward = (b + 1) * attacker_block_reward
-                next_a = a - b - 1
-                next_b = 0
-                next_c = 0
-                next_status = 0 #"normal"
-            # wait, 3 fork possibilities
-
-            if (action == 2):
-                legal = True
-                event = np.random.choice(5, p = [alpha, (1 - alpha) * gamma * (1 - stale), (1 - alpha) * gamma * stale, \
-                        (1 - alpha) * (1 - gamma) * (1 - stale), (1 - alpha) * (1 - gamma) * stale])
-                # attacker mines a block
-                if (event == 0):
-                    reward = 0
-                    next_a = a + 1
-                    next_b = b
-                    next_c = c
-                    next_status = 2 # forking
-                # follower mines a block after the attacker's chain
-                if (event == 1):
-                    reward = b * attacker_block_reward
-                    next_a = a - b
-                    next_b = 1
-                    next_c = 1
-                    next_status = 0 # "normal"
-                # follower mines a stale block
-                if (event == 2):
-                    if (b == 1 or self._rule == "longest"): # no effect
-                        reward = 0
-                        next_a = a
-                        next_b = b
-                        next_c = c
-                        next_status = 2 # forking
-                    else:
-                        reward = b * attacker_block_reward
-                        next_a = a - b
-                        next_b = 0
-                        next_c = 0
-                        next_status = 0 # "normal"
-                #unfollower mines a block after the honest main chain
-                if (event == 3):
-                    reward = 0
-                    next_a = a
-                    next_b = b + 1
-                    next_c = c + 1
-                    next_status = 0 # normal
-                #unfollower mines a stale block
-                if (event == 4):
-                    reward = 0
-                    next_a = a
-                    next_c = c
-                    if (b == 1 or self._rule == "longest"):
-                        next_b = b # no effect if b == 1
-                        next_status = 2 # forking
-                    else:
-                        next_b = b + 1
-                        next_status = 0 # normal
-
-
-        if (legal == False): return 0, -1e9, False
-
-        #if ((next_b, next_c) != (b, c) and next_b - next_c > b - c): print("stale block")
-        if (next_a > a + 1 or next_b > b + 1 or next_c > c + 1) :
-            print("wrong!")
-            print((a, b, c, status))
-            print((next_a, next_b, next_c, next_status))
-
-        next_state = (next_a, next_b, next_c, next_status)
+        reward = attacker_get * attacker_block_reward + honest_get * honest_block_reward
 
         reset_flag = False
 
         if (move == True):
             self._accumulated_steps += 1
-            tmp = self._current_alpha
             self._current_alpha = self._random_process.next()
             if (self._accumulated_steps % self._frequency == 0):
-                #self._visible_alpha = np.clip(tmp + random_normal_trunc(0, 0.05, -0.05, 0.05), 0, 0.5)
                 self._visible_alpha = self._current_alpha
 
-                '''
-                if (self._random_process == "iid") :
-                    self._current_alpha = random_normal_trunc(self._alpha, self._dev, self._random_interval[0], self._random_interval[1])
-                elif (self._random_process == "brown") :
-                    self._current_alpha = random_normal_trunc(self._current_alpha, self._dev, self._random_interval[0], self._random_interval[1])
-                '''
-
-            if (abs(reward) > 0.005):
-                if (reward < 0):
-                    self._honest_block += reward / honest_block_reward
-                else:
-                    self._attack_block += reward / attacker_block_reward
+            self._attack_block += attacker_get
+            self._honest_block += honest_get
 
         if (self.know_alpha == True):
             next_state = next_state + (self._visible_alpha,)
@@ -1992,9 +1417,19 @@ class SM_env_with_stale:
 
         return next_state, reward, reset_flag
 
+    # legal_action_mask : boolean array over actions, True for legal moves.
+    # Legality depends only on the first 4 state components, masks are cached per key.
+    def legal_action_mask(self, s):
+        key = tuple(s[0 : 4])
+        mask = self._legal_masks.get(key)
+        if (mask is None):
+            mask = np.array([len(self.transitions(key, i)) > 0 for i in range(self._action_space_n)])
+            mask.setflags(write = False)
+            self._legal_masks[key] = mask
+        return mask
+
     def is_legal_move(self, s, a):
-        s1, r, d = self.unmapped_step(s, a, move = False)
-        return r > -1000000
+        return bool(self.legal_action_mask(s)[a])
 
     def legal_move_list(self, s):
         legal_move = []
@@ -2070,12 +1505,14 @@ class SM_env_with_stale:
         return self.name_of_action(idx, a)
     '''
 
-    # add a transition to MDP matrices
-    def add_transition(self, a, s1, s2, p, r):
-        s1_idx = self._vector_to_index(s1)
-        s2_idx = self._vector_to_index(s2)
-        self.transition_matrix[a, s1_idx, s2_idx] += p
-        self.reward_matrix[a, s1_idx, s2_idx] += r
+    # build the sparse MDP from the transition function (cached)
+    # mdp.states is self._state_space, the matrices use the expected alpha
+    def get_sparse_MDP(self):
+        from . import mdp_cache
+        if (getattr(self, "_sparse_mdp", None) is None):
+            self._sparse_mdp = mdp_cache.load_or_build(self, self._expected_alpha, states = self._state_space, \
+                                                       start = (0, 0, 0, 0))
+        return self._sparse_mdp
 
     # initialize necessary matrices for MDP solver
     # A : action space size
@@ -2083,187 +1520,9 @@ class SM_env_with_stale:
     # transition_matrix : (A, S, S) , probability
     # reward_matrix : (A, S, S) , reward
     def MDP_matrix_init(self):
-        self.transition_matrix = np.zeros((self._action_space_n, self._state_space_n, self._state_space_n))
-        self.reward_matrix = np.zeros((self._action_space_n, self._state_space_n, self._state_space_n))
-
+        import mdptoolbox
         self._matrix_init = True
-        alpha = self._expected_alpha
-        gamma = self._gamma
-        stale = self._stale_rate
-
-        for action in range(self._action_space_n):
-            for ss in range(0, self._state_space_n):
-
-                s1 = self._index_to_vector(ss)
-                a, b, c, status = s1
-                legal = False
-                # out of bound..force to override
-                if (a == self._max_hidden_block + 1 and b < a):
-                    #override, publish (b + 1) blocks
-                    if (action == 1):
-                        legal = True
-                        self.add_transition(action, s1, (a - b - 1, 0, 0, 0), 1, (b + 1) * self._attacker_block_reward)
-
-                # out of bound... force to give up
-                elif (b == self._max_hidden_block + 1 and a < b):
-                    #match -- abandon, accept c blocks
-                    if (action == 0):
-                        legal = True
-                        self.add_transition(action, s1, (0, 0, 0, 0), 1, c * self._honest_block_reward)
-
-                elif (a < b):
-                    # attacker abandons his private fork
-                    if (action == 0):
-                        legal = True
-                        self.add_transition(action, s1, (0, 0, 0, 0), 1, c * self._honest_block_reward)
-                    if (action == 2):
-                        legal = True
-                        if (a + 1 == b):
-                            self.add_transition(action, s1, (a + 1, b, c, 1), alpha, 0)
-                        else:
-                            self.add_transition(action, s1, (a + 1, b, c, 0), alpha, 0)
-
-                        self.add_transition(action, s1, (a, b + 1, c + 1, 0), (1 - alpha) * (1 - stale), 0)
-
-                        if (self._rule == "longest" or b <= 1):
-                            self.add_transition(action, s1, (a, b, c, 0), (1 - alpha) * stale, 0)
-                        else:
-                            self.add_transition(action, s1, (a, b + 1, c, 0), (1 - alpha) * stale, 0)
-
-                elif (a == b and a == 0):
-                    if (action == 2):
-                        legal = True
-                        if (a + 1 == b):
-                            self.add_transition(action, s1, (a + 1, b, c, 1), alpha, 0)
-                        else:
-                            self.add_transition(action, s1, (a + 1, b, c, 0), alpha, 0)
-
-                        self.add_transition(action, s1, (a, b + 1, c + 1, 0), (1 - alpha) * (1 - stale), 0)
-
-                        if (self._rule == "longest" or b <= 1):
-                            self.add_transition(action, s1, (a, b, c, 0), (1 - alpha) * stale, 0)
-                        else:
-                            self.add_transition(action, s1, (a, b + 1, c, 0), (1 - alpha) * stale, 0)
-
-                elif (a == b and status == 0):
-                    # attacker publishes all block and matches
-                    if (action == 0):
-                        legal = True
-                        self.add_transition(action, s1, (a, b, c, 2), 1, 0)
-
-                    # wait
-                    if (action == 2):
-                        legal = True
-                        if (a + 1 == b):
-                            self.add_transition(action, s1, (a + 1, b, c, 1), alpha, 0)
-                        else:
-                            self.add_transition(action, s1, (a + 1, b, c, 0), alpha, 0)
-
-                        self.add_transition(action, s1, (a, b + 1, c + 1, 0), (1 - alpha) * (1 - stale), 0)
-
-                        if (self._rule == "longest" or b <= 1):
-                            self.add_transition(action, s1, (a, b, c, 0), (1 - alpha) * stale, 0)
-                        else:
-                            self.add_transition(action, s1, (a, b + 1, c, 0), (1 - alpha) * stale, 0)
-
-                elif (a == b and status == 1):
-                    # in this situation, the attacker cannot match!
-                    # wait
-                    if (action == 2):
-                        legal = True
-                        if (a + 1 == b):
-                            self.add_transition(action, s1, (a + 1, b, c, 1), alpha, 0)
-                        else:
-                            self.add_transition(action, s1, (a + 1, b, c, 0), alpha, 0)
-
-                        self.add_transition(action, s1, (a, b + 1, c + 1, 0), (1 - alpha) * (1 - stale), 0)
-
-                        if (self._rule == "longest" or b <= 1):
-                            self.add_transition(action, s1, (a, b, c, 0), (1 - alpha) * stale, 0)
-                        else:
-                            self.add_transition(action, s1, (a, b + 1, c, 0), (1 - alpha) * stale, 0)
-
-                elif (a == b and status == 2):
-                    # wait, 3 fork possibilities
-                    if (action == 2):
-                        legal = True
-                        #event = np.random.choice(5, p = [alpha, (1 - alpha) * gamma * (1 - stale), (1 - alpha) * gamma * stale, \
-                        #                                 (1 - alpha) * (1 - gamma) * (1 - stale), (1 - alpha) * (1 - gamma) * stale])
-                        self.add_transition(action, s1, (a + 1, b, c, 2), alpha, 0)
-                        self.add_transition(action, s1, (a - b, 1, 1, 0), (1 - alpha) * gamma * (1 - stale), b * self._attacker_block_reward)
-                        self.add_transition(action, s1, (a, b + 1, c + 1, 0), (1 - alpha) * (1 - gamma) * (1 - stale), 0)
-                        if (b <= 1 or self._rule == "longest"):
-                            self.add_transition(action, s1, (a, b, c, 2), (1 - alpha) * stale, 0)
-                        else:
-                            self.add_transition(action, s1, (a - b, 0, 0, 0), (1 - alpha) * gamma * stale, b * self._attacker_block_reward)
-                            self.add_transition(action, s1, (a, b + 1, c, 0), (1 - alpha) * (1 - gamma) * stale, 0)
-
-                elif (a > b and b == 0):
-                    # override, publish a block
-                    if (action == 1):
-                        legal = True
-                        self.add_transition(action, s1, (a - 1, 0, 0, 0), 1, self._attacker_block_reward)
-                    # wait
-                    if (action == 2):
-                        legal = True
-                        if (a + 1 == b):
-                            self.add_transition(action, s1, (a + 1, b, c, 1), alpha, 0)
-                        else:
-                            self.add_transition(action, s1, (a + 1, b, c, 0), alpha, 0)
-
-                        self.add_transition(action, s1, (a, b + 1, c + 1, 0), (1 - alpha) * (1 - stale), 0)
-
-                        if (self._rule == "longest" or b <= 1):
-                            self.add_transition(action, s1, (a, b, c, 0), (1 - alpha) * stale, 0)
-                        else:
-                            self.add_transition(action, s1, (a, b + 1, c, 0), (1 - alpha) * stale, 0)
-
-                elif (a > b and b > 0 and status == 0):
-                    legal = True
-                    # match, publish b blocks
-                    if (action == 0):
-                        legal = True
-                        self.add_transition(action, s1, (a, b, c, 2), 1, 0)
-                    # override, publish (b + 1) blocks
-                    if (action == 1):
-                        legal = True
-                        self.add_transition(action, s1, (a - b - 1, 0, 0, 0), 1, (b + 1) * self._attacker_block_reward)
-                    # wait
-                    if (action == 2):
-                        legal = True
-                        if (a + 1 == b):
-                            self.add_transition(action, s1, (a + 1, b, c, 1), alpha, 0)
-                        else:
-                            self.add_transition(action, s1, (a + 1, b, c, 0), alpha, 0)
-
-                        self.add_transition(action, s1, (a, b + 1, c + 1, 0), (1 - alpha) * (1 - stale), 0)
-
-                        if (self._rule == "longest" or b <= 1):
-                            self.add_transition(action, s1, (a, b, c, 0), (1 - alpha) * stale, 0)
-                        else:
-                            self.add_transition(action, s1, (a, b + 1, c, 0), (1 - alpha) * stale, 0)
-
-                elif (a > b and b > 0 and status == 2):
-                    # don't need match...
-                    # override, publish (b + 1) blocks
-                    if (action == 1):
-                        legal = True
-                        self.add_transition(action, s1, (a - b - 1, 0, 0, 0), 1, (b + 1) * self._attacker_block_reward)
-
-                    if (action == 2):
-                        legal = True
-                        self.add_transition(action, s1, (a + 1, b, c, 2), alpha, 0)
-                        self.add_transition(action, s1, (a - b, 1, 1, 0), (1 - alpha) * gamma * (1 - stale), b * self._attacker_block_reward)
-                        self.add_transition(action, s1, (a, b + 1, c + 1, 0), (1 - alpha) * (1 - gamma) * (1 - stale), 0)
-                        if (b <= 1 or self._rule == "longest"):
-                            self.add_transition(action, s1, (a, b, c, 2), (1 - alpha) * stale, 0)
-                        else:
-                            self.add_transition(action, s1, (a - b, 0, 0, 0), (1 - alpha) * gamma * stale, b * self._attacker_block_reward)
-                            self.add_transition(action, s1, (a, b + 1, c, 0), (1 - alpha) * (1 - gamma) * stale, 0)
-
-                if (legal == False):
-                    self.add_transition(action, s1, s1, 1, -1000000)
-
+        self.transition_matrix, self.reward_matrix = self.get_sparse_MDP().dense_matrices(- self._honest_block_reward)
         mdptoolbox.util.check(self.transition_matrix, self.reward_matrix)
 
     def get_MDP_matrix(self):
@@ -2271,57 +1530,36 @@ class SM_env_with_stale:
         return self.transition_matrix, self.reward_matrix
 
     def theoretical_attacker_fraction(self, policy):
+        from . import mdp_cache
+        return mdp_cache.attacker_revenue(self.get_sparse_MDP(), policy)
+
+    # exact revenue of a fixed policy and its derivatives w.r.t. alpha and gamma
+    # return : (revenue, d revenue / d alpha, d revenue / d gamma)
+    def attacker_fraction_sensitivity(self, policy):
+        from . import mdp_util
+        return mdp_util.revenue_sensitivity(self, self.get_sparse_MDP(), policy, self._expected_alpha)
 
-        trans, reward = self.get_MDP_matrix()
-        policy = np.array(policy, dtype = np.int32)
-        n = self._state_space_n
-        A = np.zeros((n, n))
-        R_attacker = np.zeros((n, n))
-        R_honest = np.zeros((n, n))
-        for i in range(n):
-            for j in range(n):
-                A[i, j] = trans[policy[i], i, j]
-                r = reward[policy[i], i, j]
-                if (r > 0) :
-                    R_attacker[i, j] = r * 1.0 / self._attacker_block_reward
-                elif (r < 0):
-                    R_honest[i, j] = r * 1.0 / self._honest_block_reward
-
-        #print(R_attacker)
-
-        r_attacker = markov_util.MRP_expected_reward(A, R_attacker)
-        r_honest = markov_util.MRP_expected_reward(A, R_honest)
-
-        return r_attacker / (r_attacker + r_honest)
-
-    # use binary search to find the best stategy
+    # use binary search to find the best stategy, the result is cached on disk (see mdp_cache)
     # it will fine-tune the reward function!
     def optimal_mdp_solver(self):
-        eps = 1e-4
-        low = self._alpha
-        high = 1
-        ret = np.zeros(self._state_space_n)
-        while (high - low > eps):
-            mid = (low + high) / 2
-
-            self._attacker_block_reward = 1 - mid
-            self._honest_block_reward = - mid
-            self.MDP_matrix_init()
-            P, R = self.get_MDP_matrix()
-            solver = mdptoolbox.mdp.PolicyIteration(P, R, 0.99)
-            solver.run()
-            #print(mid, solver.V[0])
-            if (solver.V[0] > -eps):
-                low = mid
-                ret = solver.policy
-                self._relative_p = mid
-            else:
-                high = mid
+        from . import mdp_cache
+        ret, low, revenue = mdp_cache.optimal_policy(self.get_sparse_MDP(), self._alpha)
+        if (low > self._alpha): self._relative_p = low
+
+        self._attacker_block_reward = 1 - low
+        self._honest_block_reward = - low
+        self._matrix_init = False
 
         print(self._rule, "alpha = ", self._alpha, "OSM p = ", low)
         return ret
 
-class SM_env_with_cost:
+class SM_env_with_cost(Snapshotable):
+
+    _snapshot_attrs = ('_current_state', '_accumulated_steps', '_current_alpha', '_visible_alpha',
+                       '_attack_block', '_honest_block', '_total_reward', '_total_time', '_round_reward',
+                       '_round_cost', '_avg_diff', '_round', '_block_num', '_diff', '_time_label',
+                       '_attacker_fork_time_label', '_honest_fork_time_label', '_main_time_label',
+                       'history_diff', 'history_frac', 'history_rate')
 
     # max_hidden_block : limit the max hidden block of attacker
     # attacker_fraction : usually denoted as alpha, the hash power of the attacker against the whole network
@@ -2347,6 +1585,7 @@ class SM_env_with_cost:
         self._attack_block = 0
         self._honest_block = 0
         self._action_space_n = 4 # new !
+        self._legal_masks = {}
         #self._state_vector_n = 6 # new !
         self._state_vector_n = 5 # new !
         self.know_alpha = know_alpha
@@ -2377,13 +1616,7 @@ class SM_env_with_cost:
         self._attacker_fork_time_label = 0
         self._honest_fork_time_label = 0
 
-        rept = 1000000
-        alpha = 0.0
-        for i in range(rept):
-            a = random_normal_trunc(self._alpha, self._dev, random_interval[0], random_interval[1])
-            alpha += a
-        alpha /= rept
-        self._expected_alpha = alpha
+        self._expected_alpha = expected_alpha(self._alpha, self._dev, random_interval[0], random_interval[1])
 
         #print(relative_p)
         '''
@@ -2476,6 +1709,20 @@ class SM_env_with_cost:
 
     #mapping = True : map illegal move to a legal one
 
+    # transitions : the pure block race part of the transition function.
+    # input a state (a, b, c, status) and an action, return all outcomes as a list of
+    # (probability, next state, attacker blocks, honest blocks).
+    # The difficulty and the mining cost are handled by unmapped_step.
+    # An empty list means 'action' is an illegal move.
+    def transitions(self, s, action, alpha = None):
+        if (alpha is None):
+            alpha = self._current_alpha
+        # action 3 : wait without mining
+        effort = 0
+        if (action == 2): effort = 1
+        return stale_race_transitions(s, action, alpha, self._gamma, self._stale_rate, self._rule, self._max_hidden_block, \
+                                      effort = effort, wait_actions = (2, 3))
+
     def unmapped_step(self, idx, action, move = True):
 
         # a : attacker's fork
@@ -2484,256 +1731,31 @@ class SM_env_with_cost:
         # status : fork status
         a, b, c, status = idx[0:4]
 
-        #reward = -10000000 # if reward remains no change, then it means 'action' is an illegal move
-        legal = False
-        reward = 0
-
-        next_a = a
-        next_b = b
-        next_c = c
-        next_status = status
-
         alpha = self._current_alpha
-        gamma = self._gamma
-        stale = self._stale_rate
-
-        effort = 0
-        if (action == 2): effort = 1
 
-        relative_cost = 0
-        extra_reward = 0
-        generate_block = False
-        add_block_to_main  = 0
+        outcomes = self.transitions(idx[0 : 4], action, alpha)
 
-        # out of bound..force to override
-        if (a == self._max_hidden_block + 1 and b < a):
-            #override, publish (b + 1) blocks
-            if (action == 1):
-                legal = True
-                reward = (b + 1)
-                extra_reward = b
-                next_a = a - b - 1
-                next_b = 0
-                next_c = 0
-                #next_status = "normal"
-                next_status = 0
-                add_block_to_main = b + 1
-
-        # out of bound... force to give up
-        elif (b == self._max_hidden_block + 1 and a < b):
-            #match -- abandon, accept c blocks
-            if (action == 0):
-                legal = True
-                reward = 0
-                relative_cost = -c * self._diff
-                next_a = 0
-                next_b = 0
-                next_c = 0
-                #next_status = "normal
-                next_status = 0
-                add_block_to_main = - c
+        if (len(outcomes) == 0): return 0, -1e9, False
 
-        elif (a < b):
-            # attacker abandons his private fork
-            if (action == 0):
-                legal = True
-                reward = 0
-                relative_cost = -c * self._diff
-                next_a = 0
-                next_b = 0
-                next_c = 0
-                #next_status = "normal
-                next_status = 0
-                add_block_to_main = - c
-
-            if (action == 2 or action == 3):
-                legal = True
-                generate_block = True
-
-        elif (a == b and a == 0):
-            if (action == 2 or action == 3):
-                legal = True
-                generate_block = True
+        event = sample_event(self, [o[0] for o in outcomes], move)
+        prob, next_state, attacker_get, honest_get = outcomes[event]
+        next_a, next_b, next_c, next_status = next_state
 
-        elif (a == b and status == 0):
-            # attacker publishes all block and matches
-            if (action == 0):
-                legal = True
-                reward = 0
-                next_a = a
-                next_b = b
-                next_c = c
-                #next_status = "forking"
-                next_status = 2
-
-            # wait
-            if (action == 2 or action == 3):
-                legal = True
-                generate_block = True
-
-        elif (a == b and status == 1):
-            # in this situation, the attacker cannot match!
-            # wait
-            if (action == 2 or action == 3):
-                legal = True
-                generate_block = True
-
-        elif (a == b and status == 2):
-            # wait, 3 fork possibilities
-            if (action == 2 or action == 3):
-                legal = True
-                generate_block = True
-
-        elif (a > b and b == 0):
-            # override, publish a block
-            if (action == 1):
-                legal = True
-                reward = 1
-                next_a = a - 1
-                next_b = 0
-                next_c = 0
-                next_status = 0 # normal
-                add_block_to_main = 1
-
-            if (action == 2 or action == 3):
-                legal = True
-                generate_block = True
+        effort = 0
+        if (action == 2): effort = 1
 
-        elif (a > b and b > 0 and status == 0):
-            legal = True
-            # match, publish b blocks
-            if (action == 0):
-                reward = 0
-                next_a = a
-                next_b = b
-                next_c = c
-                next_status = 2 # "forking"
-            # override, publish (b + 1) blocks
-            if (action == 1):
-                reward = (b + 1)
-                extra_reward = b
-                next_a = a - b - 1
-                next_b = 0
-                next_c = 0
-                next_status = 0 #"normal"
-                add_block_to_main = b + 1
-            if (action == 2 or action == 3):
-                legal = True
-                generate_block = True
+        generate_block = (action == 2 or action == 3)
+        reward = 0
 
-        elif (a > b and b > 0 and status == 2):
-            # don't need match...
-            # override, publish (b + 1) blocks
-            if (action == 1):
-                legal = True
-                reward = (b + 1)
-                extra_reward = b
-                next_a = a - b - 1
-                next_b = 0
-                next_c = 0
-                next_status = 0 #"normal"
-                add_block_to_main = b + 1
-            # wait, 3 fork possibilities
-            if (action == 2 or action == 3):
-                legal = True
-                generate_block = True
-
-        if (generate_block == True and status != 2):
+        if (generate_block == True):
             time_cost = self._diff / (1 - alpha + (alpha * effort))
             reward = -(time_cost / self._standard_diff) * effort * alpha * self._cost # mining cost
             if (move == True):
                 self._round_cost += reward
-            relative_cost = self._relative_p * time_cost
-            event = np.random.choice(3, p = Normalize([alpha * effort, (1 - alpha) * (1 - stale), (1 - alpha) * stale]))
-            # attacker mines a block
-            if (event == 0):
-                next_a = a + 1
-                next_b = b
-                next_c = c
-                if (next_a == next_b):
-                    #next_status = "catch up"
-                    next_status = 1
-                else:
-                    #next_status = "normal"
-                    next_status = 0
-            # honest miner mines a block after main chain
-            if (event == 1):
-                next_a = a
-                next_b = b + 1
-                next_c = c + 1
-                #next_status = "normal"
-                next_status = 0
-            if (event == 2):
-                next_a = a
-                if (self._rule == "longest"):
-                    next_b = b
-                elif (self._rule == "GHOST"):
-                    if (b <= 1): next_b = b
-                    else : next_b = b + 1
-                next_c = c
-                next_status = 0
-
-        relative_cost = 0
-
-        if (generate_block == True and status == 2):
-
-            event = np.random.choice(5, p = Normalize([alpha * effort, (1 - alpha) * gamma * (1 - stale), (1 - alpha) * gamma * stale, \
-                                             (1 - alpha) * (1 - gamma) * (1 - stale), (1 - alpha) * (1 - gamma) * stale]))
-            time_cost = self._diff / (1 - alpha + (alpha * effort))
-            relative_cost = self._relative_p * time_cost
-            reward = -(time_cost / self._standard_diff) * effort * alpha * self._cost # mining cost
-            if (move == True):
-                self._round_cost += reward
-            # attacker mines a block
-            if (event == 0):
-                next_a = a + 1
-                next_b = b
-                next_c = c
-                next_status = 2 # forking
-            # follower mines a block after the attacker's chain
-            if (event == 1):
-                reward += b
-                extra_reward = b
-                next_a = a - b
-                next_b = 1
-                next_c = 1
-                next_status = 0 # "normal"
-                add_block_to_main = b
-            # follower mines a stale block
-            if (event == 2):
-                if (b == 1 or self._rule == "longest"): # no effect
-                    next_a = a
-                    next_b = b
-                    next_c = c
-                    next_status = 2 # forking
-                else:
-                    reward += b
-                    extra_reward = b
-                    next_a = a - b
-                    next_b = 0
-                    next_c = 0
-                    next_status = 0 # "normal"
-                    add_block_to_main = b
-            #unfollower mines a block after the honest main chain
-            if (event == 3):
-                next_a = a
-                next_b = b + 1
-                next_c = c + 1
-                next_status = 0 # normal
-            #unfollower mines a stale block
-            if (event == 4):
-                next_a = a
-                next_c = c
-                if (b == 1 or self._rule == "longest"):
-                    next_b = b # no effect if b == 1
-                    next_status = 2 # forking
-                else:
-                    next_b = b + 1
-                    next_status = 0 # normal
 
-        if (legal == False): return 0, -1e9, False
-
-        next_state = (next_a, next_b, next_c, next_status)
+        reward += attacker_get
+        # > 0 : attacker's fork get into main chain, < 0 : honest fork get into main chain
+        add_block_to_main = attacker_get - honest_get
 
         reset_flag = False
 
@@ -2815,9 +1837,19 @@ class SM_env_with_cost:
         #return next_state, reward + extra_reward, reset_flag
         return next_state, reward, reset_flag
 
+    # legal_action_mask : boolean array over actions, True for legal moves.
+    # Legality depends only on the first 4 state components, masks are cached per key.
+    def legal_action_mask(self, s):
+        key = tuple(s[0 : 4])
+        mask = self._legal_masks.get(key)
+        if (mask is None):
+            mask = np.array([len(self.transitions(key, i)) > 0 for i in range(self._action_space_n)])
+            mask.setflags(write = False)
+            self._legal_masks[key] = mask
+        return mask
+
     def is_legal_move(self, s, a):
-        s1, r, d = self.unmapped_step(s, a, move = False)
-        return r > -1000000
+        return bool(self.legal_action_mask(s)[a])
 
     def legal_move_list(self, s):
         legal_move = []
@@ -2896,4 +1928,21 @@ class SM_env_with_cost:
         s, r, d, a = self.step(sta, action, move = False)
         return a
 
+    # build the sparse MDP of the block race from the transition function (cached)
+    # the difficulty adjustment and the mining cost are not part of the MDP
+    # mdp.states[i] is the state (a, b, c, status) of row i
+    def get_sparse_MDP(self):
+        from . import mdp_cache
+        if (getattr(self, "_sparse_mdp", None) is None):
+            self._sparse_mdp = mdp_cache.load_or_build(self, self._alpha, start = (0, 0, 0, 0))
+        return self._sparse_mdp
 
+    def theoretical_attacker_fraction(self, policy):
+        from . import mdp_cache
+        return mdp_cache.attacker_revenue(self.get_sparse_MDP(), policy)
+
+    # exact revenue of a fixed policy and its derivatives w.r.t. alpha and gamma
+    # return : (revenue, d revenue / d alpha, d revenue / d gamma)
+    def attacker_fraction_sensitivity(self, policy):
+        from . import mdp_util
+        return mdp_util.revenue_sensitivity(self, self.get_sparse_MDP(), policy, self._alpha)
@@ -14,6 +14,7 @@ from gymnasium import spaces
 import numpy as np
 
 from .base_env import SM_env_with_stale
+from .gym_wrapper import check_info_level, check_obs_buffer
 
 
 class GHOSTSelfishMiningEnv(gym.Env):
@@ -34,6 +35,8 @@ class GHOSTSelfishMiningEnv(gym.Env):
         dev (float): alpha随机波动的标准差
         random_interval (tuple): alpha的取值范围
         random_process (str): 随机过程类型 ("iid" 或 "brown")
+        info_level (str): step 返回的 info 详细程度 ('none' / 'terminal' / 'full')
+        obs_buffer (ndarray): float32 观察缓冲区，给出时每步原地写入，见 gym_wrapper.check_obs_buffer
     """
     
     metadata = {"render_modes": ["human"], "render_fps": 30}
@@ -48,7 +51,9 @@ class GHOSTSelfishMiningEnv(gym.Env):
         dev=0.0,
         random_interval=(0.0, 0.5),
         random_process="iid",
-        render_mode=None
+        render_mode=None,
+        info_level="full",
+        obs_buffer=None
     ):
         super().__init__()
         
@@ -86,6 +91,9 @@ class GHOSTSelfishMiningEnv(gym.Env):
         )
         
         self.render_mode = render_mode
+        self.info_level = check_info_level(info_level)
+        # 观察缓冲区，None 时每步返回新数组
+        self.obs_buffer = check_obs_buffer(obs_buffer, self.observation_space)
         
         # 统计信息
         self.current_state = None
@@ -103,14 +111,15 @@ class GHOSTSelfishMiningEnv(gym.Env):
         self.steps = 0
         self.episode_reward = 0
         
-        # 转换为numpy数组
-        obs = np.array(self.current_state, dtype=np.float32)
+        # 转换为 float32 观察
+        obs = self._observation(self.current_state)
         
         info = {
             'alpha': self.alpha,
             'gamma': self.gamma,
             'stale_rate': self.stale_rate,
-            'protocol': 'ghost'
+            'protocol': 'ghost',
+            'action_mask': self.action_masks()
         }
         
         return obs, info
@@ -129,22 +138,64 @@ class GHOSTSelfishMiningEnv(gym.Env):
         self.steps += 1
         self.episode_reward += reward
         
-        # 转换为numpy数组
-        obs = np.array(next_state, dtype=np.float32)
+        # 转换为 float32 观察
+        obs = self._observation(next_state)
         
         # Gymnasium标准：分离terminated和truncated
         terminated = done
         truncated = False
         
+        if self.info_level == 'none' or (self.info_level == 'terminal' and not terminated):
+            return obs, reward, terminated, truncated, {}
+        
         info = {
             'steps': self.steps,
             'episode_reward': self.episode_reward,
             'reward_fraction': getattr(self.env, 'reward_fraction', 0),
-            'protocol': 'ghost'
+            'protocol': 'ghost',
+            'action_mask': self.action_masks()
         }
         
         return obs, reward, terminated, truncated, info
     
+    def action_masks(self):
+        """
+        当前状态下的合法动作掩码，True 表示合法（非法动作在 step 中会被映射为合法动作）
+        
+        与 sb3_contrib 的 MaskablePPO 约定同名；掩码来自底层环境的缓存，只读
+        """
+        return self.env.legal_action_mask(self.current_state)
+    
+    def get_state(self, rng=True):
+        """
+        当前状态的快照（不可变），用于蒙特卡洛 rollout 或树搜索从同一状态多次分支
+
+        参数：
+            rng (bool): 是否同时保存全局 np.random 状态（恢复后随机事件序列也相同）
+
+        返回：
+            snapshot (tuple): 底层环境的 EnvSnapshot 和包装器的计数
+        """
+        return (self.env.get_state(rng), self.current_state, self.steps, self.episode_reward)
+    
+    def set_state(self, snapshot):
+        """
+        恢复 get_state 保存的快照
+
+        返回：
+            observation: 恢复后的观察
+        """
+        sim_state, self.current_state, self.steps, self.episode_reward = snapshot
+        self.env.set_state(sim_state)
+        return self._observation(self.current_state)
+    
+    def _observation(self, state):
+        """状态元组转换为 float32 观察；有缓冲区时原地写入，不分配新数组"""
+        if self.obs_buffer is None:
+            return np.array(state, dtype=np.float32)
+        self.obs_buffer[...] = state
+        return self.obs_buffer
+    
     def render(self):
         """渲染（可选）"""
         if self.render_mode == "human":
@@ -199,7 +250,9 @@ class EthereumSelfishMiningEnv(gym.Env):
         dev=0.0,
         random_interval=(0.0, 0.5),
         random_process="iid",
-        render_mode=None
+        render_mode=None,
+        info_level="full",
+        obs_buffer=None
     ):
         super().__init__()
         
@@ -232,6 +285,9 @@ class EthereumSelfishMiningEnv(gym.Env):
         )
         
         self.render_mode = render_mode
+        self.info_level = check_info_level(info_level)
+        # 观察缓冲区，None 时每步返回新数组
+        self.obs_buffer = check_obs_buffer(obs_buffer, self.observation_space)
         self.current_state = None
         self.steps = 0
         self.episode_reward = 0
@@ -247,13 +303,14 @@ class EthereumSelfishMiningEnv(gym.Env):
         self.steps = 0
         self.episode_reward = 0
         
-        obs = np.array(self.current_state, dtype=np.float32)
+        obs = self._observation(self.current_state)
         
         info = {
             'alpha': self.alpha,
             'gamma': self.gamma,
             'stale_rate': self.stale_rate,
-            'protocol': 'ethereum'
+            'protocol': 'ethereum',
+            'action_mask': self.action_masks()
         }
         
         return obs, info
@@ -271,20 +328,62 @@ class EthereumSelfishMiningEnv(gym.Env):
         self.steps += 1
         self.episode_reward += reward
         
-        obs = np.array(next_state, dtype=np.float32)
+        obs = self._observation(next_state)
         
         terminated = done
         truncated = False
         
+        if self.info_level == 'none' or (self.info_level == 'terminal' and not terminated):
+            return obs, reward, terminated, truncated, {}
+        
         info = {
             'steps': self.steps,
             'episode_reward': self.episode_reward,
             'reward_fraction': getattr(self.env, 'reward_fraction', 0),
-            'protocol': 'ethereum'
+            'protocol': 'ethereum',
+            'action_mask': self.action_masks()
         }
         
         return obs, reward, terminated, truncated, info
     
+    def action_masks(self):
+        """
+        当前状态下的合法动作掩码，True 表示合法（非法动作在 step 中会被映射为合法动作）
+        
+        与 sb3_contrib 的 MaskablePPO 约定同名；掩码来自底层环境的缓存，只读
+        """
+        return self.env.legal_action_mask(self.current_state)
+    
+    def get_state(self, rng=True):
+        """
+        当前状态的快照（不可变），用于蒙特卡洛 rollout 或树搜索从同一状态多次分支
+
+        参数：
+            rng (bool): 是否同时保存全局 np.random 状态（恢复后随机事件序列也相同）
+
+        返回：
+            snapshot (tuple): 底层环境的 EnvSnapshot 和包装器的计数
+        """
+        return (self.env.get_state(rng), self.current_state, self.steps, self.episode_reward)
+    
+    def set_state(self, snapshot):
+        """
+        恢复 get_state 保存的快照
+
+        返回：
+            observation: 恢复后的观察
+        """
+        sim_state, self.current_state, self.steps, self.episode_reward = snapshot
+        self.env.set_state(sim_state)
+        return self._observation(self.current_state)
+    
+    def _observation(self, state):
+        """状态元组转换为 float32 观察；有缓冲区时原地写入，不分配新数组"""
+        if self.obs_buffer is None:
+            return np.array(state, dtype=np.float32)
+        self.obs_buffer[...] = state
+        return self.obs_buffer
+    
     def render(self):
         """渲染"""
         if self.render_mode == "human":
@@ -4,6 +4,8 @@ T2: Gym 包装器
 使其能够与 Stable-Baselines3 配合使用
 """
 
+import functools
+
 import gymnasium as gym
 from gymnasium import spaces
 import numpy as np
@@ -13,12 +15,114 @@ from .base_env import SM_env, SM_env_with_stale
 GHOSTSelfishMiningEnv = None
 EthereumSelfishMiningEnv = None
 
+# step 返回的 info 详细程度：
+#   'full'     每步都构造完整的 info（默认，与原来一致）
+#   'terminal' 只在底层环境给出 done 时构造，其余步返回空字典
+#   'none'     总是返回空字典；训练和快速评估不读取 info，省去每步的字典构造和属性查询
+INFO_LEVELS = ('none', 'terminal', 'full')
+
+
+def check_info_level(info_level):
+    """检查 info_level 取值，返回原值"""
+    if info_level not in INFO_LEVELS:
+        raise ValueError(f"Unknown info_level: {info_level}. Supported: {', '.join(INFO_LEVELS)}")
+    return info_level
+
+
+def check_obs_buffer(obs_buffer, observation_space):
+    """
+    检查观察缓冲区：形状和类型必须与观察空间一致，返回原值
+
+    给出缓冲区时，包装器把每步的观察直接写入其中并返回它本身，不再每步分配新数组。
+    缓冲区可以是共享批量缓冲区的一行（如 batch[i, ...]），这样 n 个环境的观察自动拼成一批；
+    返回的观察在下一次 step / reset 时会被覆盖，需要保留时由调用方复制。
+    """
+    if obs_buffer is None:
+        return None
+    if obs_buffer.shape != observation_space.shape or obs_buffer.dtype != observation_space.dtype:
+        raise ValueError(f"obs_buffer 应为 shape={observation_space.shape}, dtype={observation_space.dtype}，"
+                         f"实际为 shape={obs_buffer.shape}, dtype={obs_buffer.dtype}")
+    return obs_buffer
+
+
+def attach_obs_buffer(env):
+    """
+    给 Box 观察的包装环境分配它自己的观察缓冲区，返回 env（已有缓冲区或 Discrete 观察时不变）
+
+    包装器默认每步返回新数组，调用方可以任意保存观察。训练和评估循环只在下一步之前使用观察，
+    由它们调用本函数省去每步的数组分配；需要保留 episode 最后一个观察时（SB3 的 terminal_observation）
+    再套一层 CopyOnEpisodeEnd。
+    """
+    space = env.observation_space
+    if env.obs_buffer is None and isinstance(space, spaces.Box):
+        env.obs_buffer = np.zeros(space.shape, dtype=space.dtype)
+    return env
+
+
+class CopyOnEpisodeEnd(gym.Wrapper):
+    """
+    episode 结束（terminated 或 truncated）时返回观察的副本
+
+    SB3 的 DummyVecEnv 在 episode 结束时把最后一个观察存为 info['terminal_observation'] 后立即 reset，
+    使用观察缓冲区时 reset 会覆盖它。放在 TimeLimit 外层，被 TimeLimit 截断时同样复制。
+    """
+
+    def step(self, action):
+        obs, reward, terminated, truncated, info = self.env.step(action)
+        if (terminated or truncated) and isinstance(obs, np.ndarray):
+            obs = obs.copy()
+        return obs, reward, terminated, truncated, info
+
+
+# BitcoinSelfishMiningEnv 的观察编码：
+#   'index'    状态索引，Discrete 观察空间（默认，与原来一致；SB3 会把它 one-hot 编码）
+#   'onehot'   显式的 one-hot 向量
+#   'features' (a/(m+1), b/(m+1), 状态 one-hot)，a、b 为攻击者私有链和公开链长度，m 为最大分叉长度
+#   'lead'     features 之前再加一列归一化领先量 (a-b)/(m+1)
+OBSERVATION_ENCODINGS = ('index', 'onehot', 'features', 'lead')
+STATUS_NAMES = ('normal', 'catch up', 'forking')
+
+# (编码, 最大分叉长度) -> 编码表，状态空间只由最大分叉长度决定，同一进程内的环境共用
+_encoding_tables = {}
+
+
+def encoding_table(state_space, max_fork_length, encoding):
+    """
+    观察编码表：第 i 行是状态 i 的观察，编码一批状态只需一次索引 table[indices]
+
+    参数：
+        state_space (list): 底层环境的状态列表 [(a, b, status)]
+        max_fork_length (int): 最大分叉长度
+        encoding (str): 'onehot' / 'features' / 'lead'
+
+    返回：
+        table (ndarray): (状态数, 观察维数) 的只读 float32 数组
+    """
+    key = (encoding, max_fork_length)
+    if key not in _encoding_tables:
+        n = len(state_space)
+        if encoding == 'onehot':
+            table = np.eye(n, dtype=np.float32)
+        elif encoding in ('features', 'lead'):
+            scale = max_fork_length + 1
+            a, b = (np.array([s[i] for s in state_space], dtype=np.float32) for i in (0, 1))
+            status = np.array([STATUS_NAMES.index(s[2]) for s in state_space])
+            columns = [a / scale, b / scale] + [(status == k).astype(np.float32) for k in range(len(STATUS_NAMES))]
+            if encoding == 'lead':
+                columns.insert(0, (a - b) / scale)
+            table = np.stack(columns, axis=1)
+        else:
+            raise ValueError(f"Unknown encoding: {encoding}. Supported: {', '.join(OBSERVATION_ENCODINGS)}")
+        table.setflags(write=False)
+        _encoding_tables[key] = table
+    return _encoding_tables[key]
+
 
 class BitcoinSelfishMiningEnv(gym.Env):
     """
     Bitcoin 自私挖矿环境的 Gym 包装器
     
-    观察空间：状态索引
+    观察空间：状态索引，或由 encoding 选择的特征向量（见 OBSERVATION_ENCODINGS）
     动作空间：3个动作 (adopt, override, match, wait)
     
     参数：
@@ -27,12 +131,16 @@ class BitcoinSelfishMiningEnv(gym.Env):
         max_fork_length (int): 最大分叉长度
         stale_rate (float): 孤块率 (0-0.1)
         protocol (str): 共识协议 ("bitcoin" 或 "ghost")
+        info_level (str): step 返回的 info 详细程度，见 INFO_LEVELS
+        encoding (str): 观察编码，'index' 以外的编码只支持 stale_rate=0
+        obs_buffer (ndarray): 观察缓冲区（形状和类型与观察空间一致），见 check_obs_buffer
     """
     
     metadata = {'render.modes': ['human']}
     
     def __init__(self, alpha=0.35, gamma=0.5, max_fork_length=20, 
-                 stale_rate=0.0, protocol="bitcoin", **kwargs):
+                 stale_rate=0.0, protocol="bitcoin", info_level="full", encoding="index",
+                 obs_buffer=None, **kwargs):
         super(BitcoinSelfishMiningEnv, self).__init__()
         
         self.alpha = alpha
@@ -40,6 +148,7 @@ class BitcoinSelfishMiningEnv(gym.Env):
         self.max_fork_length = max_fork_length
         self.stale_rate = stale_rate
         self.protocol = protocol
+        self.info_level = check_info_level(info_level)
         
         # 创建底层环境
         if stale_rate > 0:
@@ -67,7 +176,18 @@ class BitcoinSelfishMiningEnv(gym.Env):
         # 定义观察空间：状态索引
         # 状态数量取决于 max_fork_length
         n_states = len(self.env._state_space)
-        self.observation_space = spaces.Discrete(n_states)
+        self.encoding = encoding
+        if encoding == 'index':
+            self.encoding_table = None
+            self.observation_space = spaces.Discrete(n_states)
+        else:
+            if stale_rate > 0:
+                raise ValueError(f"encoding='{encoding}' 只支持 stale_rate=0 (状态为索引的环境)")
+            # 编码表按状态索引查表，每步只是一次行拷贝
+            self.encoding_table = encoding_table(self.env._state_space, max_fork_length, encoding)
+            self.observation_space = spaces.Box(low=-1.0, high=1.0, shape=self.encoding_table.shape[1:],
+                                                dtype=np.float32)
+        self.obs_buffer = check_obs_buffer(obs_buffer, self.observation_space)
         
         self.current_state = None
         self.steps = 0
@@ -96,10 +216,11 @@ class BitcoinSelfishMiningEnv(gym.Env):
         # Gymnasium 标准：reset 需要返回 (observation, info)
         info = {
             'alpha': self.alpha,
-            'gamma': self.gamma
+            'gamma': self.gamma,
+            'action_mask': self.action_masks()
         }
         
-        return self.current_state, info
+        return self._observation(self.current_state), info
     
     def step(self, action):
         """
@@ -133,6 +254,9 @@ class BitcoinSelfishMiningEnv(gym.Env):
         terminated = done  # 原环境的 done 表示 terminated
         truncated = False  # 我们不使用 truncation
         
+        if self.info_level == 'none' or (self.info_level == 'terminal' and not terminated):
+            return self._observation(next_state), reward, terminated, truncated, {}
+        
         # 创建新的 info 字典
         # 获取真正的相对奖励（攻击者区块占比）
         reward_fraction = getattr(self.env, 'reward_fraction', 0)
@@ -146,10 +270,64 @@ class BitcoinSelfishMiningEnv(gym.Env):
             'state_info': self.get_state_info(next_state),
             'reward_fraction': reward_fraction,  # 这是论文中的相对奖励！
             'attacker_blocks': attacker_blocks,
-            'honest_blocks': honest_blocks
+            'honest_blocks': honest_blocks,
+            'action_mask': self.action_masks()
         }
         
-        return next_state, reward, terminated, truncated, info
+        return self._observation(next_state), reward, terminated, truncated, info
+    
+    def action_masks(self):
+        """
+        当前状态下的合法动作掩码，True 表示合法（非法动作在 step 中会被映射为合法动作）
+        
+        与 sb3_contrib 的 MaskablePPO 约定同名；掩码来自底层环境的缓存，只读
+        """
+        return self.env.legal_action_mask(self.current_state)
+    
+    def get_state(self, rng=True):
+        """
+        当前状态的快照（不可变），用于蒙特卡洛 rollout 或树搜索从同一状态多次分支
+
+        参数：
+            rng (bool): 是否同时保存全局 np.random 状态（恢复后随机事件序列也相同）
+
+        返回：
+            snapshot (tuple): 底层环境的 EnvSnapshot 和包装器的计数
+        """
+        return (self.env.get_state(rng), self.current_state, self.steps, self.episode_reward)
+    
+    def set_state(self, snapshot):
+        """
+        恢复 get_state 保存的快照
+
+        返回：
+            observation: 恢复后的观察
+        """
+        sim_state, self.current_state, self.steps, self.episode_reward = snapshot
+        self.env.set_state(sim_state)
+        return self._observation(self.current_state)
+    
+    def encode(self, states):
+        """
+        把一批状态索引编码为观察：一次查表索引
+
+        参数：
+            states (ndarray): 状态索引，任意形状
+
+        返回：
+            obs (ndarray): 'index' 编码时原样返回，否则为 states.shape + 观察形状的 float32 数组
+        """
+        if self.encoding_table is None:
+            return states
+        return self.encoding_table[states]
+    
+    def _observation(self, state):
+        """状态索引按编码查表得到观察；有缓冲区时写入缓冲区"""
+        if self.obs_buffer is None:
+            # 编码表只读，返回副本，调用方保存的观察不会被后续步骤影响
+            return state if self.encoding_table is None else self.encoding_table[state].copy()
+        self.obs_buffer[...] = state if self.encoding_table is None else self.encoding_table[state]
+        return self.obs_buffer
     
     def render(self, mode='human'):
         """渲染环境（可选）"""
@@ -232,6 +410,48 @@ def make_env(protocol="bitcoin", **kwargs):
         raise ValueError(f"Unknown protocol: {protocol}. Supported: bitcoin, ghost, ethereum, utb")
 
 
+def make_vector_env(protocol="bitcoin", num_envs=1, **kwargs):
+    """
+    批量环境工厂：num_envs 个同配置环境组成的 SelfishMiningVectorEnv
+
+    参数：
+        protocol (str): 协议，与 make_env 相同
+        num_envs (int): 环境个数
+        **kwargs: 传给 SelfishMiningVectorEnv 的参数（max_episode_steps、copy、info_level）和环境参数
+
+    返回：
+        envs (gym.vector.VectorEnv): 批量环境
+    """
+    from .vector_env import SelfishMiningVectorEnv
+    return SelfishMiningVectorEnv(protocol=protocol, num_envs=num_envs, **kwargs)
+
+
+# gymnasium 环境 ID -> 协议；参数名与 make_env 相同（alpha、gamma 等），例如
+#   gym.make("BlockRL/Ethereum-v0", alpha=0.35)
+#   gym.make_vec("BlockRL/Bitcoin-v0", num_envs=8, alpha=0.35, encoding="features")
+# 也可以不先导入本模块：gym.make("src.environment.gym_wrapper:BlockRL/UTB-v0")
+ENV_IDS = {
+    'BlockRL/Bitcoin-v0': 'bitcoin',
+    'BlockRL/GHOST-v0': 'ghost',
+    'BlockRL/Ethereum-v0': 'ethereum',
+    'BlockRL/UTB-v0': 'utb',
+}
+
+
+def register_envs():
+    """在 gymnasium 中注册全部协议（已注册的 ID 跳过），make_vec 默认使用 SelfishMiningVectorEnv"""
+    for env_id, protocol in ENV_IDS.items():
+        if env_id not in gym.registry:
+            gym.register(
+                id=env_id,
+                entry_point=functools.partial(make_env, protocol),
+                vector_entry_point=functools.partial(make_vector_env, protocol),
+            )
+
+
+register_envs()
+
+
 if __name__ == "__main__":
     # 测试代码
     print("测试 Gym 包装器...")
@@ -252,4 +472,3 @@ if __name__ == "__main__":
             break
     
     print("\nGym 包装器测试完成！")
-
@@ -1,5 +1,7 @@
 import numpy as np
-import mdptoolbox
+import scipy.sparse as sp
+import scipy.sparse.linalg as spla
+from scipy.sparse.csgraph import breadth_first_order
 
 def null(A, eps=1e-8):
     u, s, vh = np.linalg.svd(A)
@@ -26,6 +28,59 @@ def MP_stationary_distribution(A):
     #print(p)
     return p
 
+# input : sparse transition matrix P(n x n), index of the starting state
+# return : stationary distribution p(n) of the chain started from 'start'
+# Only the states reachable from 'start' are kept, so transient / unreachable
+# states (e.g. illegal self-loops) do not make the system singular.
+# One equation of (P - I)^T p = 0 is redundant, we replace it by sum(p) = 1.
+
+def MP_sparse_stationary_distribution(P, start = 0):
+    P = sp.csr_matrix(P)
+    n = P.shape[0]
+    reach = np.sort(breadth_first_order(P, start, directed = True, return_predecessors = False))
+    m = len(reach)
+    Q = P[reach][:, reach]
+    M = (Q.T - sp.eye(m, format = "csr")).tolil()
+    M[0, :] = np.ones(m)
+    b = np.zeros(m)
+    b[0] = 1
+    p = np.zeros(n)
+    p[reach] = spla.spsolve(M.tocsc(), b)
+    return p
+
+# input : sparse transition matrix P(n x n), list of derivatives dP/dtheta (n x n), index of the starting state
+# return : stationary distribution p(n) and its derivatives dp/dtheta(n) for every theta
+# Differentiating p(P - I) = 0, sum(p) = 1 gives dp(P - I) = -p dP, sum(dp) = 0:
+# the same matrix as the stationary system, so one LU factorization serves p and all dp.
+# States reached only through dP (e.g. gamma = 0 turning positive) are kept as well.
+
+def MP_sparse_stationary_derivative(P, dPs, start = 0):
+    P = sp.csr_matrix(P)
+    dPs = [sp.csr_matrix(dP) for dP in dPs]
+    n = P.shape[0]
+    pattern = abs(P)
+    for dP in dPs: pattern = pattern + abs(dP)
+    reach = np.sort(breadth_first_order(sp.csr_matrix(pattern), start, directed = True, return_predecessors = False))
+    m = len(reach)
+    Q = P[reach][:, reach]
+    M = (Q.T - sp.eye(m, format = "csr")).tolil()
+    M[0, :] = np.ones(m)
+    lu = spla.splu(M.tocsc())
+
+    b = np.zeros(m)
+    b[0] = 1
+    p = np.zeros(n)
+    p[reach] = lu.solve(b)
+
+    dps = []
+    for dP in dPs:
+        b = - (dP[reach][:, reach].T @ p[reach])
+        b[0] = 0
+        dp = np.zeros(n)
+        dp[reach] = lu.solve(b)
+        dps.append(dp)
+    return p, dps
+
 ## Markov Reward Process
 # input : transition matrix A(n x n), reward matrix R(n x n)
 # output : expected reward
@@ -0,0 +1,217 @@
+"""
+最优策略图谱 (atlas)
+
+在 (alpha, gamma, stale_rate) 参数网格上批量求解精确的最优选择性挖矿策略，
+结果写入一个可查询的 .npz 数组文件，供 Streamlit 页面和绘图脚本直接读取，
+代替闭式的 SM1 公式和经验估计。
+
+网格按 (gamma, stale_rate) 分行并行求解：每一行在一个工作进程内按 alpha 递增顺序求解，
+每个格点都用相邻格点的最优策略和 OSM 下界热启动。
+"""
+
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+from . import mdp_util
+from . import mdp_cache
+
+ATLAS_DIR = os.path.join(mdp_cache.PROJECT_ROOT, 'results', 'atlas')
+
+# 各协议默认的最大隐藏区块数（ethereum 的状态空间随其指数增长）
+DEFAULT_MAX_HIDDEN_BLOCK = {'bitcoin': 20, 'ghost': 10, 'ethereum': 3}
+
+
+def default_atlas_path(protocol):
+    """协议图谱的默认路径 results/atlas/<protocol>.npz"""
+    return os.path.join(ATLAS_DIR, f"{protocol}.npz")
+
+
+class Atlas:
+    """
+    最优策略图谱
+
+    属性：
+        protocol (str): 协议名
+        max_hidden_block (int): 最大隐藏区块数
+        alphas, gammas, stale_rates (ndarray): 网格坐标
+        revenue (ndarray): (Z, G, A) 最优策略的精确收益占比
+        relative_p (ndarray): (Z, G, A) OSM 二分搜索得到的相对收益 p
+        policies (ndarray): (Z, G, A, S) 最优策略，int8
+        states (ndarray): 策略对应的环境原生状态
+    """
+
+    def __init__(self, protocol, max_hidden_block, alphas, gammas, stale_rates, revenue, relative_p, policies, states):
+        self.protocol = protocol
+        self.max_hidden_block = int(max_hidden_block)
+        self.alphas = np.asarray(alphas, dtype=np.float64)
+        self.gammas = np.asarray(gammas, dtype=np.float64)
+        self.stale_rates = np.asarray(stale_rates, dtype=np.float64)
+        self.revenue = revenue
+        self.relative_p = relative_p
+        self.policies = policies
+        self.states = states
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        np.savez_compressed(
+            path, protocol=np.array(self.protocol), max_hidden_block=np.int64(self.max_hidden_block),
+            alphas=self.alphas, gammas=self.gammas, stale_rates=self.stale_rates,
+            revenue=self.revenue, relative_p=self.relative_p, policies=self.policies, states=self.states,
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(str(data['protocol']), int(data['max_hidden_block']), data['alphas'], data['gammas'],
+                       data['stale_rates'], data['revenue'], data['relative_p'], data['policies'], data['states'])
+
+    def _nearest(self, alpha, gamma, stale_rate):
+        return (int(np.abs(self.stale_rates - stale_rate).argmin()),
+                int(np.abs(self.gammas - gamma).argmin()),
+                int(np.abs(self.alphas - alpha).argmin()))
+
+    def revenue_at(self, alpha, gamma, stale_rate=0.0):
+        """
+        查询任意参数点的最优收益，在网格内做 (alpha, gamma) 双线性插值，stale_rate 取最近格点
+
+        参数超出网格范围时会被截断到边界。
+        """
+        z = self._nearest(alpha, gamma, stale_rate)[0]
+        surface = self.revenue[z]
+        if len(self.gammas) == 1:
+            return float(np.interp(alpha, self.alphas, surface[0]))
+        if len(self.alphas) == 1:
+            return float(np.interp(gamma, self.gammas, surface[:, 0]))
+        # 先沿 alpha 插值得到每个 gamma 上的值，再沿 gamma 插值
+        by_gamma = np.array([np.interp(alpha, self.alphas, row) for row in surface])
+        return float(np.interp(gamma, self.gammas, by_gamma))
+
+    def policy_at(self, alpha, gamma, stale_rate=0.0):
+        """最近格点的最优策略"""
+        return self.policies[self._nearest(alpha, gamma, stale_rate)]
+
+    def surface(self, stale_rate=0.0):
+        """
+        绘图用的收益曲面
+
+        返回：
+            alphas (ndarray), gammas (ndarray), Z (ndarray): Z[i, j] 对应 (gammas[i], alphas[j])，
+            与 np.meshgrid(alphas, gammas) 的布局一致
+        """
+        z = self._nearest(self.alphas[0], self.gammas[0], stale_rate)[0]
+        return self.alphas, self.gammas, self.revenue[z]
+
+
+def load_atlas(protocol, path=None):
+    """读取协议图谱，文件不存在时返回 None"""
+    path = path or default_atlas_path(protocol)
+    if not os.path.exists(path):
+        return None
+    return Atlas.load(path)
+
+
+def _solve_line(task):
+    """
+    工作进程：求解一行 (固定 gamma 和 stale_rate) 上所有 alpha 的最优策略
+
+    OSM 收益随 alpha 单调不减，所以上一格的 p 通常仍是可行的下界，
+    上一格的最优策略也是很好的热启动；不可行时退回以 alpha 为下界。
+    """
+    protocol, max_hidden_block, gamma, stale_rate, stale_states, alphas, states, start = task
+    eps = 1e-4
+
+    env = mdp_cache.make_protocol_env(protocol, max_hidden_block, alphas[0], gamma, stale_rate, stale_states)
+    cache = mdp_cache.get_default_cache()
+
+    revenue = np.zeros(len(alphas))
+    relative_p = np.zeros(len(alphas))
+    policies = np.zeros((len(alphas), len(states)), dtype=np.int8)
+
+    prev_policy, prev_p = None, None
+    for i, alpha in enumerate(alphas):
+        config = mdp_cache.protocol_config(protocol, max_hidden_block, alpha, gamma, stale_rate, stale_states)
+        hit = cache.load_solution(config) if cache is not None else None
+
+        if hit is not None and len(hit[0]) == len(states):
+            policy, p, rev = hit
+        else:
+            mdp = mdp_util.build_sparse_mdp(env, alpha=alpha, states=states, start=states[start])
+            low = alpha
+            if prev_policy is not None and prev_p > alpha:
+                guess_policy, V = mdp.policy_iteration(prev_p, policy0=prev_policy)
+                if V[mdp.start] > -eps:
+                    low, prev_policy = prev_p, guess_policy
+            policy, p = mdp.optimal_policy(low, eps=eps, policy0=prev_policy)
+            rev = mdp.revenue(policy)
+            if cache is not None:
+                cache.save_solution(config, policy, p, rev)
+
+        revenue[i], relative_p[i], policies[i] = rev, p, policy
+        prev_policy, prev_p = np.asarray(policy, dtype=np.int64), p
+
+    return revenue, relative_p, policies
+
+
+def build_atlas(protocol, alphas, gammas, stale_rates=(0.0,), max_hidden_block=None, n_workers=None,
+                output_path=None, verbose=1):
+    """
+    并行求解参数网格上的最优策略图谱
+
+    参数：
+        protocol (str): 'bitcoin' / 'ghost' / 'ethereum'
+        alphas, gammas, stale_rates (list): 网格坐标
+        max_hidden_block (int): 最大隐藏区块数，None 时使用协议默认值
+        n_workers (int): 进程数，None 时使用全部 CPU，1 表示在当前进程内求解
+        output_path (str): 输出的 .npz 路径，None 时写入 results/atlas/<protocol>.npz
+        verbose (int): 详细程度
+
+    返回：
+        atlas (Atlas)
+    """
+    if max_hidden_block is None:
+        max_hidden_block = DEFAULT_MAX_HIDDEN_BLOCK[protocol]
+    alphas = np.sort(np.asarray(alphas, dtype=np.float64))
+    gammas = np.asarray(gammas, dtype=np.float64)
+    stale_rates = np.asarray(stale_rates, dtype=np.float64)
+
+    # 所有格点共用同一份状态列表，使策略数组形状一致。
+    # 内部参数点上的可达状态集合最大，gamma = 0 / 1 等边界点只会少一些转移。
+    # bitcoin 网格同时包含 0 和正的陈旧区块率时，stale_rate = 0 的行也使用 SM_env_with_stale，
+    # 否则 SM_env 的状态索引与参考环境的元组状态不一致。
+    stale_states = bool((stale_rates > 0).any())
+    ref_env = mdp_cache.make_protocol_env(protocol, max_hidden_block, 0.3, 0.5, stale_rates.max(), stale_states)
+    ref_mdp = ref_env.get_sparse_MDP()
+    states, start = ref_mdp.states, ref_mdp.start
+
+    tasks = [(protocol, max_hidden_block, g, z, stale_states, alphas, states, start)
+             for z in stale_rates for g in gammas]
+
+    if verbose:
+        print(f"求解 {protocol} 图谱: {len(alphas)} x {len(gammas)} x {len(stale_rates)} 个格点, "
+              f"{len(states)} 个状态")
+
+    if n_workers == 1:
+        lines = [_solve_line(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            lines = []
+            for k, line in enumerate(pool.map(_solve_line, tasks)):
+                lines.append(line)
+                if verbose:
+                    print(f"  [{k + 1}/{len(tasks)}] 完成")
+
+    shape = (len(stale_rates), len(gammas))
+    revenue = np.stack([l[0] for l in lines]).reshape(shape + (len(alphas),))
+    relative_p = np.stack([l[1] for l in lines]).reshape(shape + (len(alphas),))
+    policies = np.stack([l[2] for l in lines]).reshape(shape + (len(alphas), len(states)))
+
+    atlas = Atlas(protocol, max_hidden_block, alphas, gammas, stale_rates, revenue, relative_p,
+                  policies, np.asarray(states))
+
+    output_path = output_path or default_atlas_path(protocol)
+    atlas.save(output_path)
+    if verbose:
+        print(f"图谱已保存到: {output_path}")
+
+    return atlas
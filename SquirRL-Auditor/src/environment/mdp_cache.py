@@ -0,0 +1,362 @@
+"""
+MDP 与最优策略的磁盘缓存
+
+同一组参数的 MDP 往往会被构建、求解成百上千次（绘图脚本、Streamlit 页面、批量实验）。
+本模块把稀疏转移/收益矩阵、OSM 最优策略和精确收益按配置内容寻址地缓存到
+项目目录下的 cache/mdp 中，使用压缩的 .npz 文件，并按总大小做 LRU 淘汰。
+
+缓存键由 (环境类, max_hidden_block, alpha, gamma, stale_rate, rule) 决定；
+设置环境变量 BLOCKRL_MDP_CACHE=off 可以关闭缓存，设置为目录路径可以改变缓存位置。
+"""
+
+import os
+import hashlib
+import json
+import numpy as np
+import scipy.sparse as sp
+
+from . import mdp_util
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+DEFAULT_CACHE_DIR = os.path.join(PROJECT_ROOT, 'cache', 'mdp')
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+# 缓存格式版本，转移定义或存储格式变化时递增，使旧条目自然失效
+CACHE_VERSION = 1
+
+
+def make_config(env_name, max_hidden_block, alpha, gamma, stale_rate=0.0, rule='longest'):
+    """
+    缓存键配置
+
+    返回：
+        config (dict): 可 JSON 序列化的配置
+    """
+    return {
+        'env': env_name,
+        'max_hidden_block': int(max_hidden_block),
+        # 期望 alpha 是一百万次采样的均值，带有浮点误差，取整后再作为键
+        'alpha': round(float(alpha), 9),
+        'gamma': round(float(gamma), 9),
+        'stale_rate': round(float(stale_rate), 9),
+        'rule': rule,
+    }
+
+
+def env_config(env, alpha):
+    """
+    底层环境的缓存配置
+
+    参数：
+        env: 底层环境（SM_env / SM_env_with_stale / eth_env / SM_env_with_cost）
+        alpha (float): 构建 MDP 时实际使用的攻击者算力
+    """
+    return make_config(type(env).__name__, env._max_hidden_block, alpha, env._gamma,
+                       getattr(env, '_stale_rate', 0.0), getattr(env, '_rule', 'longest'))
+
+
+def config_digest(config):
+    """配置的内容地址（sha1）"""
+    payload = json.dumps(dict(config, version=CACHE_VERSION), sort_keys=True)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def _pack_states(states):
+    arr = np.asarray(states)
+    if arr.dtype == object:
+        raise ValueError("只能缓存由整数组成的状态")
+    return arr
+
+
+def _unpack_states(arr):
+    if arr.ndim == 1:
+        return [int(s) for s in arr]
+    return [tuple(int(x) for x in s) for s in arr]
+
+
+class MDPCache:
+    """
+    内容寻址的 MDP / 策略缓存
+
+    每个配置对应若干文件：
+        <digest>.mdp.npz              稀疏 MDP
+        <digest>.osm.npz              最优策略、OSM 相对收益 p 和精确收益
+        <digest>.rev.<policy>.npz     任意策略的精确收益
+
+    参数：
+        root (str): 缓存目录
+        max_bytes (int): 缓存总大小上限，超出时按最近使用时间淘汰
+    """
+
+    def __init__(self, root=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+
+    def _path(self, digest, kind):
+        return os.path.join(self.root, f"{digest}.{kind}.npz")
+
+    def _load(self, path):
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as data:
+                entry = {k: data[k] for k in data.files}
+        except (OSError, ValueError, KeyError):
+            # 损坏的条目（例如写入时进程被中断）直接丢弃
+            os.remove(path)
+            return None
+        # 更新修改时间作为 LRU 的使用记录
+        os.utime(path, None)
+        return entry
+
+    def _save(self, path, **arrays):
+        os.makedirs(self.root, exist_ok=True)
+        # 先写临时文件再原子替换，避免并发读到半个文件
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez_compressed(f, **arrays)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def evict(self):
+        """按最近使用时间淘汰条目，直到总大小不超过 max_bytes"""
+        if not os.path.isdir(self.root):
+            return
+        entries = []
+        for name in os.listdir(self.root):
+            if not name.endswith('.npz'):
+                continue
+            path = os.path.join(self.root, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        """删除全部缓存条目"""
+        if not os.path.isdir(self.root):
+            return
+        for name in os.listdir(self.root):
+            if name.endswith('.npz'):
+                os.remove(os.path.join(self.root, name))
+
+    # ---------------- 稀疏 MDP ----------------
+
+    def load_mdp(self, config):
+        entry = self._load(self._path(config_digest(config), 'mdp'))
+        if entry is None:
+            return None
+        n = len(entry['states'])
+        matrices = {}
+        for name in ('P', 'PA', 'PH'):
+            matrices[name] = [
+                sp.csr_matrix((entry[f'{name}{a}_data'], entry[f'{name}{a}_indices'], entry[f'{name}{a}_indptr']),
+                              shape=(n, n))
+                for a in range(int(entry['n_actions']))
+            ]
+        states = _unpack_states(entry['states'])
+        index = dict(zip(states, range(n)))
+        return mdp_util.SparseMDP(states, index, matrices['P'], matrices['PA'], matrices['PH'],
+                                  entry['legal'], int(entry['start']))
+
+    def save_mdp(self, config, mdp):
+        arrays = {
+            'states': _pack_states(mdp.states),
+            'legal': mdp.legal,
+            'start': np.int64(mdp.start),
+            'n_actions': np.int64(mdp.A),
+        }
+        for name, mats in (('P', mdp.P), ('PA', mdp.PA), ('PH', mdp.PH)):
+            for a, M in enumerate(mats):
+                arrays[f'{name}{a}_data'] = M.data
+                arrays[f'{name}{a}_indices'] = M.indices
+                arrays[f'{name}{a}_indptr'] = M.indptr
+        self._save(self._path(config_digest(config), 'mdp'), **arrays)
+
+    # ---------------- 最优策略 ----------------
+
+    def load_solution(self, config):
+        """返回 (policy, p, revenue)，未命中时返回 None"""
+        entry = self._load(self._path(config_digest(config), 'osm'))
+        if entry is None:
+            return None
+        return entry['policy'], float(entry['relative_p']), float(entry['revenue'])
+
+    def save_solution(self, config, policy, relative_p, revenue):
+        self._save(self._path(config_digest(config), 'osm'),
+                   policy=np.asarray(policy, dtype=np.int8), relative_p=np.float64(relative_p),
+                   revenue=np.float64(revenue))
+
+    # ---------------- 任意策略的精确收益 ----------------
+
+    def _revenue_path(self, config, policy):
+        policy_digest = hashlib.sha1(np.asarray(policy, dtype=np.int8).tobytes()).hexdigest()[:16]
+        return self._path(config_digest(config), f'rev.{policy_digest}')
+
+    def load_revenue(self, config, policy):
+        entry = self._load(self._revenue_path(config, policy))
+        if entry is None:
+            return None
+        return float(entry['revenue'])
+
+    def save_revenue(self, config, policy, revenue):
+        self._save(self._revenue_path(config, policy), revenue=np.float64(revenue))
+
+
+_default_cache = None
+
+
+def get_default_cache():
+    """
+    项目默认缓存，环境变量 BLOCKRL_MDP_CACHE=off 时返回 None
+    """
+    global _default_cache
+    root = os.environ.get('BLOCKRL_MDP_CACHE', DEFAULT_CACHE_DIR)
+    if root.lower() in ('off', '0', 'false', 'none', ''):
+        return None
+    if _default_cache is None or _default_cache.root != root:
+        _default_cache = MDPCache(root)
+    return _default_cache
+
+
+def load_or_build(env, alpha, states=None, start=None, cache=None):
+    """
+    从缓存加载环境的稀疏 MDP，未命中时构建并写入缓存
+
+    参数与 mdp_util.build_sparse_mdp 相同；cache 为 None 时使用默认缓存。
+    返回的 mdp 带有 config 属性，供 optimal_policy / attacker_revenue 使用。
+    """
+    if cache is None:
+        cache = get_default_cache()
+    config = env_config(env, alpha)
+
+    mdp = cache.load_mdp(config) if cache is not None else None
+    if mdp is None:
+        mdp = mdp_util.build_sparse_mdp(env, alpha=alpha, states=states, start=start)
+        if cache is not None:
+            cache.save_mdp(config, mdp)
+    mdp.config = config
+    return mdp
+
+
+def optimal_policy(mdp, low, cache=None):
+    """
+    带缓存的 OSM 求解
+
+    返回：
+        policy (ndarray): 最优策略
+        p (float): OSM 相对收益
+        revenue (float): 最优策略的精确收益占比
+    """
+    if cache is None:
+        cache = get_default_cache()
+    config = getattr(mdp, 'config', None)
+    if cache is not None and config is not None:
+        hit = cache.load_solution(config)
+        if hit is not None:
+            return hit
+
+    policy, p = mdp.optimal_policy(low)
+    revenue = mdp.revenue(policy)
+    if cache is not None and config is not None:
+        cache.save_solution(config, policy, p, revenue)
+    return policy, p, revenue
+
+
+def attacker_revenue(mdp, policy, cache=None):
+    """带缓存的策略精确收益占比"""
+    if cache is None:
+        cache = get_default_cache()
+    config = getattr(mdp, 'config', None)
+    if cache is not None and config is not None:
+        hit = cache.load_revenue(config, policy)
+        if hit is not None:
+            return hit
+
+    revenue = mdp.revenue(policy)
+    if cache is not None and config is not None:
+        cache.save_revenue(config, policy, revenue)
+    return revenue
+
+
+PROTOCOLS = ('bitcoin', 'ghost', 'ethereum')
+
+
+def protocol_config(protocol, max_hidden_block, alpha, gamma, stale_rate=0.0, stale_states=False):
+    """
+    协议名对应的缓存配置，与 make_protocol_env 构造的环境一致，但不需要构造环境
+    """
+    if protocol == 'bitcoin' and stale_rate == 0 and not stale_states:
+        return make_config('SM_env', max_hidden_block, alpha, gamma)
+    if protocol in ('bitcoin', 'ghost'):
+        rule = 'GHOST' if protocol == 'ghost' else 'longest'
+        return make_config('SM_env_with_stale', max_hidden_block, alpha, gamma, stale_rate, rule)
+    if protocol == 'ethereum':
+        if stale_rate != 0:
+            raise ValueError("ethereum 环境不支持陈旧区块率")
+        return make_config('eth_env', max_hidden_block, alpha, gamma)
+    raise ValueError(f"未知协议: {protocol}")
+
+
+def make_protocol_env(protocol, max_hidden_block, alpha, gamma, stale_rate=0.0, stale_states=False):
+    """
+    按协议名构造用于 MDP 求解的底层环境
+
+    bitcoin 无陈旧区块时使用 SM_env，有陈旧区块时使用最长链规则的 SM_env_with_stale；
+    ghost 使用 GHOST 规则的 SM_env_with_stale；ethereum 使用 eth_env。
+    stale_states=True 时 bitcoin 即使无陈旧区块也使用 SM_env_with_stale，
+    使其状态与有陈旧区块的环境一致（元组状态，而不是 SM_env 的状态索引）。
+    """
+    from .base_env import SM_env, SM_env_with_stale, eth_env
+
+    protocol_config(protocol, max_hidden_block, alpha, gamma, stale_rate, stale_states)  # 校验参数
+    if protocol == 'bitcoin' and stale_rate == 0 and not stale_states:
+        return SM_env(max_hidden_block, alpha, gamma)
+    if protocol in ('bitcoin', 'ghost'):
+        rule = 'GHOST' if protocol == 'ghost' else 'longest'
+        return SM_env_with_stale(max_hidden_block, alpha, gamma, stale_rate=stale_rate, rule=rule)
+    return eth_env(max_hidden_block, alpha, gamma)
+
+
+def exact_osm_curve(alphas, gamma=0.5, protocol='bitcoin', max_hidden_block=20, stale_rate=0.0, cache=None):
+    """
+    精确的最优自私挖矿收益曲线
+
+    命中缓存时直接读取结果，不需要构造环境；只有未命中的点才会构建 MDP 并求解。
+
+    参数：
+        alphas (list): 攻击者算力列表
+        gamma (float): 跟随者比例
+        protocol (str): 'bitcoin' / 'ghost' / 'ethereum'
+        max_hidden_block (int): 最大隐藏区块数（ethereum 状态空间很大，建议不超过 4）
+        stale_rate (float): 陈旧区块率
+
+    返回：
+        revenues (ndarray): 每个 alpha 的最优收益占比
+    """
+    if cache is None:
+        cache = get_default_cache()
+
+    revenues = []
+    for alpha in alphas:
+        config = protocol_config(protocol, max_hidden_block, alpha, gamma, stale_rate)
+        hit = cache.load_solution(config) if cache is not None else None
+        if hit is not None:
+            revenues.append(hit[2])
+            continue
+
+        env = make_protocol_env(protocol, max_hidden_block, alpha, gamma, stale_rate)
+        revenues.append(optimal_policy(env.get_sparse_MDP(), alpha, cache)[2])
+
+    return np.array(revenues)
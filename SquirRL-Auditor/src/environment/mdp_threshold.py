@@ -0,0 +1,164 @@
+"""
+盈利阈值求解
+
+对给定的协议、跟随者比例 gamma 和陈旧区块率，求使任何偏离策略都优于诚实挖矿的最小攻击者算力 alpha。
+判定某个 alpha 是否盈利只需要在 p = alpha 处做一次策略迭代，再用精确的平稳分布计算该策略的收益：
+收益超过 alpha 即说明存在盈利的偏离。在这个判定上对 alpha 二分即可得到阈值。
+
+相邻求解之间尽量复用：
+    - 同一 (gamma, stale_rate) 上的所有二分探测共用一份状态列表，只重建转移概率；
+    - 每次策略迭代都从最近一次探测得到的策略热启动；
+    - gamma 按递增顺序分段交给工作进程，阈值随 gamma 单调不增，
+      上一个 gamma 的阈值直接作为下一个 gamma 的二分上界。
+"""
+
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+from . import mdp_util
+from . import mdp_cache
+from .mdp_atlas import DEFAULT_MAX_HIDDEN_BLOCK
+
+# 二分搜索的 alpha 区间：alpha >= 0.5 时攻击者总能盈利
+ALPHA_MIN = 0.01
+ALPHA_MAX = 0.5
+
+# 阈值附近的超额收益非常小，OSM 默认的折扣因子 0.99 会系统性地高估阈值
+# （bitcoin gamma = 0 时得到 0.340，而非 0.3295），这里使用更接近 1 的折扣因子
+DISCOUNT = 0.9999
+
+
+class _ThresholdProbe:
+    """
+    固定 (gamma, stale_rate) 的盈利判定器，在多次探测之间复用状态列表和热启动策略
+    """
+
+    def __init__(self, protocol, max_hidden_block, gamma, stale_rate, tol, discount=DISCOUNT):
+        # 与图谱一致，状态列表取自内部参数点 (alpha = 0.3, gamma = 0.5)，
+        # 它包含 gamma = 0 / 1 等边界点上的全部可达状态
+        self.env = mdp_cache.make_protocol_env(protocol, max_hidden_block, 0.3, 0.5, stale_rate)
+        mdp = self.env.get_sparse_MDP()
+        self.states, self.start = mdp.states, mdp.states[mdp.start]
+        self.tol = tol
+        self.discount = discount
+        self.policy = None
+        self.set_gamma(gamma)
+
+    def set_gamma(self, gamma):
+        # 构造环境的代价较高（SM_env_with_stale 要采样期望算力），换 gamma 时只修改环境参数，
+        # 状态列表和热启动策略保持不变
+        self.env._gamma = gamma
+
+    def excess(self, alpha):
+        """最优偏离策略相对诚实挖矿的超额收益 revenue - alpha"""
+        mdp = mdp_util.build_sparse_mdp(self.env, alpha=alpha, states=self.states, start=self.start)
+        self.policy = mdp.policy_iteration(alpha, self.discount, self.policy)[0]
+        return mdp.revenue(self.policy) - alpha
+
+    def profitable(self, alpha):
+        return self.excess(alpha) > self.tol
+
+
+def find_threshold(probe, low=ALPHA_MIN, high=ALPHA_MAX, alpha_tol=1e-3):
+    """
+    在 [low, high] 上二分求最小的盈利 alpha
+
+    参数：
+        probe (_ThresholdProbe): 盈利判定器
+        low, high (float): 搜索区间，high 处不盈利时返回 nan
+        alpha_tol (float): 阈值精度
+
+    返回：
+        threshold (float): 最小盈利 alpha；low 处已盈利时返回 low
+    """
+    if not probe.profitable(high):
+        if high >= ALPHA_MAX:
+            return np.nan
+        # 单调性被数值误差打破时退回完整区间
+        high = ALPHA_MAX
+        if not probe.profitable(high):
+            return np.nan
+    if probe.profitable(low):
+        return low
+    while high - low > alpha_tol:
+        mid = (low + high) / 2
+        if probe.profitable(mid):
+            high = mid
+        else:
+            low = mid
+    return high
+
+
+def _solve_chunk(task):
+    """
+    工作进程：按 gamma 递增顺序求一段 gamma 上的阈值
+    """
+    protocol, max_hidden_block, stale_rate, gammas, alpha_tol, tol, discount = task
+    probe = _ThresholdProbe(protocol, max_hidden_block, gammas[0], stale_rate, tol, discount)
+
+    thresholds = []
+    high = ALPHA_MAX
+    for gamma in gammas:
+        probe.set_gamma(gamma)
+        threshold = find_threshold(probe, high=high, alpha_tol=alpha_tol)
+        thresholds.append(threshold)
+        if not np.isnan(threshold):
+            high = min(ALPHA_MAX, threshold + alpha_tol)
+    return thresholds
+
+
+def threshold_curve(protocol, gammas, stale_rate=0.0, max_hidden_block=None, alpha_tol=1e-3, tol=1e-5,
+                    discount=DISCOUNT, n_workers=None, verbose=1):
+    """
+    并行求盈利阈值随 gamma 变化的整条曲线
+
+    参数：
+        protocol (str): 'bitcoin' / 'ghost' / 'ethereum'
+        gammas (list): 跟随者比例列表
+        stale_rate (float): 陈旧区块率
+        max_hidden_block (int): 最大隐藏区块数，None 时使用协议默认值
+        alpha_tol (float): 阈值精度
+        tol (float): 判定盈利所需的最小超额收益
+        discount (float): 策略迭代的折扣因子
+        n_workers (int): 进程数，None 时使用全部 CPU，1 表示在当前进程内求解
+        verbose (int): 详细程度
+
+    返回：
+        gammas (ndarray): 排序后的 gamma
+        thresholds (ndarray): 每个 gamma 的最小盈利 alpha，ALPHA_MAX 内不盈利时为 nan
+    """
+    if max_hidden_block is None:
+        max_hidden_block = DEFAULT_MAX_HIDDEN_BLOCK[protocol]
+    gammas = np.sort(np.asarray(gammas, dtype=np.float64))
+
+    n_chunks = min(len(gammas), n_workers or os.cpu_count() or 1)
+    chunks = [c for c in np.array_split(gammas, n_chunks) if len(c) > 0]
+    tasks = [(protocol, max_hidden_block, stale_rate, c, alpha_tol, tol, discount) for c in chunks]
+
+    if verbose:
+        print(f"求解 {protocol} 盈利阈值: {len(gammas)} 个 gamma, 陈旧区块率 {stale_rate}, "
+              f"{len(tasks)} 个工作进程")
+
+    if n_workers == 1:
+        results = [_solve_chunk(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=len(tasks)) as pool:
+            results = list(pool.map(_solve_chunk, tasks))
+
+    thresholds = np.array([t for chunk in results for t in chunk])
+    return gammas, thresholds
+
+
+def profitability_threshold(protocol, gamma, stale_rate=0.0, max_hidden_block=None, alpha_tol=1e-3, tol=1e-5,
+                            discount=DISCOUNT):
+    """
+    单个 gamma 的最小盈利 alpha
+
+    返回：
+        threshold (float): 最小盈利 alpha，ALPHA_MAX 内不盈利时为 nan
+    """
+    if max_hidden_block is None:
+        max_hidden_block = DEFAULT_MAX_HIDDEN_BLOCK[protocol]
+    probe = _ThresholdProbe(protocol, max_hidden_block, gamma, stale_rate, tol, discount)
+    return find_threshold(probe, alpha_tol=alpha_tol)
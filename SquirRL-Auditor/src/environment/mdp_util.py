@@ -0,0 +1,300 @@
+"""
+稀疏 MDP 构建工具
+
+所有底层环境都通过 transitions(state, action) 纯函数描述自己的转移规则：
+返回该状态下执行某个动作的全部结果 (概率, 下一状态, 攻击者收益, 诚实收益)。
+本模块从这份唯一的转移定义出发，为任意协议构建稀疏的 MDP 矩阵，
+供最优策略求解器和精确收益评估共用，不再为每个环境手写一份矩阵初始化代码。
+"""
+
+import numpy as np
+import scipy.sparse as sp
+import scipy.sparse.linalg as spla
+
+from . import markov_util
+
+# 非法动作在 MDP 中表示为原地自环，并给予极大的惩罚
+ILLEGAL_REWARD = -1000000
+
+
+class SparseMDP:
+    """
+    稀疏表示的选择性挖矿 MDP
+
+    属性：
+        states (list): 环境原生状态列表，第 i 行对应 states[i]
+        index (dict): 原生状态 -> 行号
+        P (list): 每个动作一个 (S, S) 的 csr 转移矩阵
+        PA, PH (list): 每个动作一个 (S, S) 的 csr 矩阵，元素为 概率 x 攻击者/诚实收益
+        attacker (ndarray): (S, A) 单步期望攻击者收益
+        honest (ndarray): (S, A) 单步期望诚实矿工收益
+        legal (ndarray): (S, A) 动作是否合法
+        start (int): 初始状态 (0, 0, normal) 的行号
+    """
+
+    def __init__(self, states, index, P, PA, PH, legal, start=0):
+        self.states = states
+        self.index = index
+        self.P = P
+        self.PA = PA
+        self.PH = PH
+        self.attacker = np.column_stack([np.asarray(M.sum(axis=1)).ravel() for M in PA])
+        self.honest = np.column_stack([np.asarray(M.sum(axis=1)).ravel() for M in PH])
+        self.legal = legal
+        self.start = start
+
+    @property
+    def S(self):
+        return len(self.states)
+
+    @property
+    def A(self):
+        return len(self.P)
+
+    def reward(self, relative_p):
+        """
+        按论文中的线性技巧计算 (S, A) 期望奖励矩阵
+
+        每个攻击者区块奖励 1 - p，每个诚实区块奖励 -p；非法动作给予 ILLEGAL_REWARD。
+        """
+        R = self.attacker * (1 - relative_p) - self.honest * relative_p
+        R[~self.legal] = ILLEGAL_REWARD
+        return R
+
+    def policy_chain(self, policy):
+        """
+        固定策略后得到的马尔可夫链
+
+        返回：
+            P_pi (csr_matrix): (S, S) 转移矩阵
+            attacker (ndarray): 每个状态的单步期望攻击者收益
+            honest (ndarray): 每个状态的单步期望诚实收益
+        """
+        policy = np.asarray(policy, dtype=np.int64).reshape(self.S)
+        rows, cols, probs = [], [], []
+        for a in range(self.A):
+            ind = np.flatnonzero(policy == a)
+            if ind.size == 0:
+                continue
+            sub = self.P[a][ind].tocoo()
+            rows.append(ind[sub.row])
+            cols.append(sub.col)
+            probs.append(sub.data)
+        P_pi = sp.coo_matrix((np.concatenate(probs), (np.concatenate(rows), np.concatenate(cols))),
+                             shape=(self.S, self.S)).tocsr()
+        states = np.arange(self.S)
+        return P_pi, self.attacker[states, policy], self.honest[states, policy]
+
+    def dense_matrices(self, relative_p):
+        """
+        转换为 mdptoolbox 传统的稠密 (A, S, S) 转移矩阵和逐转移奖励矩阵
+        """
+        T = np.array([P.toarray() for P in self.P])
+        flow = np.array([(PA * (1 - relative_p) - PH * relative_p).toarray()
+                         for PA, PH in zip(self.PA, self.PH)])
+        R = np.divide(flow, T, out=np.zeros_like(T), where=T > 0)
+        for a in range(self.A):
+            illegal = np.flatnonzero(~self.legal[:, a])
+            R[a, illegal, illegal] = ILLEGAL_REWARD
+        return T, R
+
+    def policy_iteration(self, relative_p, discount=0.99, policy0=None, max_iter=1000):
+        """
+        稀疏版本的策略迭代，语义与 mdptoolbox.mdp.PolicyIteration 一致
+
+        mdptoolbox 在策略评估时会把转移矩阵转成稠密矩阵求解，
+        状态数上千（如 eth_env）时非常慢；这里全程使用稀疏线性方程组。
+
+        参数：
+            relative_p (float): 线性技巧中的相对收益 p
+            discount (float): 折扣因子
+            policy0 (ndarray): 初始策略，None 时取 V = 0 下的贪心策略
+
+        返回：
+            policy (ndarray): 最优策略
+            V (ndarray): 该策略的价值函数
+        """
+        R = self.reward(relative_p)
+        states = np.arange(self.S)
+        identity = sp.identity(self.S, format='csr')
+
+        def greedy(V):
+            Q = R + discount * np.column_stack([P @ V for P in self.P])
+            return Q.argmax(axis=1)
+
+        if policy0 is None:
+            policy = greedy(np.zeros(self.S))
+        else:
+            policy = np.asarray(policy0, dtype=np.int64).reshape(self.S)
+
+        for _ in range(max_iter):
+            P_pi = self.policy_chain(policy)[0]
+            V = spla.spsolve((identity - discount * P_pi).tocsc(), R[states, policy])
+            policy_next = greedy(V)
+            if np.array_equal(policy_next, policy):
+                break
+            policy = policy_next
+
+        return policy, V
+
+    def optimal_policy(self, low, eps=1e-4, discount=0.99, policy0=None):
+        """
+        按论文中的二分搜索求最优选择性挖矿策略 (OSM)
+
+        每一步的策略迭代都从当前最好的策略热启动，通常一两次迭代即可收敛。
+
+        参数：
+            low (float): 搜索下界，必须是可行的 p（通常为攻击者算力 alpha）
+            eps (float): 搜索精度
+            policy0 (ndarray): 热启动策略，例如相邻参数的最优策略
+
+        返回：
+            policy (ndarray): 最优策略；没有比 low 更好的 p 时为 p = low 下的最优策略
+            p (float): 最优相对收益的下界
+        """
+        high = 1
+        ret = self.policy_iteration(low, discount, policy0)[0]
+        while high - low > eps:
+            mid = (low + high) / 2
+            policy, V = self.policy_iteration(mid, discount, ret)
+            if V[self.start] > -eps:
+                low = mid
+                ret = policy
+            else:
+                high = mid
+        return ret, low
+
+    def revenue(self, policy):
+        """
+        策略的精确长期收益占比 r_attacker / (r_attacker + r_honest)
+        """
+        P_pi, att, hon = self.policy_chain(policy)
+        p = markov_util.MP_sparse_stationary_distribution(P_pi, self.start)
+        r_attacker = p @ att
+        r_honest = p @ hon
+        return r_attacker / (r_attacker + r_honest)
+
+
+def build_sparse_mdp(env, alpha=None, states=None, start=None):
+    """
+    从环境的 transitions 纯函数构建稀疏 MDP
+
+    参数：
+        env: 实现了 transitions(state, action, alpha) 的底层环境
+        alpha (float): 构建矩阵时使用的攻击者算力，None 表示环境当前值
+        states (list): 枚举好的原生状态列表；None 时从 start 出发做可达性搜索
+        start: 初始原生状态
+
+    返回：
+        mdp (SparseMDP)
+    """
+    n_actions = env.action_space_n
+
+    if states is None:
+        # 没有显式状态空间的环境（eth_env 等）：从初始状态做广度优先搜索
+        states = [start]
+        index = {start: 0}
+        head = 0
+        while head < len(states):
+            s = states[head]
+            head += 1
+            for action in range(n_actions):
+                for p, s2, _, _ in env.transitions(s, action, alpha):
+                    if p > 0 and s2 not in index:
+                        index[s2] = len(states)
+                        states.append(s2)
+    else:
+        states = list(states)
+        index = dict(zip(states, range(len(states))))
+
+    n = len(states)
+    legal = np.zeros((n, n_actions), dtype=bool)
+    P, PA, PH = [], [], []
+
+    for action in range(n_actions):
+        rows, cols, probs, att, hon = [], [], [], [], []
+        for i, s in enumerate(states):
+            outcomes = env.transitions(s, action, alpha)
+            if len(outcomes) == 0:
+                # 非法动作：原地自环
+                rows.append(i)
+                cols.append(i)
+                probs.append(1.0)
+                att.append(0.0)
+                hon.append(0.0)
+                continue
+            legal[i, action] = True
+            for p, s2, attacker_get, honest_get in outcomes:
+                if p <= 0:
+                    continue
+                rows.append(i)
+                cols.append(index[s2])
+                probs.append(p)
+                att.append(p * attacker_get)
+                hon.append(p * honest_get)
+        # coo -> csr 会合并落在同一下一状态上的多个结果
+        P.append(sp.coo_matrix((probs, (rows, cols)), shape=(n, n)).tocsr())
+        PA.append(sp.coo_matrix((att, (rows, cols)), shape=(n, n)).tocsr())
+        PH.append(sp.coo_matrix((hon, (rows, cols)), shape=(n, n)).tocsr())
+
+    start_idx = 0 if start is None else index[start]
+    return SparseMDP(states, index, P, PA, PH, legal, start_idx)
+
+
+def _perturbed_chain(env, mdp, policy, alpha, gamma):
+    """在 (alpha, gamma) 处按 mdp 的状态顺序重建矩阵，返回固定策略下的马尔可夫链"""
+    saved = env._gamma
+    env._gamma = gamma
+    try:
+        perturbed = build_sparse_mdp(env, alpha=alpha, states=mdp.states, start=mdp.states[mdp.start])
+    finally:
+        env._gamma = saved
+    return perturbed.policy_chain(policy)
+
+
+def revenue_sensitivity(env, mdp, policy, alpha, h=1e-5):
+    """
+    固定策略的精确收益及其对 alpha、gamma 的偏导数
+
+    收益 r = pi·a / (pi·a + pi·h) 中的平稳分布 pi 对参数的导数满足
+    d(pi) (P - I) = -pi dP，与求 pi 的方程组系数矩阵相同，一次分解即可同时得到 pi 和两个导数，
+    不需要在相邻参数点上重新求解。转移概率是参数的低次多项式，
+    dP 以及单步收益的导数由 transitions 在 theta ± h 处的中心差分得到（只重建矩阵，不求解）。
+
+    参数：
+        env: 构建 mdp 的底层环境
+        mdp (SparseMDP): 环境在当前参数下的稀疏 MDP
+        policy (ndarray): 固定策略
+        alpha (float): 构建 mdp 时使用的攻击者算力
+        h (float): 差分步长；参数位于 [0, 1] 边界时自动改用单侧差分
+
+    返回：
+        revenue (float): 收益占比
+        d_alpha (float): d(revenue) / d(alpha)
+        d_gamma (float): d(revenue) / d(gamma)
+    """
+    gamma = env._gamma
+    P_pi, att, hon = mdp.policy_chain(policy)
+
+    derivatives = []
+    for name, value in (('alpha', alpha), ('gamma', gamma)):
+        low, high = max(value - h, 0.0), min(value + h, 1.0)
+        point = {'alpha': alpha, 'gamma': gamma}
+        point[name] = high
+        P_high, att_high, hon_high = _perturbed_chain(env, mdp, policy, **point)
+        point[name] = low
+        P_low, att_low, hon_low = _perturbed_chain(env, mdp, policy, **point)
+        width = high - low
+        derivatives.append(((P_high - P_low) / width, (att_high - att_low) / width, (hon_high - hon_low) / width))
+
+    p, dps = markov_util.MP_sparse_stationary_derivative(P_pi, [d[0] for d in derivatives], mdp.start)
+
+    r_attacker, r_honest = p @ att, p @ hon
+    total = r_attacker + r_honest
+    grads = []
+    for dp, (_, d_att, d_hon) in zip(dps, derivatives):
+        d_attacker = dp @ att + p @ d_att
+        d_honest = dp @ hon + p @ d_hon
+        grads.append((d_attacker * r_honest - r_attacker * d_honest) / total ** 2)
+
+    return r_attacker / total, grads[0], grads[1]
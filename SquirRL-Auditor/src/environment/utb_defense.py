@@ -12,10 +12,13 @@ UTB防御是一种针对自私挖矿攻击的防御策略。
 - max_uncles: 每个区块最多可包含的叔块数量
 """
 
+from statistics import NormalDist
+
 import gymnasium as gym
 from gymnasium import spaces
 import numpy as np
-from .base_env import SM_env_with_stale
+from .base_env import SM_env, SM_env_with_stale, set_event_stream, settled_rewards
+from .gym_wrapper import check_info_level, check_obs_buffer
 
 
 class UTBDefenseEnv(gym.Env):
@@ -46,7 +49,9 @@ class UTBDefenseEnv(gym.Env):
         dev=0.0,
         random_interval=(0.0, 0.5),
         random_process="iid",
-        render_mode=None
+        render_mode=None,
+        info_level="full",
+        obs_buffer=None
     ):
         super().__init__()
         
@@ -80,6 +85,9 @@ class UTBDefenseEnv(gym.Env):
         )
         
         self.render_mode = render_mode
+        self.info_level = check_info_level(info_level)
+        # 观察缓冲区，None 时每步返回新数组
+        self.obs_buffer = check_obs_buffer(obs_buffer, self.observation_space)
         self.current_state = None
         self.steps = 0
         self.episode_reward = 0
@@ -109,13 +117,14 @@ class UTBDefenseEnv(gym.Env):
             'honest_uncles': 0
         }
         
-        obs = np.array(self.current_state, dtype=np.float32)
+        obs = self._observation(self.current_state)
         
         info = {
             'alpha': self.alpha,
             'gamma': self.gamma,
             'utb_ratio': self.utb_ratio,
-            'defense': 'utb'
+            'defense': 'utb',
+            'action_mask': self.action_masks()
         }
         
         return obs, info
@@ -137,18 +146,22 @@ class UTBDefenseEnv(gym.Env):
         self.steps += 1
         self.episode_reward += adjusted_reward
         
-        obs = np.array(next_state, dtype=np.float32)
+        obs = self._observation(next_state)
         
         terminated = done
         truncated = False
         
+        if self.info_level == 'none' or (self.info_level == 'terminal' and not terminated):
+            return obs, adjusted_reward, terminated, truncated, {}
+        
         info = {
             'steps': self.steps,
             'episode_reward': self.episode_reward,
             'base_reward': base_reward,
             'adjusted_reward': adjusted_reward,
             'utb_stats': self.utb_stats.copy(),
-            'defense': 'utb'
+            'defense': 'utb',
+            'action_mask': self.action_masks()
         }
         
         return obs, adjusted_reward, terminated, truncated, info
@@ -184,6 +197,46 @@ class UTBDefenseEnv(gym.Env):
         
         return adjusted_reward
     
+    def action_masks(self):
+        """
+        当前状态下的合法动作掩码，True 表示合法（非法动作在 step 中会被映射为合法动作）
+        
+        与 sb3_contrib 的 MaskablePPO 约定同名；掩码来自底层环境的缓存，只读
+        """
+        return self.env.legal_action_mask(self.current_state)
+    
+    def get_state(self, rng=True):
+        """
+        当前状态的快照（不可变），用于蒙特卡洛 rollout 或树搜索从同一状态多次分支
+
+        参数：
+            rng (bool): 是否同时保存全局 np.random 状态（恢复后随机事件序列也相同）
+
+        返回：
+            snapshot (tuple): 底层环境的 EnvSnapshot 和包装器的计数
+        """
+        return (self.env.get_state(rng), self.current_state, self.steps, self.episode_reward,
+                tuple(self.utb_stats.items()))
+    
+    def set_state(self, snapshot):
+        """
+        恢复 get_state 保存的快照
+
+        返回：
+            observation: 恢复后的观察
+        """
+        sim_state, self.current_state, self.steps, self.episode_reward, utb_stats = snapshot
+        self.env.set_state(sim_state)
+        self.utb_stats = dict(utb_stats)
+        return self._observation(self.current_state)
+    
+    def _observation(self, state):
+        """状态元组转换为 float32 观察；有缓冲区时原地写入，不分配新数组"""
+        if self.obs_buffer is None:
+            return np.array(state, dtype=np.float32)
+        self.obs_buffer[...] = state
+        return self.obs_buffer
+    
     def render(self):
         """渲染"""
         if self.render_mode == "human":
@@ -312,3 +365,181 @@ def simple_selfish_mining_policy(state):
     else:
         return 2  # wait
 
+
+
+class RolloutLookaheadPolicy:
+    """
+    蒙特卡洛前瞻攻击者（不需要训练的基线策略）
+
+    每次决策时从环境当前状态的快照出发，对每个合法动作做 n_rollouts 次 rollout
+    （第一步执行该动作，之后按 rollout_policy 行动），选择收益最高的动作。
+    rollout 至少 horizon 步，之后继续到分叉结束（a = h = 0）为止，最多 max_steps 步，
+    隐藏链上尚未结算的区块不会因为截断而被漏算。
+    适用于任何提供 get_state / set_state 的包装环境，Ethereum、GHOST 等没有精确 MDP 的协议也能使用。
+
+    目标是相对奖励 A / (A + H)，按 SM_env 的线性化处理：rollout 的得分为 ΔA - rho * (ΔA + ΔH)。
+    rho 等于 rollout 策略的长期相对奖励时，各 rollout 长度不同也可以直接比较（相对价值），
+    默认在第一次决策前从初始状态模拟 rho_steps 步 rollout 策略来估计。
+    状态（和当前 alpha）决定了后续的分布，每次访问同一状态时的 rollout 结果累积起来，
+    领先动作与其余每个动作的配对差都在 stop_confidence 水平上显著为正、或累计达到 max_rollouts 次后，
+    该状态的动作就此确定，之后的访问不再模拟。
+    同一次决策中各动作使用同一组预先抽取的事件随机数（公共随机数），动作之间的差异不被采样噪声淹没；
+    rollout 结束后环境恢复到决策前的状态，全局 np.random 状态也不受影响。
+
+    参数：
+        env: 包装环境（BitcoinSelfishMiningEnv / GHOSTSelfishMiningEnv / EthereumSelfishMiningEnv / UTBDefenseEnv）
+        n_rollouts (int): 每个动作的 rollout 次数
+        horizon (int): rollout 的最短长度（步）
+        max_steps (int): rollout 的最大长度（步）
+        rollout_policy (callable): 状态向量 -> 动作（须只依赖状态，结果按状态缓存），
+                                   None 时使用 simple_selfish_mining_policy
+        rho (float): 线性化系数，None 时按 rollout 策略的相对奖励估计
+        rho_steps (int): 估计 rho 的模拟步数
+        max_rollouts (int): 每个状态每个动作累计的 rollout 数上限，None 时每次决策都独立估计
+        stop_confidence (float): 提前确定动作的单侧置信水平，None 时总是累计到 max_rollouts
+        seed (int): 事件随机数的种子
+
+    吞吐量（alpha=0.4、默认参数、单进程，每 5000 次决策统计一次）：
+        GHOST     约 370 次/秒起步，约 1 万次决策后 800-2400 次/秒，约 250 个状态，其中一半确定了动作
+        Ethereum  约 170 次/秒起步，3 万次决策后 400-1000 次/秒；状态空间大，3 万次决策访问了约 3200 个状态，
+                  大多只访问过几次，表格在这个长度内远未预热完成，多数决策仍需模拟
+        每次需要模拟的决策约为 合法动作数 x n_rollouts 次 rollout（eth_env 每步约 25 微秒），
+        每秒数千次决策只在状态空间小、表格已预热的长时间评估中达到。
+
+    用法：
+        policy = RolloutLookaheadPolicy(env)
+        obs, info = env.reset()
+        action, _ = policy.predict(obs)
+    """
+
+    def __init__(self, env, n_rollouts=32, horizon=1, max_steps=100, rollout_policy=None, rho=None,
+                 rho_steps=20000, max_rollouts=1024, stop_confidence=0.999, seed=None):
+        self.env = env
+        self.n_rollouts = n_rollouts
+        # 单侧检验的 z 值，None 时不提前确定
+        self._z = None if stop_confidence is None else NormalDist().inv_cdf(stop_confidence)
+        self.horizon = horizon
+        self.max_steps = max(max_steps, horizon)
+        self.rollout_policy = rollout_policy or simple_selfish_mining_policy
+        self.rho = rho
+        self.rho_steps = rho_steps
+        self.max_rollouts = max_rollouts
+        # (状态, alpha) -> 累积的 rollout 估计，见 __call__
+        self._estimates = {}
+        self._rng = np.random.default_rng(seed)
+        # rollout 策略只依赖状态，按状态缓存 (动作, 分叉是否已结束)；SM_env 的状态是索引，策略需要 (a, h, status) 向量
+        self._to_vector = env.env._index_to_vector if isinstance(env.env, SM_env) else None
+        self._rollout_actions = {}
+
+    def _rollout_action(self, state):
+        entry = self._rollout_actions.get(state)
+        if entry is None:
+            vector = self._to_vector(state) if self._to_vector else state
+            entry = (self.rollout_policy(vector), vector[0] == 0 and vector[1] == 0)
+            self._rollout_actions[state] = entry
+        return entry
+
+    def _estimate_rho(self, snapshot):
+        # rollout 策略从初始状态运行 rho_steps 步的相对奖励
+        sim = self.env.env
+        cached = self._rollout_actions.get
+        state = sim.reset()
+        set_event_stream(sim, self._rng.random(self.rho_steps))
+        for _ in range(self.rho_steps):
+            entry = cached(state)
+            if entry is None:
+                entry = self._rollout_action(state)
+            state = sim.step(state, entry[0])[0]
+        attacker, honest = settled_rewards(sim)
+        sim.set_state(snapshot)
+        return attacker / (attacker + honest) if attacker + honest > 0 else self.env.alpha
+
+    def _rollouts(self):
+        # 各合法动作每次 rollout 的 (ΔA, ΔH)：deltas[i, k] 对应 legal[i] 的第 k 次 rollout
+        sim = self.env.env
+        cached = self._rollout_actions.get
+        legal = np.flatnonzero(self.env.action_masks())
+        start = self.env.current_state
+        # rollout 之间只恢复环境本身，全局 np.random 状态在全部 rollout 结束后恢复一次
+        snapshot = sim.get_state()
+        if self.rho is None:
+            self.rho = self._estimate_rho(snapshot)
+        branch = snapshot._replace(rng=None)
+        base_attacker, base_honest = settled_rewards(sim)
+        events = self._rng.random((self.n_rollouts, self.max_steps))
+
+        deltas = np.zeros((len(legal), self.n_rollouts, 2))
+        for i, action in enumerate(legal):
+            for k, uniforms in enumerate(events):
+                sim.set_state(branch)
+                set_event_stream(sim, uniforms)
+                state = sim.step(start, action)[0]
+                for t in range(1, self.max_steps):
+                    entry = cached(state)
+                    if entry is None:
+                        entry = self._rollout_action(state)
+                    if entry[1] and t >= self.horizon:
+                        break
+                    state = sim.step(state, entry[0])[0]
+                a, h = settled_rewards(sim)
+                deltas[i, k] = a - base_attacker, h - base_honest
+        sim.set_state(snapshot)
+        return legal, deltas
+
+    def action_values(self):
+        """
+        当前状态下各动作的 rollout 估计
+
+        返回：
+            values (ndarray): 每个动作的平均得分 ΔA - rho * (ΔA + ΔH)，非法动作为 -inf
+            fractions (ndarray): 每个动作 rollout 的相对奖励 ΣΔA / Σ(ΔA + ΔH)，没有结算区块时为 nan
+        """
+        legal, deltas = self._rollouts()
+        n_actions = self.env.action_space.n
+        values = np.full(n_actions, -np.inf)
+        fractions = np.full(n_actions, np.nan)
+        values[legal] = (deltas[..., 0] - self.rho * deltas.sum(axis=2)).mean(axis=1)
+        totals = deltas.sum(axis=1)
+        settled = totals.sum(axis=1) > 0
+        fractions[legal[settled]] = totals[settled, 0] / totals[settled].sum(axis=1)
+        return values, fractions
+
+    def _separated(self, estimate):
+        # 领先动作与其余每个合法动作的配对差是否都超过 z 倍标准误（同一批 rollout 使用公共随机数）
+        sums, pair_squares, n = estimate[0], estimate[1], estimate[2]
+        leader = estimate[3]
+        for other in range(len(sums)):
+            if other == leader:
+                continue
+            mean = (sums[leader] - sums[other]) / n
+            variance = max(pair_squares[leader, other] / n - mean * mean, 0.0)
+            if mean <= 0 or mean < self._z * np.sqrt(variance / n):
+                return False
+        return True
+
+    def __call__(self, obs=None):
+        """当前状态下得分最高的动作（观察只用于接口兼容，状态取自环境本身）"""
+        if self.max_rollouts is None:
+            return int(np.argmax(self.action_values()[0]))
+        key = (self.env.current_state, self.env.env._current_alpha)
+        estimate = self._estimates.get(key)
+        if estimate is not None and estimate[4]:
+            return estimate[5]
+        legal, deltas = self._rollouts()
+        scores = deltas[..., 0] - self.rho * deltas.sum(axis=2)
+        if estimate is None:
+            # [合法动作的得分之和, 两两配对差的平方和, rollout 次数, 领先者在 legal 中的位置, 是否已确定, 动作]
+            estimate = self._estimates[key] = [np.zeros(len(legal)), np.zeros((len(legal), len(legal))), 0,
+                                               0, False, None]
+        estimate[0] += scores.sum(axis=1)
+        differences = scores[:, None, :] - scores[None, :, :]
+        estimate[1] += (differences * differences).sum(axis=2)
+        estimate[2] += self.n_rollouts
+        estimate[3] = int(np.argmax(estimate[0]))
+        estimate[5] = int(legal[estimate[3]])
+        estimate[4] = estimate[2] >= self.max_rollouts or (self._z is not None and self._separated(estimate))
+        return estimate[5]
+
+    def predict(self, observation, state=None, episode_start=None, deterministic=True):
+        """与 SB3 模型的 predict 接口一致，可以直接替换模型参与评估"""
+        return self(observation), state
@@ -0,0 +1,107 @@
+"""
+批量自私挖矿环境
+
+SelfishMiningVectorEnv 把 num_envs 个同配置的包装环境放在一个 gymnasium VectorEnv 里：
+    - 各环境的观察直接写入同一个批量数组的各行（包装器的 obs_buffer），不需要每步拼接；
+    - 默认 info_level='none'，每步不构造、不合并 info 字典；
+    - 自动复位沿用 gymnasium 的默认约定（NEXT_STEP）：某个环境结束后的下一次 step 只复位它，
+      该环境这一步的奖励为 0。
+
+注册的环境 ID 以它作为 vector_entry_point，gymnasium.make_vec 默认就会使用它：
+    import src.environment.gym_wrapper  # 注册 BlockRL/*-v0
+    envs = gymnasium.make_vec("BlockRL/Ethereum-v0", num_envs=8, alpha=0.35)
+需要子进程并行时传 vectorization_mode="async"，使用 gymnasium 的 AsyncVectorEnv。
+"""
+
+import numpy as np
+import gymnasium as gym
+from gymnasium.vector import AutoresetMode
+from gymnasium.vector.utils import batch_space
+
+from .gym_wrapper import make_env
+
+
+class SelfishMiningVectorEnv(gym.vector.VectorEnv):
+    """
+    同配置包装环境的批量版本
+
+    参数：
+        protocol (str): 协议，与 make_env 相同
+        num_envs (int): 环境个数
+        max_episode_steps (int): 单个 episode 的步数上限，到达时 truncated 为 True；None 表示不截断
+        copy (bool): step / reset 是否返回观察的副本；False 时返回内部批量数组，下一次调用会被覆盖
+        info_level (str): 各环境的 info 详细程度，不为 'none' 时按 gymnasium 的约定合并为批量 info
+        **kwargs: 传给 make_env 的环境参数
+    """
+
+    metadata = {"autoreset_mode": AutoresetMode.NEXT_STEP}
+
+    def __init__(self, protocol="bitcoin", num_envs=1, max_episode_steps=None, copy=True, info_level="none",
+                 **kwargs):
+        kwargs.pop("obs_buffer", None)
+        self.protocol = protocol
+        self.num_envs = num_envs
+        self.max_episode_steps = max_episode_steps
+        self.copy = copy
+        self.info_level = info_level
+        self.envs = [make_env(protocol=protocol, info_level=info_level, **kwargs) for _ in range(num_envs)]
+
+        self.single_observation_space = self.envs[0].observation_space
+        self.single_action_space = self.envs[0].action_space
+        self.observation_space = batch_space(self.single_observation_space, num_envs)
+        self.action_space = batch_space(self.single_action_space, num_envs)
+
+        space = self.single_observation_space
+        self._observations = np.zeros((num_envs,) + space.shape, dtype=space.dtype)
+        for i, env in enumerate(self.envs):
+            env.obs_buffer = self._observations[i, ...]
+        self._rewards = np.zeros(num_envs, dtype=np.float64)
+        self._terminations = np.zeros(num_envs, dtype=bool)
+        self._truncations = np.zeros(num_envs, dtype=bool)
+        self._autoreset_envs = np.zeros(num_envs, dtype=bool)
+
+    def _output(self, infos):
+        observations = self._observations.copy() if self.copy else self._observations
+        return observations, infos
+
+    def reset(self, *, seed=None, options=None):
+        """
+        复位全部环境
+
+        包装器的 reset(seed) 设置的是全局 np.random 状态，所有环境共用，因此种子只交给第一个环境
+        """
+        infos = {}
+        for i, env in enumerate(self.envs):
+            _, info = env.reset(seed=seed if i == 0 else None, options=options)
+            if self.info_level != "none":
+                infos = self._add_info(infos, info, i)
+        self._autoreset_envs[:] = False
+        return self._output(infos)
+
+    def step(self, actions):
+        actions = np.asarray(actions).reshape(self.num_envs)
+        infos = {}
+        for i, env in enumerate(self.envs):
+            if self._autoreset_envs[i]:
+                _, info = env.reset()
+                self._rewards[i] = 0.0
+                self._terminations[i] = False
+                self._truncations[i] = False
+            else:
+                _, self._rewards[i], self._terminations[i], self._truncations[i], info = env.step(actions[i])
+                if self.max_episode_steps is not None and env.steps >= self.max_episode_steps:
+                    self._truncations[i] = True
+            if self.info_level != "none":
+                infos = self._add_info(infos, info, i)
+        np.logical_or(self._terminations, self._truncations, out=self._autoreset_envs)
+
+        observations, infos = self._output(infos)
+        return observations, self._rewards.copy(), self._terminations.copy(), self._truncations.copy(), infos
+
+    def action_masks(self):
+        """各环境当前的合法动作掩码，(num_envs, 动作数)"""
+        return np.stack([env.action_masks() for env in self.envs])
+
+    def close_extras(self, **kwargs):
+        for env in self.envs:
+            env.close()
@@ -0,0 +1,286 @@
+"""
+吞吐量基准测试
+
+tests/ 只检查正确性，本模块跟踪环境核心的速度，在性能退化进入参数扫描之前发现它：
+    - env_step.<协议>        包装环境每秒步数（与训练相同：info_level='none'、观察缓冲区，均匀随机动作）
+    - sim_step.<底层环境>    底层模拟器每秒步数（SM_env / eth_env / SM_env_with_stale）
+    - construct.<协议>       创建环境的耗时：cold 为进程内第一次（含 expected_alpha 的蒙特卡洛估计），warm 为重复创建
+    - solver.m<N>.<阶段>     max_hidden_block=N 时 SM_env 的稀疏 MDP 构建、MDP_matrix_init、
+                             optimal_mdp_solver、theoretical_attacker_fraction 的耗时（关闭 MDP 缓存）
+    - evaluate.bitcoin       evaluate_model 每秒 episode 数（关闭评估缓存，使用模型目录中的 Bitcoin 模型）
+
+结果写成 JSON（默认 results/benchmark.json），并与保存的基线（默认 results/benchmark_baseline.json）比较：
+吞吐量低于基线的 (1 - tolerance) 倍、耗时超过基线的 (1 + tolerance) 倍即视为退化。
+计时取 repeat 次中最好的一次，减少机器负载的干扰；基线与机器相关，换机器后用 --save-baseline 重新生成。
+
+    python -m src.cli benchmark --quick
+    python -m src.cli benchmark --save-baseline
+"""
+
+import os
+import io
+import json
+import time
+import platform
+import contextlib
+from datetime import datetime
+
+import numpy as np
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+DEFAULT_OUTPUT = os.path.join(PROJECT_ROOT, 'results', 'benchmark.json')
+DEFAULT_BASELINE = os.path.join(PROJECT_ROOT, 'results', 'benchmark_baseline.json')
+
+# 结果格式版本，指标定义变化时递增；版本不同的基线不参与比较
+BENCHMARK_VERSION = 1
+
+GROUPS = ('env', 'sim', 'construct', 'solver', 'evaluate')
+PROTOCOLS = ('bitcoin', 'ghost', 'ethereum', 'utb')
+
+# 耗时指标的绝对噪声下限（秒）：亚毫秒级的计时受调度影响很大，变化不超过这个量时不算退化
+TIME_NOISE_FLOOR = 1e-3
+
+# MDP_matrix_init 构建稠密矩阵，内存随状态数平方增长，只测到这个规模
+DENSE_MAX_HIDDEN_BLOCK = 20
+
+# 完整 / 快速两档的测量规模
+SIZES = {
+    'full': {'env_steps': 50000, 'sim_steps': 50000, 'max_hidden_blocks': (5, 10, 20, 30, 40),
+             'eval_episodes': 20, 'repeat': 3},
+    'quick': {'env_steps': 5000, 'sim_steps': 5000, 'max_hidden_blocks': (5, 10, 20),
+              'eval_episodes': 5, 'repeat': 2},
+}
+
+
+def _best_time(fn, repeat):
+    # repeat 次中最短的耗时（秒）
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _metric(value, unit, higher_is_better):
+    return {'value': float(value), 'unit': unit, 'higher_is_better': higher_is_better}
+
+
+def bench_env_steps(n_steps, repeat, protocols=PROTOCOLS):
+    """包装环境的每秒步数"""
+    from src.environment.gym_wrapper import make_env, attach_obs_buffer
+
+    metrics = {}
+    for protocol in protocols:
+        with contextlib.redirect_stdout(io.StringIO()):
+            env = attach_obs_buffer(make_env(protocol=protocol, alpha=0.35, info_level='none'))
+        env.reset(seed=0)
+        actions = np.random.default_rng(0).integers(env.action_space.n, size=n_steps)
+
+        def run():
+            for action in actions:
+                _, _, terminated, truncated, _ = env.step(action)
+                if terminated or truncated:
+                    env.reset()
+
+        metrics[f'env_step.{protocol}'] = _metric(n_steps / _best_time(run, repeat), 'steps/s', True)
+        env.close()
+    return metrics
+
+
+def bench_sim_steps(n_steps, repeat):
+    """底层模拟器的每秒步数（不经过包装器）"""
+    from src.environment.base_env import SM_env, SM_env_with_stale, eth_env
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        sims = {
+            'SM_env': SM_env(20, 0.35, 0.5),
+            'eth_env': eth_env(20, 0.35, 0.5),
+            'SM_env_with_stale': SM_env_with_stale(20, 0.35, 0.5, stale_rate=0.06, know_alpha=True),
+        }
+    metrics = {}
+    for name, sim in sims.items():
+        actions = np.random.default_rng(0).integers(sim._action_space_n, size=n_steps).tolist()
+
+        def run():
+            state = sim.reset()
+            for action in actions:
+                state = sim.step(state, action)[0]
+
+        metrics[f'sim_step.{name}'] = _metric(n_steps / _best_time(run, repeat), 'steps/s', True)
+    return metrics
+
+
+def bench_construction(repeat, protocols=PROTOCOLS):
+    """创建环境的耗时：清空共享缓存后的第一次（cold）和重复创建（warm）"""
+    from src.environment import base_env
+    from src.environment.gym_wrapper import make_env
+
+    metrics = {}
+    for protocol in protocols:
+        with contextlib.redirect_stdout(io.StringIO()):
+            base_env._expected_alphas.clear()
+            start = time.perf_counter()
+            make_env(protocol=protocol, alpha=0.35)
+            metrics[f'construct.{protocol}.cold'] = _metric(time.perf_counter() - start, 's', False)
+            warm = _best_time(lambda: make_env(protocol=protocol, alpha=0.35), max(repeat, 5))
+        metrics[f'construct.{protocol}.warm'] = _metric(warm, 's', False)
+    return metrics
+
+
+def bench_solver(max_hidden_blocks, repeat):
+    """SM_env 的 MDP 构建与求解耗时随 max_hidden_block 的变化（关闭 MDP 缓存）"""
+    from src.environment.base_env import SM_env
+
+    previous = os.environ.get('BLOCKRL_MDP_CACHE')
+    os.environ['BLOCKRL_MDP_CACHE'] = 'off'
+    metrics = {}
+    try:
+        for m in max_hidden_blocks:
+            env = SM_env(m, 0.35, 0.5)
+            times = {'build': [], 'matrix_init': [], 'optimal_solver': [], 'attacker_fraction': []}
+            for _ in range(repeat):
+                env._sparse_mdp = None
+                env._matrix_init = False
+                with contextlib.redirect_stdout(io.StringIO()):
+                    start = time.perf_counter()
+                    env.get_sparse_MDP()
+                    times['build'].append(time.perf_counter() - start)
+                    if m <= DENSE_MAX_HIDDEN_BLOCK:
+                        start = time.perf_counter()
+                        env.MDP_matrix_init()
+                        times['matrix_init'].append(time.perf_counter() - start)
+                    start = time.perf_counter()
+                    policy = env.optimal_mdp_solver()
+                    times['optimal_solver'].append(time.perf_counter() - start)
+                    start = time.perf_counter()
+                    env.theoretical_attacker_fraction(policy)
+                    times['attacker_fraction'].append(time.perf_counter() - start)
+            for stage, values in times.items():
+                if values:
+                    metrics[f'solver.m{m}.{stage}'] = _metric(min(values), 's', False)
+    finally:
+        if previous is None:
+            os.environ.pop('BLOCKRL_MDP_CACHE')
+        else:
+            os.environ['BLOCKRL_MDP_CACHE'] = previous
+    return metrics
+
+
+def find_benchmark_model(models_dir=os.path.join(PROJECT_ROOT, 'models')):
+    """评估基准使用的模型：模型索引中 alpha=0.35 的最佳 Bitcoin 模型，没有时返回 None"""
+    from src.agents.model_registry import get_registry
+
+    if not os.path.isdir(models_dir):
+        return None
+    return get_registry(models_dir).best('bitcoin', 0.35)
+
+
+def bench_evaluate(n_episodes, repeat, model_path=None):
+    """evaluate_model 每秒 episode 数（每个 episode 1000 步，关闭评估缓存）"""
+    from src.agents.evaluate import evaluate_model
+
+    model_path = model_path or find_benchmark_model()
+    if model_path is None:
+        return {}
+
+    def run():
+        evaluate_model(model_path, protocol='bitcoin', alpha=0.35, n_episodes=n_episodes,
+                       max_steps_per_episode=1000, seed=0, use_cache=False, verbose=0)
+
+    run()  # 预热：加载模型并编译推理路径
+    return {'evaluate.bitcoin': _metric(n_episodes / _best_time(run, repeat), 'episodes/s', True)}
+
+
+def run_benchmarks(groups=GROUPS, quick=False, model_path=None, verbose=1):
+    """
+    运行基准测试
+
+    参数：
+        groups (tuple): 要运行的组（'env' / 'sim' / 'construct' / 'solver' / 'evaluate'）
+        quick (bool): 使用较小的测量规模
+        model_path (str): 评估基准使用的模型，None 时从模型索引中查找
+        verbose (int): 是否打印每组结果
+
+    返回：
+        results (dict): {'version', 'created_at', 'size', 'machine', 'metrics': {名称: {value, unit, higher_is_better}}}
+    """
+    unknown = set(groups) - set(GROUPS)
+    if unknown:
+        raise ValueError(f"Unknown benchmark groups: {sorted(unknown)}. Supported: {', '.join(GROUPS)}")
+    size = SIZES['quick' if quick else 'full']
+    repeat = size['repeat']
+    runners = {
+        'env': lambda: bench_env_steps(size['env_steps'], repeat),
+        'sim': lambda: bench_sim_steps(size['sim_steps'], repeat),
+        'construct': lambda: bench_construction(repeat),
+        'solver': lambda: bench_solver(size['max_hidden_blocks'], repeat),
+        'evaluate': lambda: bench_evaluate(size['eval_episodes'], repeat, model_path),
+    }
+
+    metrics = {}
+    for group in GROUPS:
+        if group not in groups:
+            continue
+        start = time.perf_counter()
+        group_metrics = runners[group]()
+        metrics.update(group_metrics)
+        if verbose:
+            print(f"[{group}] {time.perf_counter() - start:.1f}s")
+            for name, m in group_metrics.items():
+                print(f"  {name:<36}{m['value']:>14.6g} {m['unit']}")
+            if not group_metrics:
+                print("  （跳过：没有可用的模型）")
+
+    return {
+        'version': BENCHMARK_VERSION,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'size': 'quick' if quick else 'full',
+        'machine': {'python': platform.python_version(), 'platform': platform.platform(),
+                    'processor': platform.processor(), 'cpu_count': os.cpu_count(), 'numpy': np.__version__},
+        'metrics': metrics,
+    }
+
+
+def save_benchmark(results, path=DEFAULT_OUTPUT):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+
+def load_benchmark(path=DEFAULT_BASELINE):
+    """读取保存的结果，文件不存在时返回 None"""
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def compare_benchmarks(results, baseline, tolerance=0.3):
+    """
+    与基线比较，只比较两边都有的指标
+
+    参数：
+        results (dict): run_benchmarks 的结果
+        baseline (dict): 基线结果
+        tolerance (float): 允许的相对变化（耗时指标还需超过 TIME_NOISE_FLOOR 才算退化）
+
+    返回：
+        rows (list): 每个指标一行 {'name', 'baseline', 'current', 'ratio', 'regressed'}，
+                     ratio 为当前值 / 基线值；版本不同时返回空列表
+    """
+    if baseline is None or baseline.get('version') != results.get('version'):
+        return []
+    rows = []
+    for name, current in results['metrics'].items():
+        reference = baseline['metrics'].get(name)
+        if reference is None or reference['value'] <= 0:
+            continue
+        ratio = current['value'] / reference['value']
+        if current['higher_is_better']:
+            regressed = ratio < 1 - tolerance
+        else:
+            regressed = ratio > 1 + tolerance and current['value'] - reference['value'] > TIME_NOISE_FLOOR
+        rows.append({'name': name, 'baseline': reference['value'], 'current': current['value'],
+                     'ratio': ratio, 'regressed': regressed})
+    return rows
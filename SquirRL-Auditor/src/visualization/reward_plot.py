@@ -58,6 +58,7 @@ def plot_figure3(
     output_path="./results/figure3.png",
     show_theoretical=True,
     show_honest=True,
+    show_optimal=False,
     figsize=(10, 6)
 ):
     """
@@ -72,6 +73,7 @@ def plot_figure3(
         output_path (str): 输出路径
         show_theoretical (bool): 是否显示理论曲线
         show_honest (bool): 是否显示诚实挖矿曲线
+        show_optimal (bool): 是否显示 MDP 精确求解的最优自私挖矿 (OSM) 曲线
         figsize (tuple): 图大小
     """
     
@@ -98,14 +100,30 @@ def plot_figure3(
         ax.plot(x_range, theoretical_rewards, 'b-', 
                 label=f'Theoretical SM (γ={gamma})', linewidth=2)
     
+    # 2.1 绘制精确最优自私挖矿曲线（结果来自 MDP 磁盘缓存，首次运行需要求解）
+    if show_optimal:
+        from src.environment.mdp_cache import exact_osm_curve
+        osm_alphas = np.arange(0.05, 0.5, 0.05)
+        osm_rewards = exact_osm_curve(osm_alphas, gamma, protocol='bitcoin')
+        ax.plot(osm_alphas, osm_rewards, 'g-.', marker='^',
+                label=f'Optimal SM (γ={gamma})', linewidth=2)
+    
     # 3. 绘制 SquirRL 学习到的策略结果
     if alphas is not None and rewards is not None:
         ax.scatter(alphas, rewards, c='red', s=100, marker='o', 
                    label='SquirRL (DQN)', zorder=5)
-        # 添加误差线（如果有）
-        if results is not None and 'std_reward' in results[0]:
+        # 添加误差线（如果有）：优先使用评估时记录的相对奖励置信区间半宽，
+        # 其次用相对奖励的标准差估计标准误
+        stds = None
+        if results is not None and results[0].get('ci_halfwidth') not in (None, ''):
+            stds = [float(r['ci_halfwidth']) for r in results]
+        elif results is not None and 'std_reward_fraction' in results[0]:
+            stds = [float(r.get('std_reward_fraction') or 0) / np.sqrt(float(r.get('n_episodes') or 100))
+                    for r in results]
+        elif results is not None and 'std_reward' in results[0]:
             stds = [float(r.get('std_reward', 0)) / np.sqrt(float(r.get('n_episodes', 100))) 
                     for r in results]
+        if stds is not None:
             ax.errorbar(alphas, rewards, yerr=stds, fmt='none', 
                        color='red', capsize=3, alpha=0.7)
     
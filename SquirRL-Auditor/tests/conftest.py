@@ -0,0 +1,21 @@
+"""
+pytest 公共配置：测试期间 MDP 缓存写入临时目录，不读写项目的 cache/mdp
+"""
+
+import os
+
+import pytest
+
+
+@pytest.fixture(scope="session", autouse=True)
+def isolated_mdp_cache(tmp_path_factory):
+    """整个测试会话使用独立的 MDP 缓存目录，结束后恢复原来的 BLOCKRL_MDP_CACHE"""
+    previous = os.environ.get('BLOCKRL_MDP_CACHE')
+    os.environ['BLOCKRL_MDP_CACHE'] = str(tmp_path_factory.mktemp('mdp_cache'))
+    try:
+        yield os.environ['BLOCKRL_MDP_CACHE']
+    finally:
+        if previous is None:
+            os.environ.pop('BLOCKRL_MDP_CACHE')
+        else:
+            os.environ['BLOCKRL_MDP_CACHE'] = previous
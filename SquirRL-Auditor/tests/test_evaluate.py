@@ -81,7 +81,388 @@ def test_evaluate_import():
     print("="*60)
 
 
+def test_numpy_policy_matches_sb3():
+    """测试导出的 NumPy 策略与 SB3 模型的 Q 值和动作一致"""
+    print("\n" + "="*60)
+    print("测试 NumPy 推理")
+    print("="*60)
+    
+    import glob
+    import tempfile
+    import numpy as np
+    import torch
+    from stable_baselines3 import DQN
+    from src.agents.numpy_policy import export_model, NumpyQPolicy
+    
+    project_root = os.path.join(os.path.dirname(__file__), '..')
+    model_paths = [
+        glob.glob(os.path.join(project_root, 'models', 'best_bitcoin_alpha_*', 'best_model.zip'))[0],
+        glob.glob(os.path.join(project_root, 'models', 'best_ethereum_alpha_*', 'best_model.zip'))[0],
+    ]
+    
+    for model_path in model_paths:
+        npz_path = export_model(model_path, os.path.join(tempfile.mkdtemp(), 'model.npz'))
+        policy = NumpyQPolicy.load(npz_path)
+        model = DQN.load(model_path, device='cpu')
+        
+        space = model.observation_space
+        if hasattr(space, 'n'):
+            obs = np.arange(space.n)
+        else:
+            obs = np.random.RandomState(0).randn(256, *space.shape).astype(np.float32)
+        
+        with torch.no_grad():
+            q = model.q_net(model.q_net.obs_to_tensor(obs)[0]).numpy()
+        assert np.abs(policy.q_values(obs) - q).max() < 1e-4
+        assert (policy.predict(obs)[0] == model.predict(obs, deterministic=True)[0]).all()
+        assert policy.predict(obs[0])[0] == model.predict(obs[0], deterministic=True)[0]
+        print(f"[OK] {os.path.basename(os.path.dirname(model_path))}: {len(obs)} 个观察的动作一致")
+
+
+def test_policy_table():
+    """测试查找表策略与网络策略的动作一致，且 load_policy 优先使用查找表"""
+    print("\n" + "="*60)
+    print("测试策略查找表")
+    print("="*60)
+    
+    import glob
+    import shutil
+    import tempfile
+    import numpy as np
+    from src.agents.numpy_policy import export_models, load_policy, NumpyQPolicy, TablePolicy
+    
+    project_root = os.path.join(os.path.dirname(__file__), '..')
+    source = glob.glob(os.path.join(project_root, 'models', 'best_bitcoin_alpha_*', 'best_model.zip'))[0]
+    model_path = os.path.join(tempfile.mkdtemp(), 'best_model.zip')
+    shutil.copy(source, model_path)
+    
+    export_models([model_path], table=True, store_q=True, verbose=0)
+    table = load_policy(model_path)
+    network = NumpyQPolicy.load(model_path[:-4] + '.npz')
+    assert isinstance(table, TablePolicy)
+    
+    states = np.arange(network.obs_n)
+    assert (table.predict(states)[0] == network.predict(states)[0]).all()
+    assert np.allclose(table.q_values(states), network.q_values(states))
+    assert all(table.predict(s)[0] == network.predict(s)[0] for s in range(network.obs_n))
+    print(f"[OK] {network.obs_n} 个状态的查找表与网络动作一致")
+
+
+def test_model_cache():
+    """测试模型 LRU 缓存：重复加载命中缓存，文件更新后失效，超出上限时淘汰"""
+    print("\n" + "="*60)
+    print("测试模型缓存")
+    print("="*60)
+    
+    import glob
+    import time
+    import shutil
+    import tempfile
+    from src.agents.numpy_policy import export_model
+    from src.agents.model_cache import ModelCache, model_nbytes
+    
+    project_root = os.path.join(os.path.dirname(__file__), '..')
+    root = tempfile.mkdtemp()
+    paths = []
+    for i, source in enumerate(glob.glob(os.path.join(project_root, 'models', 'best_bitcoin_alpha_*', 'best_model.zip'))[:2]):
+        model_path = os.path.join(root, f'model_{i}.zip')
+        shutil.copy(source, model_path)
+        export_model(model_path)
+        paths.append(model_path)
+    
+    cache = ModelCache()
+    first = cache.load(paths[0])
+    assert cache.load(paths[0]) is first
+    assert cache.hits == 1 and cache.misses == 1
+    print(f"[OK] 重复加载命中缓存 ({model_nbytes(first) / 1024:.0f} KB)")
+    
+    # 重新导出后修改时间变化，缓存失效，旧版本被丢弃
+    export_model(paths[0])
+    later = time.time() + 10
+    os.utime(paths[0][:-4] + '.npz', (later, later))
+    assert cache.load(paths[0]) is not first
+    assert len(cache) == 1
+    print("[OK] 模型更新后缓存失效")
+    
+    # 上限只够放一个模型时，按 LRU 淘汰
+    cache = ModelCache(max_bytes=model_nbytes(first))
+    cache.load(paths[0])
+    cache.load(paths[1])
+    assert len(cache) == 1 and cache.nbytes <= cache.max_bytes
+    cache.load(paths[1])
+    assert cache.hits == 1
+    print("[OK] 超出内存上限时按 LRU 淘汰")
+    shutil.rmtree(root)
+
+
+def test_model_registry():
+    """测试模型索引：按命名规则补登记已有模型，按评估得分选出最好的模型"""
+    print("\n" + "="*60)
+    print("测试模型索引")
+    print("="*60)
+    
+    import glob
+    import shutil
+    import tempfile
+    from src.agents.model_registry import ModelRegistry
+    
+    project_root = os.path.join(os.path.dirname(__file__), '..')
+    source = glob.glob(os.path.join(project_root, 'models', 'best_bitcoin_alpha_*', 'best_model.zip'))[0]
+    root = tempfile.mkdtemp()
+    
+    # 训练脚本的命名：final 模型没有 .zip 后缀，best 模型在 best_ 目录中
+    shutil.copy(source, os.path.join(root, 'bitcoin_alpha_0.35_20250101_000000_final'))
+    os.makedirs(os.path.join(root, 'best_bitcoin_alpha_0.35_20250101_000000'))
+    shutil.copy(source, os.path.join(root, 'best_bitcoin_alpha_0.35_20250101_000000', 'best_model.zip'))
+    os.makedirs(os.path.join(root, 'best_utb_alpha_0.35_ratio_0.50_20250101_000000'))
+    shutil.copy(source, os.path.join(root, 'best_utb_alpha_0.35_ratio_0.50_20250101_000000', 'best_model.zip'))
+    
+    registry = ModelRegistry(root)
+    assert len(registry.query()) == 3
+    assert registry.query('utb')[0]['utb_ratio'] == 0.5
+    assert registry.query('bitcoin', kind='final')[0]['timesteps'] > 0
+    print(f"[OK] 补登记 {len(registry.query())} 个已有模型")
+    
+    # 补登记的模型没有评估得分：默认选 best 模型，prefer='final' 时选 final 模型
+    best_path = os.path.join(root, 'best_bitcoin_alpha_0.35_20250101_000000', 'best_model.zip')
+    final_path = os.path.join(root, 'bitcoin_alpha_0.35_20250101_000000_final')
+    assert registry.best('bitcoin', 0.35) == best_path
+    assert registry.best('bitcoin', 0.35, prefer='final') == final_path
+    assert registry.best_by_alpha('bitcoin', prefer='final') == [(0.35, final_path)]
+    print("[OK] 没有得分时按 prefer 选择模型类型")
+    
+    # 有评估得分的模型优先于没有得分的，得分高的优先
+    newer = os.path.join(root, 'bitcoin_alpha_0.35_20250102_000000_final.zip')
+    shutil.copy(source, newer)
+    registry.register(newer, 'bitcoin', 0.35, kind='final', eval_score=120.0)
+    assert registry.best('bitcoin', 0.35) == newer
+    registry.register(newer, 'bitcoin', 0.35, kind='final', eval_score=-5.0)
+    registry.register(best_path, 'bitcoin', 0.35, kind='best', eval_score=80.0)
+    assert registry.best('bitcoin', 0.35) == best_path
+    assert registry.best('bitcoin', 0.35, gamma=0.0) is None
+    assert registry.best_by_alpha('bitcoin') == [(0.35, best_path)]
+    print("[OK] 按评估得分选择最好的模型")
+    
+    # 文件被删除后重新扫描会移除记录
+    os.remove(newer)
+    registry.rescan()
+    assert len(registry.query('bitcoin')) == 2
+    print("[OK] 重新扫描移除已删除的模型")
+    
+    registry.close()
+    shutil.rmtree(root)
+
+
+
+def test_results_store():
+    """测试结果库：追加写入保留逐 episode 数据，按参数查询最新结果，导出 CSV 快照"""
+    print("\n" + "="*60)
+    print("测试评估结果库")
+    print("="*60)
+    
+    import glob
+    import shutil
+    import tempfile
+    import numpy as np
+    from src.agents.evaluate import evaluate_model
+    from src.agents.results_store import ResultsStore, load_experiment
+    
+    project_root = os.path.join(os.path.dirname(__file__), '..')
+    model_path = glob.glob(os.path.join(project_root, 'models', 'best_bitcoin_alpha_*', 'best_model.zip'))[0]
+    root = tempfile.mkdtemp()
+    db_path = os.path.join(root, 'results.sqlite')
+    store = ResultsStore(db_path)
+    
+    results = [evaluate_model(model_path, alpha=alpha, n_episodes=3, max_steps_per_episode=200, verbose=0)
+               for alpha in (0.30, 0.35)]
+    store.append(results, 'bitcoin_test')
+    rows = store.summaries('bitcoin_test')
+    assert [r['alpha'] for r in rows] == [0.30, 0.35]
+    assert rows[0]['model_path'] == model_path and rows[0]['deterministic'] is True
+    episodes = store.episodes(rows[1]['id'])
+    assert np.allclose(episodes['reward_fraction'], results[1]['episode_reward_fractions'])
+    assert np.allclose(episodes['length'], results[1]['episode_lengths'])
+    print(f"[OK] 追加 {len(rows)} 次评估，逐 episode 数据完整保留")
+    
+    # 同一组参数再次评估后，默认只返回最新一次，历史记录仍然保留
+    store.append(evaluate_model(model_path, alpha=0.35, n_episodes=2, max_steps_per_episode=200, verbose=0),
+                 'bitcoin_test')
+    assert store.summaries('bitcoin_test', alpha=0.35)[0]['n_episodes'] == 2
+    assert len(store.summaries('bitcoin_test', alpha=0.35, latest=False)) == 2
+    print("[OK] 按参数查询最新结果，历史记录保留")
+    
+    csv_path = os.path.join(root, 'bitcoin_test.csv')
+    assert store.export_csv(csv_path, 'bitcoin_test') == 2
+    assert [r['alpha'] for r in load_experiment(csv_path, db_path=db_path)] == [0.30, 0.35]
+    assert [r['alpha'] for r in load_experiment(csv_path, db_path=os.path.join(root, 'missing.sqlite'))] == [0.30, 0.35]
+    print("[OK] 导出 CSV 快照，结果库缺失时可退回读取 CSV")
+    
+    store.close()
+    shutil.rmtree(root)
+
+
+
+def test_eval_cache():
+    """测试评估结果缓存：参数和模型都没变时直接返回缓存，模型内容变化后重新评估"""
+    print("\n" + "="*60)
+    print("测试评估结果缓存")
+    print("="*60)
+    
+    import glob
+    import time
+    import shutil
+    import tempfile
+    from src.agents.evaluate import evaluate_model
+    from src.agents.eval_cache import get_default_eval_cache
+    
+    project_root = os.path.join(os.path.dirname(__file__), '..')
+    sources = sorted(glob.glob(os.path.join(project_root, 'models', 'best_bitcoin_alpha_*', 'best_model.zip')))[:2]
+    root = tempfile.mkdtemp()
+    model_path = os.path.join(root, 'model.zip')
+    shutil.copy(sources[0], model_path)
+    
+    previous = os.environ.get('BLOCKRL_EVAL_CACHE')
+    os.environ['BLOCKRL_EVAL_CACHE'] = os.path.join(root, 'cache')
+    try:
+        kwargs = dict(alpha=0.35, n_episodes=3, max_steps_per_episode=200, seed=7, verbose=0)
+        first = evaluate_model(model_path, **kwargs)
+        assert len(get_default_eval_cache()) == 1
+        
+        # 固定种子时重新评估与缓存结果一致
+        fresh = evaluate_model(model_path, use_cache=False, **kwargs)
+        assert fresh['episode_rewards'] == first['episode_rewards']
+        
+        start = time.time()
+        cached = evaluate_model(model_path, **kwargs)
+        elapsed = time.time() - start
+        assert cached['episode_reward_fractions'] == first['episode_reward_fractions']
+        assert cached['action_distribution'] == first['action_distribution']
+        assert len(get_default_eval_cache()) == 1
+        print(f"[OK] 命中缓存，耗时 {elapsed * 1000:.1f} ms")
+        
+        # 评估参数或模型内容变化时重新评估
+        evaluate_model(model_path, **dict(kwargs, seed=8))
+        assert len(get_default_eval_cache()) == 2
+        # 不设种子时每次重新采样，不读写缓存
+        evaluate_model(model_path, **dict(kwargs, seed=None))
+        assert len(get_default_eval_cache()) == 2
+        shutil.copy(sources[1], model_path)
+        evaluate_model(model_path, **kwargs)
+        assert len(get_default_eval_cache()) == 3
+        print("[OK] 参数或模型变化后重新评估")
+    finally:
+        if previous is None:
+            os.environ.pop('BLOCKRL_EVAL_CACHE')
+        else:
+            os.environ['BLOCKRL_EVAL_CACHE'] = previous
+        shutil.rmtree(root)
+
+
+
+def test_sequential_evaluation():
+    """测试序贯评估：置信区间足够窄时提前停止，达不到目标精度时用满 episode 上限"""
+    print("\n" + "="*60)
+    print("测试序贯评估")
+    print("="*60)
+    
+    import glob
+    import numpy as np
+    from src.agents.evaluate import evaluate_model, confidence_halfwidth
+    
+    project_root = os.path.join(os.path.dirname(__file__), '..')
+    model_path = sorted(glob.glob(os.path.join(project_root, 'models', 'best_bitcoin_alpha_*', 'best_model.zip')))[0]
+    kwargs = dict(alpha=0.35, max_steps_per_episode=200, seed=0, use_cache=False, ci_batch_size=5, verbose=0)
+    
+    results = evaluate_model(model_path, n_episodes=100, target_ci=0.05, **kwargs)
+    assert results['n_episodes'] < 100 and results['n_episodes'] % 5 == 0
+    assert results['ci_halfwidth'] <= 0.05
+    assert np.isclose(results['ci_halfwidth'], confidence_halfwidth(results['episode_reward_fractions']))
+    print(f"[OK] {results['n_episodes']} 个 episode 后停止，置信区间半宽 {results['ci_halfwidth']:.4f}")
+    
+    results = evaluate_model(model_path, n_episodes=10, target_ci=1e-6, **kwargs)
+    assert results['n_episodes'] == 10 and results['ci_halfwidth'] > 1e-6
+    print(f"[OK] 达不到目标精度时运行满 10 个 episode，报告半宽 {results['ci_halfwidth']:.4f}")
+
+
+
+def test_paired_evaluation():
+    """测试公共随机数评估：同一模型配对差为 0，不同模型的配对置信区间比独立评估窄"""
+    print("\n" + "="*60)
+    print("测试公共随机数配对评估")
+    print("="*60)
+    
+    import glob
+    from src.agents.evaluate import evaluate_paired
+    
+    project_root = os.path.join(os.path.dirname(__file__), '..')
+    paths = sorted(glob.glob(os.path.join(project_root, 'models', 'best_bitcoin_alpha_*', 'best_model.zip')))
+    models = [{'model_path': paths[0]}, {'model_path': paths[0]}, {'model_path': paths[-1]}]
+    results, differences = evaluate_paired(models, event_seed=3, n_episodes=10, alpha=0.35,
+                                           max_steps_per_episode=200, use_cache=False, verbose=0)
+    
+    # 同一模型重放同一事件流，结果完全相同
+    assert results[1]['episode_reward_fractions'] == results[0]['episode_reward_fractions']
+    assert differences[1]['mean_difference'] == 0 and differences[1]['ci_halfwidth'] == 0
+    print("[OK] 同一模型的配对差为 0")
+    
+    d = differences[2]
+    assert d['ci_halfwidth'] < d['unpaired_ci_halfwidth']
+    print(f"[OK] 配对差 {d['mean_difference']:+.4f} ± {d['ci_halfwidth']:.4f}，"
+          f"独立评估 ± {d['unpaired_ci_halfwidth']:.4f}")
+
+
+def test_steady_state_evaluation():
+    """测试长链稳态评估：比值估计、再生周期和批均值两种方法"""
+    print("\n" + "="*60)
+    print("测试稳态评估")
+    print("="*60)
+    
+    import glob
+    import numpy as np
+    from src.agents.evaluate import ratio_estimate, evaluate_steady_state
+    
+    # 比值估计是 ΣA / ΣT；各周期比值相同时方差为 0
+    estimate, halfwidth = ratio_estimate([1, 2, 3], [2, 4, 6])
+    assert estimate == 0.5 and halfwidth == 0
+    estimate, halfwidth = ratio_estimate([1, 0, 3, 1], [2, 1, 4, 3])
+    assert np.isclose(estimate, 0.5) and 0 < halfwidth < np.inf
+    assert ratio_estimate([1], [2])[1] == np.inf
+    print("[OK] 比值估计")
+    
+    project_root = os.path.join(os.path.dirname(__file__), '..')
+    model_path = sorted(glob.glob(os.path.join(project_root, 'models', 'best_bitcoin_alpha_*', 'best_model.zip')))[-1]
+    results = {}
+    for method in ('regenerative', 'batch_means'):
+        results[method] = evaluate_steady_state(model_path, alpha=0.35, method=method, target_ci=None, n_chains=2,
+                                                max_steps=3000, check_every=1000, batch_steps=300, seed=0,
+                                                use_cache=False, verbose=0)
+    
+    regen, batch = results['regenerative'], results['batch_means']
+    assert regen['n_steps'] == batch['n_steps'] == 6000
+    assert batch['n_units'] == 20 and batch['mean_unit_length'] == 300
+    assert regen['n_units'] > batch['n_units'] and 0 < regen['ci_halfwidth'] < np.inf
+    # 同一种子下两种方法切分的是同一组链，估计只差末尾未结束的周期
+    assert abs(regen['mean_reward_fraction'] - batch['mean_reward_fraction']) < 0.01
+    print(f"[OK] 再生周期 {regen['mean_reward_fraction']:.4f} ± {regen['ci_halfwidth']:.4f} "
+          f"({regen['n_units']} 个周期)，批均值 {batch['mean_reward_fraction']:.4f} ± {batch['ci_halfwidth']:.4f}")
+    
+    # 达到目标精度后提前停止
+    stopped = evaluate_steady_state(model_path, alpha=0.35, target_ci=0.05, n_chains=1, max_steps=6000,
+                                    check_every=500, seed=0, use_cache=False, verbose=0)
+    assert stopped['n_steps'] < 6000 and stopped['ci_halfwidth'] <= 0.05
+    print(f"[OK] 序贯停止: {stopped['n_steps']} 步")
+
+
 if __name__ == "__main__":
     test_evaluate_import()
     test_visualization()
+    test_numpy_policy_matches_sb3()
+    test_policy_table()
+    test_model_cache()
+    test_model_registry()
+    test_results_store()
+    test_eval_cache()
+    test_sequential_evaluation()
+    test_paired_evaluation()
+    test_steady_state_evaluation()
 
@@ -95,6 +95,46 @@ def test_utb_defense():
     print("\n[SUCCESS] UTB防御测试通过!")
 
 
+def test_rollout_lookahead_policy():
+    """测试蒙特卡洛前瞻攻击者：决策不改变环境状态，收益高于诚实挖矿"""
+    print("\n" + "="*60)
+    print("测试蒙特卡洛前瞻攻击者")
+    print("="*60)
+    
+    import numpy as np
+    from src.environment.gym_wrapper import make_env
+    from src.environment.base_env import settled_rewards
+    from src.environment.utb_defense import RolloutLookaheadPolicy
+    
+    for protocol in ('bitcoin', 'ethereum'):
+        env = make_env(protocol=protocol, alpha=0.4, info_level='none')
+        obs, info = env.reset(seed=7)
+        policy = RolloutLookaheadPolicy(env, n_rollouts=32, rho_steps=5000, seed=7)
+        
+        # [1] rollout 之后环境和全局随机数状态恢复原样
+        before = env.get_state()
+        values, fractions = policy.action_values()
+        after = env.get_state()
+        assert before[0].values == after[0].values and before[1:] == after[1:]
+        assert np.array_equal(before[0].rng[1], after[0].rng[1])
+        assert np.all(np.isinf(values) == ~env.action_masks())
+        assert 0 < policy.rho < 1
+        
+        # [2] 收益高于诚实挖矿（相对奖励 alpha）
+        for _ in range(2000):
+            action, _ = policy.predict(obs)
+            obs, reward, terminated, truncated, info = env.step(action)
+        attacker, honest = settled_rewards(env.env)
+        fraction = attacker / (attacker + honest)
+        print(f"[OK] {protocol}: 相对奖励 {fraction:.4f}（alpha=0.4），缓存状态数 {len(policy._estimates)}")
+        assert fraction > 0.42
+        # 领先动作明确的状态在 max_rollouts 之前就确定了动作
+        settled = [e[2] for e in policy._estimates.values() if e[4]]
+        assert settled and min(settled) < policy.max_rollouts
+        print(f"[OK] {protocol}: {len(settled)} 个状态提前确定动作")
+        env.close()
+
+
 def test_cli():
     """测试CLI工具"""
     print("\n" + "="*60)
@@ -153,11 +193,65 @@ def test_config():
     print("\n[SUCCESS] 配置系统测试通过!")
 
 
+def test_benchmark():
+    """测试吞吐量基准测试与基线比较"""
+    print("\n" + "="*60)
+    print("测试吞吐量基准测试")
+    print("="*60)
+    
+    import tempfile
+    from src.utils.benchmark import (run_benchmarks, save_benchmark, load_benchmark,
+                                     compare_benchmarks, TIME_NOISE_FLOOR)
+    
+    # [1] 快速运行环境 / 模拟器两组
+    print("\n[1] 快速运行 env / sim 两组...")
+    results = run_benchmarks(groups=('env', 'sim'), quick=True, verbose=0)
+    metrics = results['metrics']
+    assert 'env_step.bitcoin' in metrics and 'sim_step.SM_env' in metrics
+    assert all(m['value'] > 0 and m['higher_is_better'] for m in metrics.values())
+    print(f"[OK] 得到 {len(metrics)} 个指标, env_step.bitcoin = {metrics['env_step.bitcoin']['value']:.0f} steps/s")
+    
+    # [2] 保存与读取
+    print("\n[2] 测试保存与读取...")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'benchmark.json')
+        assert load_benchmark(path) is None
+        save_benchmark(results, path)
+        assert load_benchmark(path) == results
+    print("[OK] 保存后读取结果一致")
+    
+    # [3] 与合成基线比较
+    print("\n[3] 测试与基线比较...")
+    current = {'version': 1, 'metrics': {
+        'throughput': {'value': 60.0, 'unit': 'steps/s', 'higher_is_better': True},
+        'slow': {'value': 0.2, 'unit': 's', 'higher_is_better': False},
+        'tiny': {'value': TIME_NOISE_FLOOR / 2, 'unit': 's', 'higher_is_better': False},
+        'new': {'value': 1.0, 'unit': 's', 'higher_is_better': False},
+    }}
+    baseline = {'version': 1, 'metrics': {
+        'throughput': {'value': 100.0, 'unit': 'steps/s', 'higher_is_better': True},
+        'slow': {'value': 0.1, 'unit': 's', 'higher_is_better': False},
+        'tiny': {'value': TIME_NOISE_FLOOR / 10, 'unit': 's', 'higher_is_better': False},
+    }}
+    rows = {row['name']: row for row in compare_benchmarks(current, baseline, tolerance=0.3)}
+    assert set(rows) == {'throughput', 'slow', 'tiny'}
+    assert rows['throughput']['regressed'] and rows['slow']['regressed']
+    assert not rows['tiny']['regressed']  # 变化低于噪声下限
+    assert not any(row['regressed'] for row in compare_benchmarks(current, baseline, tolerance=0.5)
+                   if row['name'] == 'throughput')
+    assert compare_benchmarks(current, dict(baseline, version=0)) == []
+    print("[OK] 吞吐量下降与耗时增加被识别为退化，噪声下限以内的变化被忽略")
+    
+    print("\n[SUCCESS] 基准测试模块测试通过!")
+
+
 if __name__ == "__main__":
     test_ghost_env()
     test_utb_defense()
+    test_rollout_lookahead_policy()
     test_cli()
     test_config()
+    test_benchmark()
     
     print("\n" + "="*60)
     print("[ALL TESTS PASSED] 所有扩展功能测试通过!")
@@ -67,7 +67,314 @@ def test_gym_wrapper():
         print("="*60)
         return False
 
+def test_info_level():
+    """测试 info_level：精简模式不构造 info，状态转移与完整模式相同"""
+    print("\n" + "="*60)
+    print("测试 info 详细程度")
+    print("="*60)
+    
+    import numpy as np
+    from src.environment.gym_wrapper import make_env
+    
+    for protocol in ('bitcoin', 'utb'):
+        env = make_env(protocol=protocol, alpha=0.35)
+        trajectories = {}
+        for level in ('full', 'terminal', 'none'):
+            env.info_level = level
+            state, _ = env.reset(seed=0)
+            trajectory = []
+            for _ in range(50):
+                state, reward, terminated, truncated, info = env.step(2 if np.random.rand() < 0.7 else 1)
+                trajectory.append((np.asarray(state).tolist(), reward))
+                if level == 'full':
+                    assert 'steps' in info
+                else:
+                    assert info == {}
+            trajectories[level] = trajectory
+        assert trajectories['none'] == trajectories['terminal'] == trajectories['full']
+        print(f"[OK] {protocol}: 三种模式的状态和奖励一致，精简模式返回空 info")
+    
+    try:
+        make_env(protocol='ethereum', info_level='minimal')
+        assert False, "未知的 info_level 应当报错"
+    except ValueError:
+        print("[OK] 未知的 info_level 报错")
+
+
+def test_obs_buffer():
+    """测试观察缓冲区：观察原地写入共享批量缓冲区的各行，取值与每步新建数组相同"""
+    print("\n" + "="*60)
+    print("测试观察缓冲区")
+    print("="*60)
+    
+    import numpy as np
+    from src.environment.gym_wrapper import make_env
+    
+    env = make_env(protocol='utb', alpha=0.35)
+    batch = np.zeros((2,) + env.observation_space.shape, dtype=np.float32)
+    
+    actions = [2, 2, 1, 2, 0, 2, 2, 2, 1, 2]
+    observations = {}
+    for buffered in (False, True):
+        env.obs_buffer = batch[1, ...] if buffered else None
+        obs, _ = env.reset(seed=0)
+        trajectory = [obs.copy()]
+        for action in actions:
+            obs = env.step(action)[0]
+            assert obs.dtype == np.float32
+            if buffered:
+                assert obs is env.obs_buffer and np.shares_memory(obs, batch)
+                assert np.array_equal(batch[1], obs)
+            trajectory.append(obs.copy())
+        observations[buffered] = trajectory
+    assert all(np.array_equal(a, b) for a, b in zip(observations[False], observations[True]))
+    assert not batch[0].any()
+    print("[OK] 写入批量缓冲区的观察与新建数组一致")
+    
+    # 训练使用的组合：环境自己的缓冲区 + TimeLimit 截断时返回副本
+    from gymnasium.wrappers import TimeLimit
+    from src.environment.gym_wrapper import attach_obs_buffer, CopyOnEpisodeEnd
+    env = attach_obs_buffer(make_env(protocol='ethereum', alpha=0.35))
+    assert env.obs_buffer is not None
+    assert attach_obs_buffer(make_env(protocol='bitcoin')).obs_buffer is None  # Discrete 观察不需要缓冲区
+    wrapped = CopyOnEpisodeEnd(TimeLimit(env, max_episode_steps=3))
+    obs, _ = wrapped.reset(seed=0)
+    for _ in range(3):
+        obs, _, terminated, truncated, _ = wrapped.step(2)
+    assert truncated and not np.shares_memory(obs, env.obs_buffer)
+    last = obs.copy()
+    wrapped.reset()
+    assert np.array_equal(obs, last)
+    print("[OK] episode 结束时返回的观察不会被 reset 覆盖")
+    
+    try:
+        make_env(protocol='bitcoin', obs_buffer=np.zeros(3, dtype=np.float32))
+        assert False, "形状不符的缓冲区应当报错"
+    except ValueError:
+        print("[OK] 形状或类型不符的缓冲区报错")
+
+
+def test_action_masks():
+    """测试合法动作掩码：与底层环境的转移函数一致，并通过 info 和 action_masks() 提供"""
+    print("\n" + "="*60)
+    print("测试合法动作掩码")
+    print("="*60)
+    
+    import numpy as np
+    from src.environment.gym_wrapper import make_env
+    
+    for protocol in ('bitcoin', 'ethereum', 'utb'):
+        env = make_env(protocol=protocol, alpha=0.35)
+        _, info = env.reset(seed=0)
+        assert np.array_equal(info['action_mask'], env.action_masks())
+        for _ in range(300):
+            mask = env.action_masks()
+            assert mask.dtype == bool and mask.shape == (env.action_space.n,) and mask.any()
+            # 掩码与直接调用转移函数判断的合法性一致
+            state = env.current_state
+            if protocol == 'ethereum':
+                legal = [len(env.env._race_outcomes(state, a, env.env._current_alpha)) > 0 for a in range(len(mask))]
+            else:
+                legal = [len(env.env.transitions(state if protocol == 'bitcoin' else state[0:4], a)) > 0
+                         for a in range(len(mask))]
+            assert mask.tolist() == legal
+            action = np.random.choice(np.flatnonzero(mask))
+            _, _, _, _, info = env.step(action)
+            assert np.array_equal(info['action_mask'], env.action_masks())
+        print(f"[OK] {protocol}: 掩码与转移函数一致")
+    
+    # (0, 0) 状态只能等待
+    env = make_env(protocol='bitcoin', alpha=0.35)
+    env.reset(seed=0)
+    assert env.action_masks().tolist() == [False, False, True]
+    table = env.env.legal_mask_table()
+    assert table.shape == (len(env.env._state_space), 3) and table.any(axis=1).all()
+    print(f"[OK] bitcoin 掩码表: {table.shape[0]} 个状态")
+
+
+def test_observation_encoding():
+    """测试观察编码：查表得到的特征与状态 (a, b, status) 一致，批量编码与逐步观察相同"""
+    print("\n" + "="*60)
+    print("测试观察编码")
+    print("="*60)
+    
+    import numpy as np
+    from src.environment.gym_wrapper import make_env, encoding_table
+    
+    env = make_env(protocol='bitcoin', alpha=0.35, max_fork_length=10)
+    state_space = env.env._state_space
+    dims = {'onehot': len(state_space), 'features': 5, 'lead': 6}
+    for encoding, dim in dims.items():
+        table = encoding_table(state_space, 10, encoding)
+        assert table.shape == (len(state_space), dim) and table.dtype == np.float32
+        assert len(np.unique(table, axis=0)) == len(state_space), "不同状态的编码应当不同"
+    
+    idx = state_space.index((3, 1, 'forking'))
+    assert np.allclose(encoding_table(state_space, 10, 'lead')[idx], [2 / 11, 3 / 11, 1 / 11, 0, 0, 1])
+    print(f"[OK] 编码表: {', '.join(f'{k}={v} 维' for k, v in dims.items())}")
+    
+    env.encoding = 'lead'
+    env.encoding_table = encoding_table(state_space, 10, 'lead')
+    states, observations = [], []
+    obs, _ = env.reset(seed=0)
+    for _ in range(100):
+        states.append(env.current_state)
+        observations.append(obs)
+        obs = env.step(np.random.choice(np.flatnonzero(env.action_masks())))[0]
+    assert np.array_equal(env.encode(np.array(states)), np.array(observations))
+    print("[OK] 批量编码与逐步观察一致")
+    
+    env = make_env(protocol='bitcoin', alpha=0.35, max_fork_length=10, encoding='features')
+    assert env.observation_space.shape == (5,)
+    assert env.observation_space.contains(env.reset(seed=0)[0])
+    print(f"[OK] encoding='features' 的观察空间: {env.observation_space}")
+
+
+def test_state_snapshot():
+    """测试状态快照：从快照恢复后重复同样的动作，轨迹完全相同"""
+    print("\n" + "="*60)
+    print("测试状态快照")
+    print("="*60)
+    
+    import numpy as np
+    from src.environment.gym_wrapper import make_env
+    from src.environment.base_env import SM_env_with_cost
+    
+    def rollout(env, actions):
+        return [(np.asarray(obs).tolist(), reward) for obs, reward, *_ in (env.step(a) for a in actions)]
+    
+    for protocol in ('bitcoin', 'ethereum', 'utb'):
+        env = make_env(protocol=protocol, alpha=0.35, info_level='none')
+        env.reset(seed=0)
+        rollout(env, np.random.randint(3, size=50))
+        
+        # 动作先抽好，快照之后的随机数只用于环境事件
+        actions = np.random.randint(3, size=100)
+        snapshot = env.get_state()
+        first = rollout(env, actions)
+        counters = env.env.reward_fraction, env.steps
+        
+        obs = env.set_state(snapshot)
+        assert np.array_equal(obs, env._observation(snapshot[1]))
+        assert rollout(env, actions) == first
+        assert (env.env.reward_fraction, env.steps) == counters
+        print(f"[OK] {protocol}: 恢复快照后的 100 步轨迹一致")
+    
+    # 快照不可变：numpy 状态是只读副本
+    assert not snapshot[0].rng[1].flags.writeable
+    
+    # 底层环境直接使用：带难度调整历史的 SM_env_with_cost
+    sim = SM_env_with_cost(5, 0.35, 0.5, cost=0.1)
+    state = sim.reset()
+    for _ in range(200):
+        state = sim.step(state, np.random.randint(4))[0]
+    actions = np.random.randint(4, size=300)
+    snapshot = sim.get_state()
+    assert not snapshot.values[sim._snapshot_attrs.index('history_diff')].flags.writeable
+    trajectory = []
+    for a in actions:
+        state = sim.step(state, a)[0]
+        trajectory.append(state)
+    sim.set_state(snapshot)
+    state = sim._current_state
+    for a, expected in zip(actions, trajectory):
+        state = sim.step(state, a)[0]
+        assert state == expected
+    print("[OK] SM_env_with_cost: 恢复快照后的轨迹一致")
+
+
+def test_repeated_construction():
+    """测试重复创建相同配置的环境：不变部分共享，可变状态互相独立"""
+    print("\n" + "="*60)
+    print("测试重复创建环境")
+    print("="*60)
+    
+    import numpy as np
+    from src.environment import base_env
+    from src.environment.gym_wrapper import make_env
+    
+    for protocol in ('bitcoin', 'ethereum', 'utb'):
+        first = make_env(protocol=protocol, alpha=0.3, info_level='none')
+        n_estimates = len(base_env._expected_alphas)
+        # 创建环境（包括第一次估计期望 alpha）不消耗全局随机数，设置种子后的随机序列不受影响
+        np.random.seed(0)
+        second = make_env(protocol=protocol, alpha=0.3, info_level='none')
+        assert len(base_env._expected_alphas) == n_estimates  # 相同配置直接复用期望 alpha
+        assert second.env._expected_alpha == first.env._expected_alpha
+        make_env(protocol=protocol, alpha=0.3, dev=0.05, info_level='none')
+        draw = np.random.random()
+        np.random.seed(0)
+        assert draw == np.random.random()
+        
+        # 两个环境的运行状态互不影响
+        first.reset(seed=0)
+        second.reset(seed=0)
+        for _ in range(200):
+            first.step(np.random.randint(3))
+        assert second.steps == 0 and second.current_state == second.env.reset()
+        print(f"[OK] {protocol}: 重复创建复用期望 alpha，运行状态独立")
+    
+    # 合法动作表按 max_hidden_block 共享
+    a = make_env(protocol='bitcoin', alpha=0.3)
+    b = make_env(protocol='bitcoin', alpha=0.4, gamma=0.1)
+    assert a.env.legal_mask_table() is b.env.legal_mask_table()
+    print("[OK] 合法动作表在相同状态空间的环境之间共享")
+
+
+def test_registered_envs():
+    """测试 gymnasium 注册的环境 ID 和批量环境"""
+    print("\n" + "="*60)
+    print("测试 gymnasium 注册和批量环境")
+    print("="*60)
+    
+    import numpy as np
+    import gymnasium as gym
+    from src.environment.gym_wrapper import ENV_IDS, make_env
+    from src.environment.vector_env import SelfishMiningVectorEnv
+    
+    for env_id, protocol in ENV_IDS.items():
+        env = gym.make(env_id, alpha=0.35)
+        obs, info = env.reset(seed=0)
+        assert env.observation_space.contains(obs)
+        env.close()
+        
+        # make_vec 默认使用 vector_entry_point
+        envs = gym.make_vec(env_id, num_envs=4, alpha=0.35, max_episode_steps=30)
+        assert isinstance(envs, SelfishMiningVectorEnv)
+        print(f"[OK] {env_id}: {envs.observation_space}")
+        
+        # 与逐个 step 同配置的单个环境结果一致（每步前恢复全局随机数状态，两边消耗同样的随机数）
+        singles = [make_env(protocol=protocol, alpha=0.35, info_level='none') for _ in range(4)]
+        obs, _ = envs.reset(seed=1)
+        expected = [e.reset(seed=1 if i == 0 else None)[0] for i, e in enumerate(singles)]
+        assert np.array_equal(obs, np.stack(expected))
+        assert envs.action_masks().shape == (4, envs.single_action_space.n)
+        actions = np.random.default_rng(0).integers(3, size=(40, 4))
+        for t, action in enumerate(actions):
+            rng_state = np.random.get_state()
+            obs, rewards, terminated, truncated, infos = envs.step(action)
+            np.random.set_state(rng_state)
+            if t == 30:
+                # 上一步截断的环境在这一步复位，奖励为 0
+                expected = [e.reset()[0] for e in singles]
+                assert np.array_equal(obs, np.stack(expected)) and not rewards.any()
+                continue
+            results = [e.step(a) for e, a in zip(singles, action)]
+            assert np.array_equal(obs, np.stack([r[0] for r in results]))
+            assert np.array_equal(rewards, [r[1] for r in results])
+            assert truncated.all() == (t == 29)
+        envs.close()
+    print("[OK] 批量环境的结果与单个环境一致，max_episode_steps 截断后自动复位")
+
+
 if __name__ == "__main__":
+    test_info_level()
+    test_state_snapshot()
+    test_repeated_construction()
+    test_registered_envs()
+    test_observation_encoding()
+    test_action_masks()
+    test_obs_buffer()
     success = test_gym_wrapper()
     sys.exit(0 if success else 1)
 
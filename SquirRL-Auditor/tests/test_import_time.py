@@ -0,0 +1,85 @@
+"""
+测试命令行各子命令的导入开销
+
+每个子命令在全新的解释器中导入它用到的模块，用 python -X importtime 统计累计耗时，
+并检查没有提前加载不需要的重量级依赖（torch、matplotlib、scipy 等）。
+"""
+
+import os
+import sys
+import subprocess
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# 子命令 -> (导入的模块, 不应加载的依赖, 导入耗时预算/秒)
+# 预算约为本地实测值的 3 倍，给较慢的 CI 机器留出余量
+IMPORT_BUDGETS = {
+    'info': (['src.cli', 'src.environment.gym_wrapper'],
+             ['torch', 'stable_baselines3', 'matplotlib', 'scipy', 'mdptoolbox'], 1.0),
+    'train': (['src.cli', 'src.agents.train'],
+              ['torch', 'stable_baselines3', 'matplotlib', 'scipy', 'mdptoolbox'], 1.0),
+    'evaluate': (['src.cli', 'src.agents.evaluate'],
+                 ['torch', 'stable_baselines3', 'matplotlib', 'scipy', 'mdptoolbox'], 1.0),
+    'export': (['src.cli', 'src.agents.numpy_policy'],
+               ['torch', 'stable_baselines3', 'matplotlib', 'scipy', 'mdptoolbox'], 1.0),
+    'models': (['src.cli', 'src.agents.model_registry'],
+               ['torch', 'stable_baselines3', 'matplotlib', 'scipy', 'mdptoolbox', 'numpy'], 1.0),
+    'plot': (['src.cli', 'src.visualization.reward_plot'],
+             ['torch', 'stable_baselines3', 'scipy', 'mdptoolbox'], 2.0),
+    'compare': (['src.cli', 'src.visualization.reward_plot'],
+                ['torch', 'stable_baselines3', 'scipy', 'mdptoolbox'], 2.0),
+    'atlas': (['src.cli', 'src.environment.mdp_atlas'],
+              ['torch', 'stable_baselines3', 'matplotlib', 'mdptoolbox'], 1.5),
+    'threshold': (['src.cli', 'src.environment.mdp_threshold'],
+                  ['torch', 'stable_baselines3', 'matplotlib', 'mdptoolbox'], 1.5),
+    'benchmark': (['src.cli', 'src.utils.benchmark'],
+                  ['torch', 'stable_baselines3', 'matplotlib', 'scipy', 'mdptoolbox'], 1.0),
+}
+
+
+def measure_imports(modules, heavy):
+    """
+    在子进程中导入模块
+
+    返回：
+        seconds (float): 顶层导入的累计耗时
+        loaded (list): heavy 中被加载了的依赖
+    """
+    code = "import sys\n" + "".join(f"import {m}\n" for m in modules) + \
+           f"print(','.join(m for m in {heavy!r} if m in sys.modules))"
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=PROJECT_ROOT,
+                            capture_output=True, text=True, check=True)
+
+    # 只统计顶层导入（模块名前没有缩进）的累计耗时，单位为微秒
+    total = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        _, cumulative, name = line.split('|')
+        if not name.startswith('  ') and cumulative.strip().isdigit():
+            total += int(cumulative)
+    loaded = [m for m in result.stdout.strip().split(',') if m]
+    return total / 1e6, loaded
+
+
+def test_cli_import_budgets():
+    """测试每个子命令的导入耗时都在预算内，且不加载多余的重量级依赖"""
+    print("\n" + "="*60)
+    print("测试: 子命令导入开销")
+    print("="*60)
+
+    failures = []
+    for command, (modules, heavy, budget) in IMPORT_BUDGETS.items():
+        seconds, loaded = measure_imports(modules, heavy)
+        print(f"  {command:<10} {seconds:6.3f}s / {budget:.1f}s  多余依赖: {loaded or '无'}")
+        if loaded:
+            failures.append(f"{command}: 导入了 {loaded}")
+        if seconds > budget:
+            failures.append(f"{command}: 导入耗时 {seconds:.3f}s 超出预算 {budget:.1f}s")
+    assert not failures, "; ".join(failures)
+
+
+if __name__ == "__main__":
+    test_cli_import_budgets()
+    print("\n[SUCCESS] 导入开销测试通过!")
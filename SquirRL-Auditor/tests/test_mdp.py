@@ -0,0 +1,204 @@
+"""
+测试稀疏 MDP 构建：所有底层环境共用同一份 transitions 转移定义
+"""
+
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import numpy as np
+
+
+def honest_policy(states):
+    """诚实挖矿策略：领先就发布，落后就放弃，其余等待"""
+    policy = []
+    for s in states:
+        a, b = s[0], s[1]
+        if a > b:
+            policy.append(1)
+        elif a < b:
+            policy.append(0)
+        else:
+            policy.append(2)
+    return np.array(policy)
+
+
+def test_sparse_mdp_is_stochastic():
+    """测试每个协议的稀疏 MDP 都是合法的随机矩阵"""
+    print("\n" + "="*60)
+    print("测试: 稀疏 MDP 构建")
+    print("="*60)
+
+    from src.environment.base_env import SM_env, SM_env_with_stale, eth_env, SM_env_with_cost
+
+    envs = {
+        'bitcoin': SM_env(max_hidden_block=5, attacker_fraction=0.3, follower_fraction=0.5),
+        'ghost': SM_env_with_stale(5, 0.3, 0.5, stale_rate=0.1, rule="GHOST"),
+        'ethereum': eth_env(3, 0.3, 0.5),
+        'cost': SM_env_with_cost(5, 0.3, 0.5, cost=0.5),
+    }
+
+    for name, env in envs.items():
+        mdp = env.get_sparse_MDP()
+        for P in mdp.P:
+            assert np.allclose(np.asarray(P.sum(axis=1)).ravel(), 1.0)
+        assert mdp.legal.any(axis=1).all()
+        print(f"[OK] {name}: {mdp.S} 个状态, {mdp.A} 个动作")
+
+
+def test_honest_revenue_equals_alpha():
+    """测试诚实策略的精确收益等于算力占比"""
+    from src.environment.base_env import SM_env_with_stale, SM_env_with_cost
+
+    for env in [SM_env_with_stale(5, 0.3, 0.5, stale_rate=0.0, rule="longest"),
+                SM_env_with_cost(5, 0.3, 0.5)]:
+        mdp = env.get_sparse_MDP()
+        revenue = env.theoretical_attacker_fraction(honest_policy(mdp.states))
+        print(f"  {type(env).__name__}: 诚实收益 = {revenue:.4f}")
+        assert abs(revenue - 0.3) < 1e-6
+
+
+def test_optimal_policy_beats_honest():
+    """测试 eth_env 的最优策略收益不低于诚实挖矿"""
+    from src.environment.base_env import eth_env
+
+    env = eth_env(3, 0.35, 0.5)
+    policy = env.optimal_mdp_solver()
+    revenue = env.theoretical_attacker_fraction(policy)
+    print(f"  eth_env 最优策略收益 = {revenue:.4f}")
+    assert revenue >= 0.35 - 1e-3
+
+
+def test_mdp_cache():
+    """测试 MDP 缓存的读写与 LRU 淘汰"""
+    import tempfile
+    from src.environment.base_env import SM_env_with_stale
+    from src.environment.mdp_cache import MDPCache, env_config, load_or_build, optimal_policy
+
+    env = SM_env_with_stale(4, 0.35, 0.5, stale_rate=0.1, rule="GHOST")
+    root = tempfile.mkdtemp()
+    cache = MDPCache(root)
+
+    mdp = load_or_build(env, env._expected_alpha, states=env._state_space, start=(0, 0, 0, 0), cache=cache)
+    policy, p, revenue = optimal_policy(mdp, env._alpha, cache)
+
+    # 第二次读取应命中缓存，并得到相同的矩阵和结果
+    cached = load_or_build(env, env._expected_alpha, cache=cache)
+    assert cached.states == mdp.states
+    for P1, P2 in zip(mdp.P, cached.P):
+        assert abs(P1 - P2).max() == 0
+    policy2, p2, revenue2 = optimal_policy(cached, env._alpha, cache)
+    assert (policy2 == policy).all() and p2 == p and revenue2 == revenue
+    print(f"[OK] 缓存命中: OSM p = {p:.4f}, 收益 = {revenue:.4f}")
+
+    # 容量为 0 时所有条目都会被淘汰
+    MDPCache(root, max_bytes=0).evict()
+    assert cache.load_solution(env_config(env, env._expected_alpha)) is None
+    print("[OK] LRU 淘汰正常")
+
+
+def test_atlas_matches_direct_solve():
+    """测试最优策略图谱与逐点直接求解一致"""
+    import tempfile
+    from src.environment.mdp_atlas import build_atlas, load_atlas
+    from src.environment.mdp_cache import make_protocol_env
+
+    previous = os.environ.get('BLOCKRL_MDP_CACHE')
+    os.environ['BLOCKRL_MDP_CACHE'] = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tempfile.mkdtemp(), 'bitcoin.npz')
+        atlas = build_atlas('bitcoin', [0.25, 0.35, 0.45], [0.0, 1.0], max_hidden_block=5,
+                            n_workers=1, output_path=path, verbose=0)
+        atlas = load_atlas('bitcoin', path)
+        assert atlas.revenue.shape == (1, 2, 3)
+
+        env = make_protocol_env('bitcoin', 5, 0.35, 1.0, 0.0)
+        revenue = env.theoretical_attacker_fraction(env.optimal_mdp_solver())
+        print(f"  图谱收益 = {atlas.revenue_at(0.35, 1.0):.4f}, 直接求解 = {revenue:.4f}")
+        assert abs(atlas.revenue_at(0.35, 1.0) - revenue) < 1e-3
+        # 收益随 alpha、gamma 单调不减
+        assert (np.diff(atlas.revenue, axis=2) >= -1e-6).all()
+        assert (np.diff(atlas.revenue, axis=1) >= -1e-6).all()
+    finally:
+        if previous is None:
+            os.environ.pop('BLOCKRL_MDP_CACHE')
+        else:
+            os.environ['BLOCKRL_MDP_CACHE'] = previous
+
+
+def test_atlas_mixed_stale_rates():
+    """测试 bitcoin 图谱同时包含 0 和正的陈旧区块率：stale_rate = 0 的行与 SM_env 直接求解一致"""
+    import tempfile
+    from src.environment.mdp_atlas import build_atlas
+    from src.environment.mdp_cache import make_protocol_env
+
+    previous = os.environ.get('BLOCKRL_MDP_CACHE')
+    os.environ['BLOCKRL_MDP_CACHE'] = 'off'
+    try:
+        path = os.path.join(tempfile.mkdtemp(), 'bitcoin.npz')
+        atlas = build_atlas('bitcoin', [0.3, 0.35], [0.5], stale_rates=(0.0, 0.05), max_hidden_block=4,
+                            n_workers=1, output_path=path, verbose=0)
+        assert atlas.revenue.shape == (2, 1, 2)
+
+        env = make_protocol_env('bitcoin', 4, 0.35, 0.5, 0.0)
+        revenue = env.theoretical_attacker_fraction(env.optimal_mdp_solver())
+        print(f"  stale = 0: 图谱收益 = {atlas.revenue_at(0.35, 0.5, 0.0):.4f}, SM_env 直接求解 = {revenue:.4f}")
+        print(f"  stale = 0.05: 图谱收益 = {atlas.revenue_at(0.35, 0.5, 0.05):.4f}")
+        assert abs(atlas.revenue_at(0.35, 0.5, 0.0) - revenue) < 1e-3
+        # 陈旧区块使诚实矿工的有效算力下降，攻击者收益占比不会更低
+        assert (atlas.revenue[1] >= atlas.revenue[0] - 1e-6).all()
+    finally:
+        if previous is None:
+            os.environ.pop('BLOCKRL_MDP_CACHE')
+        else:
+            os.environ['BLOCKRL_MDP_CACHE'] = previous
+
+
+def test_profitability_threshold():
+    """测试最小盈利算力阈值：gamma = 0 时接近 1/3，且随 gamma 单调不增"""
+    from src.environment.mdp_threshold import threshold_curve
+
+    gammas, thresholds = threshold_curve('bitcoin', [0.0, 0.5, 1.0], max_hidden_block=10, alpha_tol=1e-3,
+                                         n_workers=1, verbose=0)
+    for gamma, threshold in zip(gammas, thresholds):
+        print(f"  gamma = {gamma:.1f}: 阈值 = {threshold:.4f}")
+    assert 0.31 < thresholds[0] < 1 / 3 + 1e-3
+    assert (np.diff(thresholds) <= 1e-3).all()
+    assert thresholds[2] < 0.05
+
+
+def test_revenue_sensitivity():
+    """测试收益对 alpha、gamma 的解析导数与有限差分一致"""
+    from src.environment.base_env import SM_env_with_stale
+    from src.environment.mdp_util import build_sparse_mdp
+
+    env = SM_env_with_stale(5, 0.35, 0.5, stale_rate=0.1, rule="GHOST")
+    policy = env.optimal_mdp_solver()
+    mdp = env.get_sparse_MDP()
+    revenue, d_alpha, d_gamma = env.attacker_fraction_sensitivity(policy)
+    assert abs(revenue - env.theoretical_attacker_fraction(policy)) < 1e-12
+
+    def fixed_policy_revenue(alpha, gamma):
+        env._gamma = gamma
+        perturbed = build_sparse_mdp(env, alpha=alpha, states=mdp.states, start=mdp.states[mdp.start])
+        env._gamma = 0.5
+        return perturbed.revenue(policy)
+
+    h = 1e-4
+    fd_alpha = (fixed_policy_revenue(0.35 + h, 0.5) - fixed_policy_revenue(0.35 - h, 0.5)) / (2 * h)
+    fd_gamma = (fixed_policy_revenue(0.35, 0.5 + h) - fixed_policy_revenue(0.35, 0.5 - h)) / (2 * h)
+    print(f"  d/dalpha = {d_alpha:.6f} (差分 {fd_alpha:.6f}), d/dgamma = {d_gamma:.6f} (差分 {fd_gamma:.6f})")
+    assert abs(d_alpha - fd_alpha) < 1e-5
+    assert abs(d_gamma - fd_gamma) < 1e-5
+
+
+if __name__ == "__main__":
+    test_sparse_mdp_is_stochastic()
+    test_honest_revenue_equals_alpha()
+    test_optimal_policy_beats_honest()
+    test_mdp_cache()
+    test_atlas_matches_direct_solve()
+    test_atlas_mixed_stale_rates()
+    test_profitability_threshold()
+    test_revenue_sensitivity()
+    print("\n[SUCCESS] 稀疏 MDP 测试通过!")
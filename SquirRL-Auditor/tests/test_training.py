@@ -75,7 +75,68 @@ def test_training_script():
         print("="*60)
         return False
 
+def test_compact_replay_buffer():
+    """测试紧凑回放缓冲区：采样结果与 SB3 默认缓冲区相同，占用内存小得多"""
+    print("\n" + "="*60)
+    print("测试紧凑回放缓冲区")
+    print("="*60)
+    
+    import numpy as np
+    from gymnasium import spaces
+    from stable_baselines3.common.buffers import ReplayBuffer
+    from src.agents.replay_buffer import CompactReplayBuffer
+    
+    rng = np.random.default_rng(0)
+    action_space = spaces.Discrete(3)
+    # Box：Ethereum 风格的小整数状态加固定的 alpha；Discrete：状态索引
+    cases = {
+        'box': (spaces.Box(-np.inf, np.inf, shape=(10,), dtype=np.float32),
+                lambda: np.concatenate([rng.integers(0, 3, size=4), np.zeros(5), [0.35]]).astype(np.float32)[None]),
+        'discrete': (spaces.Discrete(733), lambda: rng.integers(0, 733, size=1)),
+    }
+    for name, (observation_space, sample_obs) in cases.items():
+        buffers = [cls(1000, observation_space, action_space, device='cpu')
+                   for cls in (ReplayBuffer, CompactReplayBuffer)]
+        for t in range(1500):
+            obs, next_obs = sample_obs(), sample_obs()
+            action, reward = rng.integers(0, 3, size=1), rng.normal(size=1)
+            done, infos = np.array([t % 97 == 0]), [{'TimeLimit.truncated': t % 194 == 0}]
+            for buffer in buffers:
+                buffer.add(obs, next_obs, action, reward, done, infos)
+        
+        samples = []
+        for buffer in buffers:
+            np.random.seed(1)
+            samples.append(buffer.sample(256))
+        for field in samples[0]._fields:
+            expected, actual = getattr(samples[0], field), getattr(samples[1], field)
+            if expected is None:
+                assert actual is None
+                continue
+            assert expected.shape == actual.shape, (field, expected.shape, actual.shape)
+            assert np.array_equal(expected.numpy(), actual.numpy()), field
+        
+        default_nbytes = sum(a.nbytes for a in (buffers[0].observations, buffers[0].next_observations,
+                                                 buffers[0].actions, buffers[0].rewards, buffers[0].dones,
+                                                 buffers[0].timeouts))
+        print(f"[OK] {name}: 采样与默认缓冲区一致，内存 {default_nbytes} -> {buffers[1].nbytes} 字节 "
+              f"(码本 {buffers[1].codebook_size} 行)")
+        assert buffers[1].nbytes * 3 < default_nbytes
+    
+    # alpha 随机波动时观察几乎不重复，码本超过上限时报错
+    observation_space = cases['box'][0]
+    buffer = CompactReplayBuffer(1000, observation_space, action_space, device='cpu')
+    try:
+        for t in range(1000):
+            obs = np.concatenate([np.zeros(9), [rng.uniform(0.3, 0.4)]]).astype(np.float32)[None]
+            buffer.add(obs, obs, np.array([0]), np.array([0.0]), np.array([False]), [{}])
+        assert False, "码本超过上限时应当报错"
+    except RuntimeError:
+        print(f"[OK] 观察不重复时码本在 {buffer.max_codebook_size} 行处报错")
+
+
 if __name__ == "__main__":
+    test_compact_replay_buffer()
     success = test_training_script()
     sys.exit(0 if success else 1)
 